@@ -0,0 +1,191 @@
+"""
+Handler Benchmarks
+
+Measures how the bot's handlers behave as the ledger grows, using the
+in-process FakeDatabase and synthetic Update/Context objects from
+benchmarks/fakes.py, so no Telegram or Supabase access is needed.
+
+For every ledger size it reports, per handler:
+
+- latency percentiles (p50/p90/p99/max) over --iterations runs
+- peak Python memory of one extra run, traced with tracemalloc (work done
+  inside worker processes is not included)
+- database calls per run
+
+Usage:
+    python -m benchmarks.bench_handlers --sizes 1000 100000 1000000 --output results.json
+
+Results are written as JSON so runs can be compared.
+"""
+
+import os
+
+# The benchmark never talks to a real backend, but importing the handlers
+# builds one, so default to a throwaway in-memory SQLite database
+os.environ.setdefault("ALLOWED_USER_ID", "1")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from openpyxl import Workbook
+from config import LEGACY_USER_ID as USER_ID
+from benchmarks.fakes import FakeDatabase, FakeMessage, generate_transactions, make_context, make_update
+import bot.handlers as handlers
+from bot.users import UserState, users
+from bot.cache import responses
+from bot.utils import REQUIRED_COLUMNS, process_excel_import
+from bot.workers import worker_pool
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def write_import_file(path, rows):
+    """Write an import workbook in the /report format"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("transactions")
+    sheet.append(REQUIRED_COLUMNS)
+    for row in generate_transactions(rows, seed=1, start=datetime(2010, 1, 1, tzinfo=timezone.utc)):
+        sheet.append([row[column] for column in REQUIRED_COLUMNS])
+    workbook.save(path)
+
+async def measure(make_call, database, iterations, trace_memory):
+    latencies = []
+    calls_before = sum(database.calls.values())
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await make_call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    db_calls = (sum(database.calls.values()) - calls_before) / iterations
+
+    peak_memory = None
+    if trace_memory:
+        tracemalloc.start()
+        await make_call()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies),
+        },
+        "peak_memory_bytes": peak_memory,
+        "db_calls_per_run": db_calls,
+    }
+
+async def bench_size(size, args, import_path):
+    database = FakeDatabase(generate_transactions(size), starting_balance=1000.0)
+    users.database.database = database
+    users.evict(USER_ID)
+    state = await users.get(USER_ID)
+
+    # Ask for the month of the newest synthetic transaction
+    newest = database.rows[-1]['date']
+    month, year = newest[5:7], newest[:4]
+
+    async def import_file():
+        # Every run imports the file afresh instead of resuming a finished session
+        database.forget_imports()
+        success, message = await process_excel_import(import_path, state.db, FakeMessage())
+        if not success:
+            raise RuntimeError(f"Import benchmark failed: {message}")
+
+    def uncached(make_call):
+        # Measure rendering, not the response cache
+        def call():
+            responses.clear()
+            return make_call()
+        return call
+
+    monthly = lambda: handlers.monthly_expenses(make_update(USER_ID), make_context(month, year))
+    report = lambda: handlers.report(make_update(USER_ID), make_context(args.report_format))
+
+    cases = {
+        "load_user_state": lambda: UserState(USER_ID, state.db, state.write_behind).load(),
+        "add": lambda: handlers.add(make_update(USER_ID), make_context("-12.50", "Food", "Benchmark lunch")),
+        "monthly_expenses": uncached(monthly),
+        "monthly_expenses_cached": monthly,
+        "report": uncached(report),
+        "report_cached": report,
+        "trend": lambda: handlers.trend(make_update(USER_ID), make_context("24")),
+        "search": lambda: handlers.search(make_update(USER_ID), make_context("food", "17")),
+        "range": lambda: handlers.range_totals(make_update(USER_ID), make_context(f"{year}-01-01", newest[:10])),
+        "process_excel_import": import_file,
+    }
+
+    results = {}
+    for name, make_call in cases.items():
+        if args.handlers and name not in args.handlers:
+            continue
+        print(f"  {name}...", flush=True)
+        results[name] = await measure(make_call, database, args.iterations, not args.no_memory)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        import_path = os.path.join(tmp, "import.xlsx")
+        write_import_file(import_path, args.import_rows)
+
+        results = {}
+        try:
+            for size in args.sizes:
+                print(f"Ledger with {size} transactions", flush=True)
+                results[str(size)] = await bench_size(size, args, import_path)
+        finally:
+            worker_pool.close()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "report_format": args.report_format,
+            "import_rows": args.import_rows,
+        },
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bot handlers against synthetic ledgers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="ledger sizes to benchmark")
+    parser.add_argument("--iterations", type=int, default=5, help="timed runs per handler")
+    parser.add_argument("--handlers", nargs="+", help="only run these handlers")
+    parser.add_argument("--report-format", default="xlsx", choices=["xlsx", "csv", "parquet"])
+    parser.add_argument("--import-rows", type=int, default=10_000,
+                        help="rows in the workbook used for the import benchmark")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory run")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
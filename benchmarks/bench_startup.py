@@ -0,0 +1,133 @@
+"""
+Startup Benchmarks
+
+Measures how long a cold process takes to import the bot, which is most of
+its startup time before the first update is accepted. Every run imports the
+modules in a fresh interpreter, so nothing is shared with earlier runs
+except the operating system's file cache.
+
+For every module it reports:
+
+- import time percentiles (p50/min/max) over --runs fresh processes
+- which heavy optional modules (pandas, openpyxl, supabase, ...) the import
+  pulled in; none should be loaded until a command needs them
+- with --importtime, the slowest imports by cumulative time as reported by
+  python -X importtime
+
+Usage:
+    python -m benchmarks.bench_startup --runs 10 --output startup_results.json
+
+Results are written as JSON so runs can be compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+DEFAULT_MODULES = ["main"]
+HEAVY_MODULES = ["pandas", "openpyxl", "supabase", "pyarrow", "starlette", "uvicorn"]
+
+# Runs in the child process, prints the import time and the loaded heavy modules
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+def child_env(backend):
+    env = dict(os.environ)
+    env.setdefault("ALLOWED_USER_IDS", "1")
+    env.setdefault("SQLITE_PATH", ":memory:")
+    # Placeholder credentials: the Supabase client is only created on first use
+    env.setdefault("SUPABASE_URL", "https://example.supabase.co")
+    env.setdefault("SUPABASE_KEY", "benchmark")
+    env["STORAGE_BACKEND"] = backend
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    return env
+
+def probe(module, env):
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, "-c", code], env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+def slowest_imports(module, env, top):
+    """Slowest imports by cumulative microseconds, from python -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            env=env, text=True, capture_output=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative), name.rstrip()))
+    imports.sort(reverse=True)
+    return [{"module": name.strip(), "depth": (len(name) - len(name.lstrip())) // 2, "ms": micros / 1000}
+            for micros, name in imports[:top]]
+
+def bench_module(module, args, env):
+    runs = [probe(module, env) for _ in range(args.runs)]
+    times = sorted(run["seconds"] * 1000 for run in runs)
+    result = {
+        "runs": args.runs,
+        "import_ms": {
+            "p50": times[len(times) // 2],
+            "min": times[0],
+            "max": times[-1],
+        },
+        "heavy_modules_loaded": runs[-1]["loaded"],
+    }
+    if args.importtime:
+        result["slowest_imports"] = slowest_imports(module, env, args.top)
+    return result
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's cold import time")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="modules to import")
+    parser.add_argument("--runs", type=int, default=10, help="fresh processes per module")
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "supabase"],
+                        help="STORAGE_BACKEND for the imported bot")
+    parser.add_argument("--importtime", action="store_true",
+                        help="also list the slowest imports from python -X importtime")
+    parser.add_argument("--top", type=int, default=15, help="imports listed with --importtime")
+    parser.add_argument("--output", default="startup_results.json", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    env = child_env(args.backend)
+    results = {}
+    for module in args.modules:
+        print(f"Importing {module}", flush=True)
+        results[module] = bench_module(module, args, env)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
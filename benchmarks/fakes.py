@@ -0,0 +1,217 @@
+"""
+Benchmark Fakes
+
+In-process stand-ins used by the benchmark harness:
+
+- FakeDatabase: a StorageBackend kept in Python lists with the same
+  ordering, paging and rollup semantics as the real backends, counting
+  every call so benchmarks can report database round-trips per handler
+- FakeMessage / make_update / make_context: minimal synthetic Telegram
+  Update and Context objects that record replies instead of sending them
+- generate_transactions: deterministic synthetic ledgers of any size
+"""
+
+import random
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from bot.utils import VALID_CATEGORIES
+from database.base import StorageBackend, content_hashes
+
+def generate_transactions(count, seed=0, start=datetime(2015, 1, 1, tzinfo=timezone.utc)):
+    """Synthetic transactions spread evenly over the years before now"""
+    rng = random.Random(seed)
+    step = (datetime.now(timezone.utc) - start) / max(count, 1)
+    expense_categories = [category for category in VALID_CATEGORIES if category != "Income"]
+    balance = 0.0
+    transactions = []
+    for i in range(count):
+        if rng.random() < 0.1:
+            amount, category = round(rng.uniform(500, 5000), 2), "Income"
+        else:
+            amount, category = -round(rng.uniform(1, 200), 2), rng.choice(expense_categories)
+        balance += amount
+        date = (start + step * i).isoformat(timespec='microseconds')
+        transactions.append({
+            "date": date,
+            "amount": amount,
+            "category": category,
+            "description": f"{category} purchase {rng.randint(1, 500)}",
+            "running_balance": round(balance, 2),
+            "created_at": date,
+        })
+    return transactions
+
+def _sort_key(transaction):
+    return (transaction['date'], transaction['id'])
+
+class FakeDatabase(StorageBackend):
+    def __init__(self, transactions=(), starting_balance=0.0):
+        self.calls = Counter()
+        self.starting_balance = starting_balance
+        self.rows = []
+        self.snapshots = []
+        self.rollups = {}
+        self._next_id = 1
+        self._latest = None
+        # Content hashes of rows stored through record_transactions; the
+        # synthetic rows passed in are assumed unique and are not hashed
+        self.content_hashes = set()
+        self.import_sessions = {}
+        self.budgets = {}
+        self._insert(transactions)
+        self.balance = self._latest['running_balance'] if self._latest else starting_balance
+
+    def for_user(self, user_id):
+        # A FakeDatabase holds a single user's ledger
+        return self
+
+    def _insert(self, transactions):
+        stored = []
+        for transaction in transactions:
+            row = {"id": self._next_id, **transaction}
+            self._next_id += 1
+            if self.rows and _sort_key(row) < _sort_key(self.rows[-1]):
+                insort(self.rows, row, key=_sort_key)
+            else:
+                self.rows.append(row)
+            self._latest = row
+            if row['amount'] < 0:
+                key = (int(row['date'][:4]), int(row['date'][5:7]), row['category'])
+                rollup = self.rollups.setdefault(key, {"category": row['category'], "total": 0.0, "count": 0})
+                rollup['total'] += row['amount']
+                rollup['count'] += 1
+            stored.append(row)
+        return stored
+
+    def get_starting_balance(self):
+        self.calls['get_starting_balance'] += 1
+        return self.starting_balance
+
+    def update_starting_balance(self, amount):
+        self.calls['update_starting_balance'] += 1
+        self.starting_balance = amount
+        self.balance = amount
+
+    def get_latest_balance(self):
+        self.calls['get_latest_balance'] += 1
+        return self.balance
+
+    def add_balance_snapshot(self, transaction_id, balance):
+        self.calls['add_balance_snapshot'] += 1
+        self.snapshots.append({"transaction_id": transaction_id, "balance": balance, "taken_at": None})
+
+    def get_balance_snapshots(self, page_size=None):
+        self.calls['get_balance_snapshots'] += 1
+        return list(self.snapshots)
+
+    def _record(self, transactions):
+        rows = []
+        for transaction, content_hash in zip(transactions, content_hashes(transactions)):
+            if content_hash in self.content_hashes:
+                continue
+            self.content_hashes.add(content_hash)
+            self.balance = round(self.balance + transaction['amount'], 2)
+            rows.append({**transaction, "running_balance": self.balance, "content_hash": content_hash})
+        return self._insert(rows)
+
+    def record_transactions(self, transactions):
+        self.calls['record_transactions'] += 1
+        return self._record(transactions)
+
+    def bulk_insert_transactions(self, transactions, batch_size=500):
+        for start in range(0, len(transactions), batch_size):
+            self.calls['bulk_insert_transactions'] += 1
+            batch = transactions[start:start + batch_size]
+            stored = self._record(batch)
+            yield start, start + len(batch), len(stored), None
+
+    def get_budgets(self):
+        self.calls['get_budgets'] += 1
+        return dict(self.budgets)
+
+    def set_budget(self, category, amount):
+        self.calls['set_budget'] += 1
+        if amount is None:
+            self.budgets.pop(category, None)
+        else:
+            self.budgets[category] = amount
+
+    def get_import_session(self, file_hash):
+        self.calls['get_import_session'] += 1
+        return self.import_sessions.get(file_hash)
+
+    def save_import_session(self, file_hash, total_rows, committed_rows):
+        self.calls['save_import_session'] += 1
+        self.import_sessions[file_hash] = {
+            "file_hash": file_hash, "total_rows": total_rows, "committed_rows": committed_rows
+        }
+
+    def forget_imports(self):
+        """Drop content hashes and import sessions, so a file can be imported again"""
+        self.content_hashes.clear()
+        self.import_sessions.clear()
+
+    def get_transactions_page(self, cursor=None, page_size=1000, descending=True,
+                              start_date=None, end_date=None, expenses_only=False):
+        self.calls['get_transactions_page'] += 1
+        lo = 0 if start_date is None else bisect_left(self.rows, start_date, key=lambda row: row['date'])
+        hi = len(self.rows) if end_date is None else bisect_left(self.rows, end_date, key=lambda row: row['date'])
+        if cursor is not None:
+            position = bisect_left(self.rows, tuple(cursor), key=_sort_key)
+            if descending:
+                hi = min(hi, position)
+            else:
+                lo = max(lo, position + 1)
+        page = []
+        indexes = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        for index in indexes:
+            row = self.rows[index]
+            if expenses_only and row['amount'] >= 0:
+                continue
+            page.append(row)
+            if len(page) == page_size:
+                break
+        return page
+
+    def iter_transactions_after(self, last_id=None, page_size=1000):
+        rows = sorted((row for row in self.rows if last_id is None or row['id'] > last_id),
+                      key=lambda row: row['id'])
+        for start in range(0, len(rows), page_size):
+            self.calls['iter_transactions_after'] += 1
+            yield rows[start:start + page_size]
+
+    def get_monthly_rollup(self, year, month):
+        self.calls['get_monthly_rollup'] += 1
+        return [
+            dict(rollup) for (rollup_year, rollup_month, _), rollup in self.rollups.items()
+            if rollup_year == year and rollup_month == month
+        ]
+
+class FakeMessage:
+    def __init__(self, document=None):
+        self.document = document
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+    async def reply_document(self, document, **kwargs):
+        self.replies.append(document.read())
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+def make_update(user_id, document=None):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=user_id),
+        message=FakeMessage(document)
+    )
+
+def make_context(*args, bot=None):
+    return SimpleNamespace(args=list(args), bot=bot)
@@ -0,0 +1,48 @@
+"""
+Balance Reconciliation
+
+The bot normally trusts the current balance stored by the database, which
+every insert advances atomically, instead of summing all history at
+startup. This module does the full reconciliation on demand, used by
+`python main.py --verify`:
+
+- Replays every transaction in insertion order on top of the starting
+  balance, using Decimal so no float error accumulates
+- Compares the replayed balance with every balance snapshot and with the
+  stored current balance
+"""
+
+from decimal import Decimal
+
+CENT = Decimal("0.01")
+
+def _to_cents(value):
+    return Decimal(str(value)).quantize(CENT)
+
+async def reconcile_balance(database):
+    """Replay all history and compare it with the stored checkpoints.
+
+    Returns (expected, checkpoint, mismatches) where mismatches lists
+    (transaction_id, stored, expected) for every snapshot that drifted.
+    """
+    starting_balance = await database.get_starting_balance()
+    if starting_balance is None:
+        return None, None, []
+
+    snapshots = {
+        snapshot['transaction_id']: snapshot
+        for snapshot in await database.get_balance_snapshots()
+    }
+    mismatches = []
+    expected = Decimal(str(starting_balance))
+    async for page in database.iter_transactions_after(None):
+        for transaction in page:
+            expected += Decimal(str(transaction['amount']))
+            snapshot = snapshots.get(transaction['id'])
+            if snapshot and _to_cents(snapshot['balance']) != expected.quantize(CENT):
+                mismatches.append((transaction['id'], _to_cents(snapshot['balance']), expected.quantize(CENT)))
+
+    checkpoint = await database.get_latest_balance()
+    if checkpoint is None:
+        checkpoint = starting_balance
+    return expected.quantize(CENT), _to_cents(checkpoint), mismatches
@@ -0,0 +1,136 @@
+"""
+Monthly Budgets
+
+A user can set a monthly spending limit per category with /setbudget. This
+module keeps what is needed to check those limits in memory, so neither
+/add nor /budget ever reads transaction history:
+
+- limits: {category: limit in cents}, read from the budget settings once
+  when the user's state loads
+- spent: {(year, month, category): expenses in cents}, seeded from the
+  ledger in one vectorized pass when the state loads, then advanced by
+  record() for every /add and imported row in O(1)
+
+record() returns the warning thresholds (BUDGET_WARNING_PERCENT and 100%
+of the limit) a transaction crossed, so a warning is sent once, by the
+transaction that crosses it. Months are UTC calendar months, like /monthly.
+"""
+
+import logging
+import math
+from datetime import datetime, timezone
+import numpy as np
+from config import BUDGET_WARNING_PERCENT
+from bot.ledger import to_cents
+from bot.reports import escape_markdown_v2, format_cents
+
+logger = logging.getLogger(__name__)
+
+WARNING_THRESHOLDS = (BUDGET_WARNING_PERCENT, 100)
+BAR_WIDTH = 10
+
+def _month_of(date):
+    """(year, month) of an ISO date string, in UTC"""
+    value = datetime.fromisoformat(date)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.year, value.month
+
+class Budgets:
+    def __init__(self):
+        self.limits = {}
+        self._spent = {}
+
+    def seed(self, ledger, limits):
+        """Load limits ({category: amount}) and the monthly totals of a LedgerCache"""
+        self.limits = {}
+        for category, amount in limits.items():
+            # A bad stored setting must not stop the user's state from loading
+            if not math.isfinite(amount) or amount <= 0:
+                logger.warning("Ignoring invalid %s budget %r", category, amount)
+                continue
+            self.limits[category] = int(to_cents(amount))
+        amounts = ledger.column('amount')
+        expenses = amounts < 0
+        # Months since 1970-01 of every expense
+        months = ledger.column('date')[expenses].astype('datetime64[us]').astype('datetime64[M]').astype(np.int64)
+        width = len(ledger.categories)
+        keys, inverse = np.unique(months * width + ledger.column('category')[expenses], return_inverse=True)
+        totals = np.rint(np.bincount(inverse, weights=-amounts[expenses])).astype(np.int64)
+        self._spent = {
+            (1970 + int(key // width) // 12, int(key // width) % 12 + 1, ledger.categories[int(key % width)]): int(total)
+            for key, total in zip(keys, totals)
+        }
+
+    def set_limit(self, category, amount):
+        """Set the limit of a category, None removes it"""
+        if amount is None:
+            self.limits.pop(category, None)
+        else:
+            self.limits[category] = int(to_cents(amount))
+
+    def spent(self, year, month, category):
+        """Expenses in cents of a category in a month"""
+        return self._spent.get((year, month, category), 0)
+
+    def record(self, transaction):
+        """Count a stored transaction, returns [(year, month, category,
+        threshold)] for each warning threshold it crossed"""
+        amount = int(to_cents(transaction['amount']))
+        if amount >= 0:
+            return []
+        year, month = _month_of(transaction['date'])
+        key = (year, month, transaction['category'])
+        before = self._spent.get(key, 0)
+        after = before - amount
+        self._spent[key] = after
+        limit = self.limits.get(transaction['category'])
+        if not limit:
+            return []
+        return [
+            (year, month, transaction['category'], threshold)
+            for threshold in WARNING_THRESHOLDS
+            if before * 100 < threshold * limit <= after * 100
+        ]
+
+    def status(self, year, month):
+        """[(category, spent, limit)] in cents for every budgeted category"""
+        return [
+            (category, self.spent(year, month, category), limit)
+            for category, limit in sorted(self.limits.items())
+        ]
+
+def render_budget_warnings(budgets, crossings):
+    """MarkdownV2 warning for each crossed threshold, the highest one per category and month"""
+    highest = {}
+    for year, month, category, threshold in crossings:
+        key = (year, month, category)
+        highest[key] = max(threshold, highest.get(key, 0))
+    lines = []
+    for (year, month, category), threshold in sorted(highest.items()):
+        spent, limit = budgets.spent(year, month, category), budgets.limits[category]
+        month_name = datetime(year, month, 1).strftime("%B %Y")
+        if threshold >= 100:
+            lines.append(f"🚨 {escape_markdown_v2(category)} is over budget for {month_name}: "
+                         f"${format_cents(spent)} of ${format_cents(limit)}")
+        else:
+            lines.append(f"⚠️ {escape_markdown_v2(category)} has used {threshold}% of its {month_name} budget: "
+                         f"${format_cents(spent)} of ${format_cents(limit)}")
+    return "\n".join(lines)
+
+def render_budget_status(budgets, year, month):
+    """MarkdownV2 /budget view of one month"""
+    month_name = datetime(year, month, 1).strftime("%B %Y")
+    lines = [f"💼 Budgets: {month_name}\n"]
+    for category, spent, limit in budgets.status(year, month):
+        used = spent / limit if limit else 0
+        filled = min(BAR_WIDTH, round(used * BAR_WIDTH))
+        bar = "█" * filled + "░" * (BAR_WIDTH - filled)
+        icon = "🚨" if used >= 1 else "⚠️" if used * 100 >= BUDGET_WARNING_PERCENT else "✅"
+        left = f"${format_cents(limit - spent)} left" if spent <= limit else f"${format_cents(spent - limit)} over"
+        percentage = f"{used * 100:.0f}"
+        lines.append(
+            f"{icon} {escape_markdown_v2(category)}: {bar} ${format_cents(spent)} of ${format_cents(limit)} "
+            f"\\({percentage}%\\), {left}"
+        )
+    return "\n".join(lines)
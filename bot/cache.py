@@ -0,0 +1,92 @@
+"""
+Response Cache
+
+Rendered /monthly messages and generated /report files are cached, so a
+repeated request is answered without reading the ledger or using the
+worker pool.
+
+- Entries are keyed on (user_id, command, arguments, version), the
+  version being UserState.version_between() of the dates the response
+  covers. Every change to a user's transactions gives the months they are
+  dated in a new version (bot/users.py), so an entry is never served for
+  changed data; entries of older versions are no longer requested and age
+  out
+- The cache holds at most RESPONSE_CACHE_ENTRIES entries and
+  RESPONSE_CACHE_BYTES bytes of output, evicting the least recently used
+  entries first; a single response larger than the byte limit is not cached
+- Responses the scheduled jobs prepare (bot/jobs.py) are pinned outside
+  those limits, so on-demand requests cannot evict them before they are
+  asked for; a job's next run replaces what it pinned
+"""
+
+from collections import OrderedDict
+from config import RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_BYTES
+
+def _size(value):
+    """Approximate size in bytes of a cached response"""
+    if isinstance(value, (list, tuple)):
+        return sum(_size(item) for item in value)
+    return len(value)
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (response, size), least recently used first
+        self._entries = OrderedDict()
+        # group -> {key: response} pinned by pin()
+        self._pinned = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached response for key, or None"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        for pinned in self._pinned.values():
+            if key in pinned:
+                self.hits += 1
+                return pinned[key]
+        self.misses += 1
+        return None
+
+    def pin(self, group, responses):
+        """Keep responses ({key: response}) until the group is pinned again"""
+        self._pinned[group] = dict(responses)
+
+    def put(self, key, response):
+        size = _size(response)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self._entries[key] = (response, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def clear(self):
+        self._entries.clear()
+        self._pinned.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "pinned": sum(len(pinned) for pinned in self._pinned.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+# Create a singleton instance
+responses = ResponseCache()
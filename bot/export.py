@@ -0,0 +1,136 @@
+"""
+Streaming Report Export
+
+This module writes transaction pages straight into an in-memory report
+file, so /report never builds a DataFrame of the whole ledger and never
+touches the disk. Supported formats:
+
+- xlsx: openpyxl write-only workbook (rows are streamed, not kept as cells)
+- csv: UTF-8 CSV
+- parquet: written row group by row group (requires pyarrow)
+
+Each writer accepts pages of transaction rows via write() and returns the
+finished file as a BytesIO from close().
+"""
+
+import csv
+import io
+from datetime import datetime, timedelta
+
+EXPORT_COLUMNS = ['id', 'date', 'amount', 'category', 'description', 'running_balance', 'created_at']
+EXPORT_FORMATS = ('xlsx', 'csv', 'parquet')
+
+class XlsxReportWriter:
+    def __init__(self):
+        # openpyxl is only needed once a report is exported
+        from openpyxl import Workbook
+
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("transactions")
+        self.sheet.append(EXPORT_COLUMNS)
+
+    def write(self, rows):
+        for row in rows:
+            self.sheet.append([row.get(column) for column in EXPORT_COLUMNS])
+
+    def close(self):
+        buffer = io.BytesIO()
+        self.workbook.save(buffer)
+        buffer.seek(0)
+        return buffer
+
+class CsvReportWriter:
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.text = io.TextIOWrapper(self.buffer, encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.text, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+        self.buffer.seek(0)
+        return self.buffer
+
+class ParquetReportWriter:
+    def __init__(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet export requires the pyarrow package")
+        self.pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()),
+            ('date', pa.string()),
+            ('amount', pa.float64()),
+            ('category', pa.string()),
+            ('description', pa.string()),
+            ('running_balance', pa.float64()),
+            ('created_at', pa.string()),
+        ])
+        self.buffer = io.BytesIO()
+        self.writer = pq.ParquetWriter(self.buffer, self.schema)
+
+    def write(self, rows):
+        table = self.pa.Table.from_pylist(
+            [{column: row.get(column) for column in EXPORT_COLUMNS} for row in rows],
+            schema=self.schema
+        )
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+        self.buffer.seek(0)
+        return self.buffer
+
+_WRITERS = {
+    'xlsx': XlsxReportWriter,
+    'csv': CsvReportWriter,
+    'parquet': ParquetReportWriter,
+}
+
+def create_report_writer(fmt):
+    """Create a writer for one of EXPORT_FORMATS, raises ValueError otherwise"""
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unsupported report format: {fmt}")
+    return _WRITERS[fmt]()
+
+def export_report(fmt, pages):
+    """Write pages of rows into a report file, runs in a worker process.
+
+    Returns the finished file content as bytes.
+    """
+    writer = create_report_writer(fmt)
+    for page in pages:
+        writer.write(page)
+    return writer.close().getvalue()
+
+def parse_report_args(args):
+    """Parse `/report [format] [from] [to]` arguments.
+
+    Returns (format, start_date, end_date) where the dates are ISO date
+    strings usable as a half-open [start, end) range, `to` being inclusive.
+    Raises ValueError on malformed input.
+    """
+    args = list(args or [])
+    fmt = 'xlsx'
+    if args and args[0].lower() in EXPORT_FORMATS:
+        fmt = args.pop(0).lower()
+    if len(args) > 2:
+        raise ValueError("Too many arguments")
+
+    dates = []
+    for arg in args:
+        try:
+            dates.append(datetime.strptime(arg, "%Y-%m-%d"))
+        except ValueError:
+            raise ValueError(f"Invalid format or date: {arg}")
+    start_date = dates[0].strftime("%Y-%m-%d") if dates else None
+    end_date = (dates[1] + timedelta(days=1)).strftime("%Y-%m-%d") if len(dates) > 1 else None
+    if start_date and end_date and start_date >= end_date:
+        raise ValueError("Start date is after end date")
+    return fmt, start_date, end_date
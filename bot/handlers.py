@@ -8,86 +8,103 @@ Each function corresponds to a specific command that users can invoke:
 - /setbalance: Set initial account balance
 - /add: Add new transactions (income/expenses)
 - /balance: Check current balance
-- /report: Generate Excel report of transactions
+- /report: Export transactions as an Excel, CSV or Parquet report
 - /monthly: View monthly expense breakdown
+- /trend: Spending and income over the last months
+- /range: Totals between two dates
+- /search: Find transactions by description
+- /setbudget: Set a monthly spending limit for a category
+- /budget: View this month's spending against the budgets
 - /help: Display available commands
 
-The module also handles database interactions through the Database class
-and maintains global state for balance and transactions.
+The module also handles database interactions through the AsyncDatabase
+wrapper, so queries never block the event loop. Every user on the
+ALLOWED_USER_IDS allow-list has their own ledger: handlers work on the
+caller's UserState (bot/users.py), which holds the balance and the
+LedgerCache that all read commands are served from.
 """
 
 from telegram import Update
 from telegram.ext import ContextTypes
-import pandas as pd
-from datetime import datetime
-from config import ALLOWED_USER_ID, REPORT_FILE_NAME
-from database.supabase import db
+from datetime import datetime, timezone
+from config import ALLOWED_USER_IDS, REPORT_FILE_NAME, MONTHLY_DETAIL_LIMIT, MONTHLY_TOP_N, SEARCH_PAGE_SIZE
+from database.journal import write_behind
 from bot.messages import *
-from typing import Optional
 from telegram.constants import ParseMode
+import io
+import logging
+import math
 import os
-from bot.utils import process_excel_import
-
-# Global variables declaration first
-starting_balance: Optional[float] = None
-current_balance: Optional[float] = None
-transactions = []
-
-def initialize_from_db():
-    """Initialize global variables from database"""
-    global starting_balance, current_balance, transactions
-    
-    # Clear existing transactions
-    transactions = []
-    
-    # Get starting balance from database
-    starting_balance = db.get_starting_balance()
-    if starting_balance is not None:
-        current_balance = starting_balance  # Initialize current_balance
-        
-        # Get existing transactions
-        response = db.get_transactions()
-        if response.data:
-            transactions.extend(response.data)
-            # Calculate current balance including all transactions
-            for transaction in transactions:
-                current_balance += float(transaction['amount'])
-    else:
-        current_balance = None
+from bot.utils import IMPORT_EXTENSIONS, process_excel_import
+from bot.ledger import month_bounds
+from bot.users import users
+from bot.cache import responses
+from bot.export import export_report, parse_report_args
+from bot.reports import parse_monthly_args, render_monthly_report
+from bot.trends import parse_trend_args, trend_months, render_trend, parse_range_args, render_range
+from bot.search import parse_search_args, render_search_results
+from bot.budgets import render_budget_status, render_budget_warnings
+from bot.utils import VALID_CATEGORIES
+from bot.workers import worker_pool, WorkerError
+
+logger = logging.getLogger(__name__)
+
+def is_allowed(update: Update) -> bool:
+    return update.effective_user.id in ALLOWED_USER_IDS
+
+async def record_flushed_transactions(rows):
+    """Add write-behind transactions to the ledgers of resident users"""
+    rows_by_user = {}
+    for transaction in rows:
+        rows_by_user.setdefault(transaction['user_id'], []).append(transaction)
+    for user_id, user_rows in rows_by_user.items():
+        # An evicted user reloads the stored rows on their next command
+        state = users.peek(user_id)
+        if state is not None:
+            await state.record_flushed(user_rows)
+
+async def discard_dead_lettered_transactions(user_id, transactions):
+    """Reload a user whose journaled transactions could not be stored.
+
+    Their balance and budgets already counted the transactions, reloading
+    takes both from what the database holds.
+    """
+    users.evict(user_id)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ALLOWED_USER_ID:
+    if not is_allowed(update):
         await update.message.reply_text(UNAUTHORIZED_MESSAGE)
         return
         
-    global starting_balance, current_balance
-    if starting_balance is None:
+    state = await users.get(update.effective_user.id)
+    if state.starting_balance is None:
         await update.message.reply_text(WELCOME_NO_BALANCE_MESSAGE)
     else:
         # Format the balance with escaped decimal point
-        balance_str = f"{current_balance:.2f}".replace(".", "\\.")
+        balance_str = f"{state.current_balance:.2f}".replace(".", "\\.")
         await update.message.reply_text(
             WELCOME_MESSAGE.format(balance_str), 
             parse_mode=ParseMode.MARKDOWN_V2
         )
 
 async def set_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ALLOWED_USER_ID:
+    if not is_allowed(update):
         await update.message.reply_text("🚫 Sorry, this is a private bot.")
         return
         
-    global starting_balance, current_balance
+    state = await users.get(update.effective_user.id)
     try:
-        if starting_balance is not None:
+        if state.starting_balance is not None:
             await update.message.reply_text("❌ Initial balance has already been set!")
             return
             
         amount = float(context.args[0])
-        starting_balance = amount
-        current_balance = amount
+        state.starting_balance = amount
+        state.current_balance = amount
         
         # Use the proper Database method
-        db.update_starting_balance(amount)
+        await state.db.update_starting_balance(amount)
+        state.bump_version()
         
         await update.message.reply_text(f"""
 ✅ Initial balance set to: ${amount:.2f}
@@ -104,12 +121,12 @@ Example: /setbalance 7264.96
 """)
 
 async def add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ALLOWED_USER_ID:
+    if not is_allowed(update):
         await update.message.reply_text("🚫 Sorry, this is a private bot.")
         return
         
-    global current_balance
-    if starting_balance is None:
+    state = await users.get(update.effective_user.id)
+    if state.starting_balance is None:
         await update.message.reply_text("❌ Please set your initial balance first using /setbalance <amount>")
         return
     try:
@@ -148,12 +165,35 @@ Examples:
 """)
             return
 
-        current_balance += amount
-        db.add_transaction(amount, category, description, current_balance)
+        if write_behind.enabled:
+            # Reply once the transaction is journaled, it is stored in the
+            # background and the database assigns its final running_balance
+            state.current_balance += amount
+            now = datetime.now(timezone.utc).isoformat()
+            transaction = {
+                "user_id": state.user_id,
+                "date": now,
+                "amount": amount,
+                "category": category,
+                "description": description,
+                "running_balance": state.current_balance,
+                "created_at": now
+            }
+            await write_behind.submit(transaction)
+        else:
+            # The database inserts the row and advances the balance in one
+            # transaction, its running_balance is the authoritative balance
+            transaction = await state.db.record_transaction(amount, category, description)
+            state.current_balance = float(transaction['running_balance'])
+            state.ledger.append(transaction)
+            await state.snapshot_balance(transaction['id'])
+        state.bump_version([transaction])
+        # Month totals are kept in memory, crossing a limit warns right away
+        crossings = state.budgets.record(transaction)
         
         emoji = "➕" if amount > 0 else "➖"
         amount_str = f"{abs(amount):.2f}".replace(".", "\\.")
-        balance_str = f"{current_balance:.2f}".replace(".", "\\.")
+        balance_str = f"{state.current_balance:.2f}".replace(".", "\\.")
         
         await update.message.reply_text(f"""
 ✅ Transaction added\!
@@ -162,8 +202,12 @@ Examples:
 📝 Description: {description}
 💰 New Balance: ||${balance_str}||
 """, parse_mode=ParseMode.MARKDOWN_V2)
+        if crossings:
+            await update.message.reply_text(
+                render_budget_warnings(state.budgets, crossings), parse_mode=ParseMode.MARKDOWN_V2
+            )
     except Exception as e:
-        print(f"Debug - Error: {str(e)}")  # Debug print
+        logger.warning("Could not add transaction: %s", e)
         await update.message.reply_text("""
 ❌ Usage: /add <amount> <category> <description>
 
@@ -174,115 +218,303 @@ Examples:
 """)
 
 async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ALLOWED_USER_ID:
+    if not is_allowed(update):
         await update.message.reply_text("🚫 Sorry, this is a private bot.")
         return
     
-    if current_balance is None:
+    state = await users.get(update.effective_user.id)
+    if state.current_balance is None:
         await update.message.reply_text("❌ Please set your initial balance first using /setbalance <amount>")
         return
     
     # Escape the decimal point for MarkdownV2
-    balance_str = f"{current_balance:.2f}".replace(".", "\\.")
+    balance_str = f"{state.current_balance:.2f}".replace(".", "\\.")
     await update.message.reply_text(f"💰 Current balance: ||${balance_str}||", parse_mode=ParseMode.MARKDOWN_V2)
 
 async def report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ALLOWED_USER_ID:
+    if not is_allowed(update):
         await update.message.reply_text("🚫 Sorry, this is a private bot.")
         return
 
-    # Get transactions from database instead of using global list
-    response = db.get_transactions()
-    if not response.data:
-        await update.message.reply_text("❌ No transactions to report.")
+    try:
+        fmt, start_date, end_date = parse_report_args(context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"""
+❌ {e}
+
+Usage: /report [format] [from] [to]
+Formats: xlsx (default), csv, parquet
+Dates: YYYY-MM-DD
+
+Examples:
+• /report
+• /report csv
+• /report xlsx 2024-01-01 2024-03-31
+""")
         return
 
-    # Convert to DataFrame and save to Excel
-    df = pd.DataFrame(response.data)
-    df.to_excel(REPORT_FILE_NAME, index=False)
-    
-    with open(REPORT_FILE_NAME, 'rb') as file:
-        await update.message.reply_document(
-            file,
-            caption="✨ Here's your transaction report!"
-        )
+    state = await users.get(update.effective_user.id)
+    try:
+        report_bytes = await build_report(state, fmt, start_date, end_date)
+    except (ValueError, WorkerError) as e:
+        await update.message.reply_text(f"❌ Could not build the report: {e}")
+        return
+    if report_bytes is None:
+        await update.message.reply_text("❌ No transactions to report.")
+        return
+    report_file = io.BytesIO(report_bytes)
+
+    file_name = f"{os.path.splitext(REPORT_FILE_NAME)[0]}.{fmt}"
+    await update.message.reply_document(
+        report_file,
+        filename=file_name,
+        caption="✨ Here's your transaction report!"
+    )
+
+def report_cache_key(state, fmt, start_date=None, end_date=None):
+    """Response cache key of a report, changes only with the rows it covers"""
+    return (state.user_id, "report", (fmt, start_date, end_date), state.version_between(start_date, end_date))
+
+async def build_report(state, fmt, start_date=None, end_date=None):
+    """Report file content, None if there is nothing to report.
+
+    Served from the response cache while the ledger is unchanged, raises
+    ValueError or WorkerError if the file cannot be built.
+    """
+    cache_key = report_cache_key(state, fmt, start_date, end_date)
+    report_bytes = responses.get(cache_key)
+    if report_bytes is None:
+        if state.ledger.loaded:
+            # The worker gets the rows as compact columns and turns them
+            # into row dicts one page at a time while writing the file
+            pages = state.ledger.slice(start_date, end_date)
+        else:
+            pages = [page async for page in state.db.iter_transaction_pages(descending=False, start_date=start_date,
+                                                                            end_date=end_date)]
+        if not len(pages):
+            return None
+        report_bytes = await worker_pool.run(export_report, fmt, pages)
+        responses.put(cache_key, report_bytes)
+    return report_bytes
 
 async def monthly_expenses(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ALLOWED_USER_ID:
+    if not is_allowed(update):
         await update.message.reply_text("🚫 Sorry, this is a private bot.")
         return
 
-    response = db.get_transactions()
-    if not response.data:
+    state = await users.get(update.effective_user.id)
+    if state.ledger.loaded and not state.ledger:
         await update.message.reply_text("❌ No transactions to analyze.")
         return
-
-    # Convert to DataFrame from Supabase response
-    df = pd.DataFrame(response.data)
     
-    target_month = datetime.now().month
-    target_year = datetime.now().year
-    
-    if context.args:
-        try:
-            target_month = int(context.args[0])
-            if len(context.args) > 1:
-                target_year = int(context.args[1])
-        except ValueError:
-            await update.message.reply_text("❌ Invalid month/year format. Use: /monthly [month] [year]")
-            return
-
-    df['date'] = pd.to_datetime(df['date'])
-    monthly_df = df[
-        (df['date'].dt.month == target_month) & 
-        (df['date'].dt.year == target_year) & 
-        (df['amount'] < 0)
-    ]
+    try:
+        target_month, target_year, top_n, show_all = parse_monthly_args(context.args)
+    except ValueError:
+        await update.message.reply_text("❌ Invalid month/year format. Use: /monthly [month] [year] [all|top N]")
+        return
 
-    if monthly_df.empty:
+    try:
+        messages = await build_monthly(state, target_month, target_year, top_n, show_all)
+    except WorkerError as e:
+        await update.message.reply_text(f"❌ Could not build the report: {e}")
+        return
+    if messages is None:
         month_name = datetime.strptime(str(target_month), "%m").strftime("%B")
         await update.message.reply_text(f"❌ No expenses found for {month_name} {target_year}")
         return
 
-    # Calculate category totals
-    category_totals = monthly_df.groupby('category')['amount'].sum().abs()
-    total_expenses = category_totals.sum()
-    
-    # Create the report message
-    month_name = datetime.strptime(str(target_month), "%m").strftime("%B")
-    report = f"""
-📈 Expense Report: {month_name} {target_year}
+    # Long reports are split on category boundaries to fit Telegram's limit
+    for message in messages:
+        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN_V2)
+
+def monthly_cache_key(state, target_month, target_year, top_n=None, show_all=False):
+    """Response cache key of a /monthly summary, changes only with that month's rows"""
+    return (state.user_id, "monthly", (target_month, target_year, top_n, show_all),
+            state.version_between(*month_bounds(target_year, target_month)))
+
+async def build_monthly(state, target_month, target_year, top_n=None, show_all=False):
+    """The /monthly messages, None if the month has no expenses.
+
+    Unchanged ledgers are answered with the messages rendered last time;
+    raises WorkerError if rendering times out or its worker dies.
+    """
+    cache_key = monthly_cache_key(state, target_month, target_year, top_n, show_all)
+    messages = responses.get(cache_key)
+    if messages is not None:
+        return messages
+
+    # Category totals come from the maintained monthly rollup
+    rollup = await state.db.get_monthly_rollup(target_year, target_month)
+    if not rollup:
+        return None
+
+    # Large months only list the biggest expenses unless asked for all
+    expense_count = sum(int(row['count']) for row in rollup)
+    if top_n is None and not show_all and expense_count > MONTHLY_DETAIL_LIMIT:
+        top_n = MONTHLY_TOP_N
+
+    # Line items are only read for the requested month
+    start_date, end_date = month_bounds(target_year, target_month)
+    if state.ledger.loaded:
+        rows = state.ledger.between(start_date, end_date, expenses_only=True)
+    else:
+        rows = await state.db.get_monthly_expenses(start_date, end_date)
 
-💹 Category Breakdown:"""
+    # Aggregation and formatting run in the worker pool
+    messages = await worker_pool.run(render_monthly_report, rows, rollup, target_month, target_year, top_n)
+    responses.put(cache_key, messages)
+    return messages
 
-    # Add details for each category
-    for category in category_totals.index:
-        category_amount = category_totals[category]
-        percentage = (category_amount / total_expenses) * 100
-        
-        # Get transactions for this category
-        category_transactions = monthly_df[monthly_df['category'] == category]
-        
-        # Format amounts with escaped decimal points
-        cat_amount_str = f"{category_amount:.2f}".replace(".", "\\.")
-        percentage_str = f"{percentage:.1f}".replace(".", "\\.")
-        
-        report += f"\n\n🏷️ {category}: ${cat_amount_str} \\({percentage_str}%\\)"
-        
-        # Add transaction details
-        for _, tx in category_transactions.iterrows():
-            amount_str = f"{abs(tx['amount']):.2f}".replace(".", "\\.")
-            date_str = pd.to_datetime(tx['date']).strftime('%d/%m')
-            report += f"\n   • {date_str}: ${amount_str} \\- {tx['description']}"
-
-    # Add total at the bottom
-    total_str = f"{total_expenses:.2f}".replace(".", "\\.")
-    report += f"\n\n💰 Total Expenses: ||${total_str}||"
-    
-    await update.message.reply_text(report, parse_mode=ParseMode.MARKDOWN_V2)
+async def trend(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_allowed(update):
+        await update.message.reply_text("🚫 Sorry, this is a private bot.")
+        return
+
+    try:
+        months = parse_trend_args(context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}\n\nUsage: /trend [months]\nExample: /trend 12")
+        return
+
+    state = await users.get(update.effective_user.id)
+    if not state.ledger:
+        await update.message.reply_text("❌ No transactions to analyze.")
+        return
+
+    # Month totals are lookups in the daily index, whatever the ledger size
+    now = datetime.now(timezone.utc)
+    target_months, boundaries = trend_months(now.year, now.month, months)
+    periods = state.ledger.period_totals(boundaries)
+    for message in render_trend(target_months, periods):
+        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN_V2)
+
+async def range_totals(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_allowed(update):
+        await update.message.reply_text("🚫 Sorry, this is a private bot.")
+        return
+
+    try:
+        start_date, end_date, category = parse_range_args(context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"""
+❌ {e}
+
+Usage: /range <from> <to> [category]
+Dates: YYYY-MM-DD (inclusive)
+
+Examples:
+• /range 2024-01-01 2024-03-31
+• /range 2024-01-01 2024-12-31 Food
+""")
+        return
+
+    state = await users.get(update.effective_user.id)
+    if not state.ledger:
+        await update.message.reply_text("❌ No transactions to analyze.")
+        return
+
+    totals = state.ledger.range_totals(start_date, end_date)
+    for message in render_range(totals, start_date, end_date, category):
+        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN_V2)
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_allowed(update):
+        await update.message.reply_text("🚫 Sorry, this is a private bot.")
+        return
+
+    try:
+        query, terms, category, start_date, end_date, page = parse_search_args(context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"""
+❌ {e}
+
+Usage: /search <terms> [category] [from] [to] [page N]
+Dates: YYYY-MM-DD (inclusive)
+
+Examples:
+• /search coffee
+• /search grab taxi Transport 2024-01-01 2024-06-30
+• /search lunch page 2
+""")
+        return
+
+    state = await users.get(update.effective_user.id)
+    # Only the rows of matching descriptions are read, ranked best first
+    dates, ids = state.ledger.search(terms, category, start_date, end_date)
+    if not len(ids):
+        await update.message.reply_text(f"🔎 No transactions match \"{query}\".")
+        return
+
+    pages = -(-len(ids) // SEARCH_PAGE_SIZE)
+    if page > pages:
+        await update.message.reply_text(f"❌ There {'is' if pages == 1 else 'are'} only {pages} page{'' if pages == 1 else 's'} of results.")
+        return
+    first = (page - 1) * SEARCH_PAGE_SIZE
+    rows = state.ledger.rows_at(dates[first:first + SEARCH_PAGE_SIZE], ids[first:first + SEARCH_PAGE_SIZE])
+    for message in render_search_results(rows, query, page, pages, len(ids)):
+        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN_V2)
+
+async def set_budget(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_allowed(update):
+        await update.message.reply_text("🚫 Sorry, this is a private bot.")
+        return
+
+    try:
+        category, amount = context.args
+        category = category.strip().title()
+        amount = float(amount)
+        if category not in VALID_CATEGORIES or category == "Income" or not math.isfinite(amount) or amount < 0:
+            raise ValueError(category)
+    except ValueError:
+        categories_str = "\n• ".join(category for category in VALID_CATEGORIES if category != "Income")
+        await update.message.reply_text(f"""
+❌ Usage: /setbudget <category> <amount>
+Use an amount of 0 to remove a budget.
+
+Categories:
+• {categories_str}
+
+Example: /setbudget Food 400
+""")
+        return
+
+    state = await users.get(update.effective_user.id)
+    limit = amount or None
+    await state.db.set_budget(category, limit)
+    state.budgets.set_limit(category, limit)
+    if limit is None:
+        await update.message.reply_text(f"✅ Removed the {category} budget.")
+        return
+
+    now = datetime.now(timezone.utc)
+    spent = state.budgets.spent(now.year, now.month, category) / 100
+    await update.message.reply_text(
+        f"✅ {category} budget set to ${amount:.2f} a month.\n"
+        f"💸 Spent this month: ${spent:.2f} ({spent / amount * 100:.0f}%)"
+    )
+
+async def budget(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_allowed(update):
+        await update.message.reply_text("🚫 Sorry, this is a private bot.")
+        return
+
+    try:
+        target_month, target_year, _, _ = parse_monthly_args(context.args)
+    except ValueError:
+        await update.message.reply_text("❌ Invalid month/year format. Use: /budget [month] [year]")
+        return
+
+    state = await users.get(update.effective_user.id)
+    if not state.budgets.limits:
+        await update.message.reply_text("❌ No budgets set yet. Use /setbudget <category> <amount>, e.g. /setbudget Food 400")
+        return
+
+    await update.message.reply_text(
+        render_budget_status(state.budgets, target_year, target_month), parse_mode=ParseMode.MARKDOWN_V2
+    )
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ALLOWED_USER_ID:
+    if not is_allowed(update):
         await update.message.reply_text("🚫 Sorry, this is a private bot.")
         return
         
@@ -293,9 +525,14 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 💰 /setbalance <amount> - Set your initial balance
 ➕ /add <amount> <category> <description> - Add a transaction
 💳 /balance - Check your current balance
-📊 /report - Generate an Excel report
-📈 /monthly [month] [year] - View monthly expenses
-📥 /import - Import transactions from Excel file
+📊 /report [format] [from] [to] - Export transactions (xlsx, csv, parquet)
+📈 /monthly [month] [year] [all|top N] - View monthly expenses
+📉 /trend [months] - Spending and income over the last months
+📅 /range <from> <to> [category] - Totals between two dates
+🔎 /search <terms> [category] [from] [to] - Find transactions
+🎯 /setbudget <category> <amount> - Set a monthly budget
+💼 /budget [month] [year] - Spending against your budgets
+📥 /import - Import transactions from an Excel (.xlsx) or CSV file
 ❓ /help - Show this help message
 
 💡 Examples:
@@ -303,6 +540,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 • /add -50 Food Lunch
 • /add 500 Income Salary
 • /monthly 3 2024
+• /report csv 2024-01-01 2024-03-31
+• /trend 12
+• /range 2024-01-01 2024-03-31 Food
+• /search coffee Food
+• /setbudget Food 400
 
 📝 Import Guide:
 1. Use /report to get an Excel file with the correct format
@@ -320,15 +562,15 @@ Required columns:
     await update.message.reply_text(help_text)
 
 async def import_excel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if update.effective_user.id != ALLOWED_USER_ID:
+    if not is_allowed(update):
         await update.message.reply_text(UNAUTHORIZED_MESSAGE)
         return
     
     # Check if file is attached
     if not update.message.document:
         await update.message.reply_text(
-            "📤 Please attach an Excel file (.xlsx) with your transactions.\n"
-            "The file should have these columns:\n"
+            "📤 Please attach an Excel (.xlsx) or CSV file with your transactions.\n"
+            "Every sheet of a workbook is imported, each with these columns:\n"
             "- date (YYYY-MM-DD HH:MM:SS format)\n"
             "- amount (positive for income, negative for expenses)\n"
             "- category (must match valid categories)\n"
@@ -340,26 +582,33 @@ async def import_excel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return
     
     # Verify file type
-    if not update.message.document.file_name.endswith('.xlsx'):
-        await update.message.reply_text("❌ Please send an Excel file (.xlsx)")
+    extension = os.path.splitext(update.message.document.file_name or '')[1].lower()
+    if extension not in IMPORT_EXTENSIONS:
+        await update.message.reply_text("❌ Please send an Excel (.xlsx) or CSV (.csv) file")
         return
     
     # Download the file
     file = await context.bot.get_file(update.message.document.file_id)
-    temp_file = f"temp_{update.effective_user.id}.xlsx"
+    temp_file = f"temp_{update.effective_user.id}{extension}"
     await file.download_to_drive(temp_file)
     
     # Process the file
     try:
         status_message = await update.message.reply_text("📊 Processing your file...")
-        success, message = await process_excel_import(temp_file, db)
+        state = await users.get(update.effective_user.id)
+        success, message = await process_excel_import(temp_file, state.db, status_message)
         
+        # Pull the imported rows into the ledger, a failed batch may still
+        # leave earlier batches imported; the months they are dated in change version
+        crossings = await state.sync_ledger()
         if success:
-            # Reinitialize the global state after successful import
-            initialize_from_db()
             await status_message.edit_text(f"✅ {message}")
         else:
             await status_message.edit_text(f"❌ Import failed:\n{message}")
+        if crossings:
+            await update.message.reply_text(
+                render_budget_warnings(state.budgets, crossings), parse_mode=ParseMode.MARKDOWN_V2
+            )
     
     except Exception as e:
         await status_message.edit_text(f"❌ Error: {str(e)}")
@@ -376,8 +625,14 @@ __all__ = [
     'balance',
     'report',
     'monthly_expenses',
+    'trend',
+    'range_totals',
+    'search',
+    'set_budget',
+    'budget',
     'help_command',
-    'initialize_from_db',
+    'record_flushed_transactions',
+    'discard_dead_lettered_transactions',
     'import_excel'
 ]
 
@@ -0,0 +1,169 @@
+"""
+Scheduled Jobs
+
+Work that does not have to wait for a command runs on the Application's
+job queue (APScheduler) instead:
+
+- monthly_summary: on the 1st of every month, renders the previous month's
+  /monthly summary for every user in memory
+- monthly_report: on the 1st of every month, builds the previous month's
+  /report file (JOB_REPORT_FORMAT) for every user in memory
+- balance_snapshot: every night, flushes the write-behind journal and
+  writes a balance snapshot for every user with transactions since their
+  last one, so a reconciliation never has far to go
+
+The summaries and reports are pinned in the response cache (bot/cache.py)
+under the same keys the commands use, until the job's next run, so
+`/monthly <last month>` and `/report <format> <first day> <last day>` are
+answered from the cache unless that month's transactions changed since.
+Users not in memory are skipped; their data is read when they next send a
+command.
+
+Schedules are set with JOB_MONTHLY_SUMMARY_TIME, JOB_MONTHLY_REPORT_TIME
+and JOB_BALANCE_SNAPSHOT_TIME (HH:MM, UTC; empty disables the job). A job
+is never run twice at once: APScheduler runs at most one instance and a run
+that is due while the previous one is still going is skipped. Every run's
+duration and outcome is logged and recorded in the metrics.
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+import pytz
+from config import (
+    JOB_MONTHLY_SUMMARY_TIME, JOB_MONTHLY_REPORT_TIME, JOB_BALANCE_SNAPSHOT_TIME, JOB_REPORT_FORMAT,
+)
+from database.journal import write_behind
+from bot.handlers import build_monthly, build_report, monthly_cache_key, report_cache_key
+from bot.cache import responses
+from bot.ledger import month_bounds
+from bot.metrics import metrics
+from bot.users import users
+
+logger = logging.getLogger(__name__)
+
+def parse_schedule_time(value):
+    """datetime.time in UTC of an HH:MM setting, None if it is empty"""
+    if not value or not value.strip():
+        return None
+    try:
+        parsed = datetime.strptime(value.strip(), "%H:%M")
+    except ValueError:
+        raise ValueError(f"Invalid job time {value!r}, use HH:MM")
+    # The pinned APScheduler only accepts pytz time zones
+    return parsed.time().replace(tzinfo=pytz.utc)
+
+def previous_month(now=None):
+    """(year, month) of the month before now (UTC)"""
+    first = (now or datetime.now(timezone.utc)).replace(day=1)
+    last_month = first - timedelta(days=1)
+    return last_month.year, last_month.month
+
+class ScheduledJob:
+    """Job queue callback that skips overlapping runs and records each run"""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_started = None
+        self.last_duration = None
+
+    async def __call__(self, context=None):
+        if self.running:
+            self.skipped += 1
+            metrics.skip_job(self.name)
+            logger.warning("Skipping job %s, the previous run is still going", self.name)
+            return
+
+        self.running = True
+        self.last_started = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        failed = False
+        try:
+            await self.func()
+        except Exception:
+            failed = True
+            self.failures += 1
+            logger.exception("Job %s failed", self.name)
+        finally:
+            self.running = False
+            self.runs += 1
+            self.last_duration = time.perf_counter() - started
+            metrics.observe_job(self.name, self.last_duration, failed)
+            logger.info("Job %s %s in %.2f s", self.name, "failed" if failed else "finished", self.last_duration)
+
+async def precompute_monthly_summaries():
+    year, month = previous_month()
+    prepared = {}
+    for state in users.resident():
+        try:
+            messages = await build_monthly(state, month, year)
+        except Exception:
+            logger.exception("Could not prepare the monthly summary of user %s", state.user_id)
+            continue
+        if messages is not None:
+            prepared[monthly_cache_key(state, month, year)] = messages
+    responses.pin("monthly_summary", prepared)
+
+async def prebuild_monthly_reports():
+    year, month = previous_month()
+    # The range /report <format> <first day> <last day> asks for
+    start_date, end_date = month_bounds(year, month)
+    prepared = {}
+    for state in users.resident():
+        try:
+            report_bytes = await build_report(state, JOB_REPORT_FORMAT, start_date, end_date)
+        except Exception:
+            logger.exception("Could not prepare the monthly report of user %s", state.user_id)
+            continue
+        if report_bytes is not None:
+            prepared[report_cache_key(state, JOB_REPORT_FORMAT, start_date, end_date)] = report_bytes
+    responses.pin("monthly_report", prepared)
+
+async def write_balance_snapshots():
+    # Flushed rows reach the ledgers, so each snapshot covers them
+    if write_behind.enabled:
+        await write_behind.flush()
+    for state in users.resident():
+        if not state.transactions_since_snapshot or not state.ledger:
+            continue
+        try:
+            # The newest stored row and the balance the database gave it
+            ids = state.ledger.column('id')
+            newest = int(ids.argmax())
+            balance = int(state.ledger.column('running_balance')[newest]) / 100
+            await state.snapshot_balance(int(ids[newest]), 0, force=True, balance=balance)
+        except Exception:
+            logger.exception("Could not write the balance snapshot of user %s", state.user_id)
+
+JOBS = {
+    "monthly_summary": ScheduledJob("monthly_summary", precompute_monthly_summaries),
+    "monthly_report": ScheduledJob("monthly_report", prebuild_monthly_reports),
+    "balance_snapshot": ScheduledJob("balance_snapshot", write_balance_snapshots),
+}
+
+def schedule_jobs(job_queue):
+    """Register the jobs whose schedule is set on an Application's job queue"""
+    if job_queue is None:
+        logger.warning("No job queue (install python-telegram-bot[job-queue]), scheduled jobs are disabled")
+        return
+    # One instance at a time, runs missed while the bot was down are merged
+    job_kwargs = {"max_instances": 1, "coalesce": True}
+
+    summary_time = parse_schedule_time(JOB_MONTHLY_SUMMARY_TIME)
+    if summary_time is not None:
+        job_queue.run_monthly(JOBS["monthly_summary"], summary_time, day=1,
+                              name="monthly_summary", job_kwargs=job_kwargs)
+    report_time = parse_schedule_time(JOB_MONTHLY_REPORT_TIME)
+    if report_time is not None:
+        job_queue.run_monthly(JOBS["monthly_report"], report_time, day=1,
+                              name="monthly_report", job_kwargs=job_kwargs)
+    snapshot_time = parse_schedule_time(JOB_BALANCE_SNAPSHOT_TIME)
+    if snapshot_time is not None:
+        job_queue.run_daily(JOBS["balance_snapshot"], snapshot_time,
+                            name="balance_snapshot", job_kwargs=job_kwargs)
+    logger.info("Scheduled jobs: %s", ", ".join(job.name for job in job_queue.jobs()) or "none")
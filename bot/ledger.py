@@ -0,0 +1,431 @@
+"""
+Ledger Cache
+
+This module keeps an in-memory copy of a user's transactions that every
+read command is served from, so /report and /monthly never rescan the
+database.
+
+- The cache is loaded once, when the user's state is loaded
+- /add appends the row returned by the insert
+- After imports, sync() pulls only rows whose id is above the high-water
+  mark instead of rereading everything
+
+Rows are stored column by column in numpy arrays instead of one dict per
+row:
+
+- id, running balance and amount as int64 (amounts in integer cents, so
+  sums never pick up float rounding)
+- date and created_at as int64 epoch microseconds (UTC), the precision
+  the database stores, so rows read back unchanged
+- category as a uint8 code into VALID_CATEGORIES
+- description as a uint32 code into a table of interned strings, so a
+  description repeated across thousands of rows is stored once
+
+That is 45 bytes per row: about 45 MB per million rows plus the unique
+descriptions (around 60 bytes each), against roughly 1 KB per row for a
+list of row dicts. Appends grow the arrays by doubling, so up to twice
+that may be reserved between loads.
+
+Rows are kept sorted oldest first by (date, id), which lets date range
+lookups use binary search; filters and totals run vectorized over the
+arrays, and rows are only turned back into dicts for the slice a command
+returns. Work done in a worker process (/report files) gets a LedgerSlice,
+the rows' columns, and builds the dicts there one page at a time.
+
+Alongside the columns the cache maintains a DailyTotals index
+(bot/daily.py) of cumulative per-category totals by day, which answers
+range totals for /range and /trend without touching the rows, and a
+SearchIndex (bot/search.py) over the descriptions for /search.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+import numpy as np
+from config import TRANSACTIONS_PAGE_SIZE
+from bot.utils import VALID_CATEGORIES
+from bot.daily import DailyTotals
+from bot.search import SearchIndex
+
+COLUMNS = {
+    'id': np.int64,
+    'date': np.int64,
+    'amount': np.int64,
+    'running_balance': np.int64,
+    'created_at': np.int64,
+    'category': np.uint8,
+    'description': np.uint32,
+}
+
+# created_at of rows that have none
+MISSING_TIMESTAMP = np.iinfo(np.int64).min
+
+def month_bounds(year, month):
+    """ISO date strings of the first day of a month and of the month after"""
+    if month == 12:
+        return f"{year:04d}-12-01", f"{year + 1:04d}-01-01"
+    return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month + 1:02d}-01"
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECONDS_PER_SECOND = 1_000_000
+# Fractional digits of a timestamp the vectorized parser reads
+FRACTION_DIGITS = 6
+
+def to_epoch(value):
+    """Epoch microseconds of an ISO date or timestamp string, naive values are UTC"""
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    elif not isinstance(value, datetime):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def _parse_utc(strings):
+    """Epoch microseconds of 'YYYY-MM-DDTHH:MM:SS[.ffffff]+00:00' strings, -1
+    where malformed"""
+    width = 20 + FRACTION_DIGITS
+    chars = strings.astype(f'U{width}').view(np.uint32).reshape(len(strings), width).astype(np.int64)
+    digits = chars - ord('0')
+    digit_columns = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+    valid = ((digits[:, digit_columns] >= 0) & (digits[:, digit_columns] <= 9)).all(axis=1)
+    valid &= (chars[:, 4] == ord('-')) & (chars[:, 7] == ord('-'))
+    valid &= (chars[:, 10] == ord('T')) | (chars[:, 10] == ord(' '))
+    valid &= (chars[:, 13] == ord(':')) & (chars[:, 16] == ord(':'))
+
+    def number(first, last):
+        value = np.zeros(len(strings), dtype=np.int64)
+        for column in range(first, last + 1):
+            value = value * 10 + digits[:, column]
+        return value
+
+    year, month, day = number(0, 3), number(5, 6), number(8, 9)
+    # Days since 1970-01-01 of a proleptic Gregorian date (Hinnant's days_from_civil)
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+    seconds = days * 86400 + number(11, 12) * 3600 + number(14, 15) * 60 + number(17, 18)
+
+    # Up to six fractional digits between the seconds and the '+00:00',
+    # Postgres drops trailing zeros so shorter fractions are padded
+    fraction_end = np.strings.str_len(strings) - 6
+    has_fraction = chars[:, 19] == ord('.')
+    valid &= np.where(has_fraction, (fraction_end > 20) & (fraction_end <= width), fraction_end == 19)
+    micros = np.zeros(len(strings), dtype=np.int64)
+    for column in range(20, width):
+        in_fraction = has_fraction & (column < fraction_end)
+        valid &= ~in_fraction | ((digits[:, column] >= 0) & (digits[:, column] <= 9))
+        micros = micros * 10 + np.where(in_fraction, digits[:, column], 0)
+    return np.where(valid, seconds * MICROSECONDS_PER_SECOND + micros, -1)
+
+def to_epochs(values):
+    """Epoch microseconds of many timestamps, MISSING_TIMESTAMP for None"""
+    epochs = np.full(len(values), MISSING_TIMESTAMP, dtype=np.int64)
+    indexes = [index for index, value in enumerate(values) if value is not None]
+    if not indexes:
+        return epochs
+    strings = np.array([values[index] for index in indexes] if len(indexes) < len(values) else values, dtype=str)
+    indexes = np.array(indexes, dtype=np.intp)
+    # UTC timestamps, the shape both backends return, are parsed in one
+    # vectorized pass; anything else goes through to_epoch
+    parsed = np.full(len(strings), -1, dtype=np.int64)
+    utc = np.strings.endswith(strings, '+00:00') & (np.strings.str_len(strings) >= 25)
+    if utc.any():
+        parsed[utc] = _parse_utc(strings[utc])
+    fast = parsed != -1
+    epochs[indexes[fast]] = parsed[fast]
+    for index, value in zip(indexes[~fast], strings[~fast]):
+        epochs[index] = to_epoch(str(value))
+    return epochs
+
+def to_iso(epoch):
+    return (EPOCH + timedelta(microseconds=epoch)).isoformat()
+
+def to_cents(amounts):
+    """int64 cents of an amount or a list of amounts"""
+    return np.rint(np.array(amounts, dtype=np.float64) * 100).astype(np.int64)
+
+def _decode(columns, categories, descriptions):
+    """Row dicts of column arrays, in column order"""
+    columns = {name: values.tolist() for name, values in columns.items()}
+    return [
+        {
+            'id': row_id,
+            'date': to_iso(row_date),
+            'amount': amount / 100,
+            'category': categories[category],
+            'description': descriptions[description],
+            'running_balance': balance / 100,
+            'created_at': None if created_at == MISSING_TIMESTAMP else to_iso(created_at),
+        }
+        for row_id, row_date, amount, category, description, balance, created_at in zip(
+            columns['id'], columns['date'], columns['amount'], columns['category'],
+            columns['description'], columns['running_balance'], columns['created_at'],
+        )
+    ]
+
+class LedgerSlice:
+    """A copy of some ledger rows in column form, for sending to a worker
+    process: it pickles at the columns' size (45 bytes per row plus the
+    descriptions it uses) and iterating it yields pages of row dicts, so
+    only one page of dicts exists at a time"""
+
+    def __init__(self, columns, categories, descriptions, page_size=TRANSACTIONS_PAGE_SIZE):
+        self.columns = columns
+        self.categories = categories
+        self.descriptions = descriptions
+        self.page_size = page_size
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __iter__(self):
+        for start in range(0, len(self), self.page_size):
+            yield _decode(
+                {name: values[start:start + self.page_size] for name, values in self.columns.items()},
+                self.categories, self.descriptions,
+            )
+
+class LedgerCache:
+    def __init__(self):
+        self._size = 0
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.categories = list(VALID_CATEGORIES)
+        self._category_codes = {category: code for code, category in enumerate(self.categories)}
+        self.descriptions = []
+        self._description_codes = {}
+        self.daily = DailyTotals(self.categories)
+        self.search_index = SearchIndex(self.descriptions)
+        self.loaded = False
+        # Highest transaction id pulled from the database
+        self.last_id = None
+        # Ids appended locally above last_id, skipped by the next sync
+        self._appended_ids = set()
+
+    def __len__(self):
+        return self._size
+
+    def column(self, name):
+        """Read-only view of one column, in (date, id) order"""
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def memory_bytes(self):
+        """Bytes held by the column arrays and the indexes, including reserved capacity"""
+        return (sum(array.nbytes for array in self._columns.values())
+                + self.daily.memory_bytes() + self.search_index.memory_bytes())
+
+    async def load(self, database):
+        """(Re)load the whole ledger from the database"""
+        self._size = 0
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.last_id = None
+        self._appended_ids.clear()
+        chunks = []
+        async for page in database.iter_transaction_pages(descending=False):
+            chunks.append(self._encode(page))
+            self._advance(page)
+        if chunks:
+            self._columns = {
+                name: np.concatenate([chunk[name] for chunk in chunks])
+                for name in COLUMNS
+            }
+            self._size = len(self._columns['id'])
+            self._sort()
+        self._rebuild_daily()
+        columns = self._columns
+        self.search_index.rebuild(*(columns[name][:self._size] for name in ('description', 'date', 'id', 'category')))
+        self.loaded = True
+        return self
+
+    async def sync(self, database):
+        """Pull rows added since the high-water mark, returns the new rows"""
+        new_rows = []
+        async for page in database.iter_transactions_after(self.last_id):
+            new_rows.extend(t for t in page if t['id'] not in self._appended_ids)
+            self._advance(page)
+        self._appended_ids.clear()
+        if new_rows:
+            encoded = self._encode(new_rows)
+            self.search_index.extend(*(encoded[name] for name in ('description', 'date', 'id', 'category')))
+            self._reserve(self._size + len(new_rows))
+            for name, values in encoded.items():
+                self._columns[name][self._size:self._size + len(new_rows)] = values
+            self._size += len(new_rows)
+            # Imported rows can be backdated
+            self._sort()
+            self._rebuild_daily()
+        return new_rows
+
+    def append(self, transaction):
+        """Add a row that was just inserted through this bot"""
+        encoded = self._encode([transaction])
+        dates, ids = self._columns['date'], self._columns['id']
+        row_date, row_id = encoded['date'][0], encoded['id'][0]
+        # Usually the newest row, otherwise insert it in (date, id) order
+        lo = int(np.searchsorted(dates[:self._size], row_date, side='left'))
+        hi = int(np.searchsorted(dates[:self._size], row_date, side='right'))
+        position = lo + int(np.searchsorted(ids[lo:hi], row_id))
+        self._reserve(self._size + 1)
+        for name, values in encoded.items():
+            column = self._columns[name]
+            column[position + 1:self._size + 1] = column[position:self._size]
+            column[position] = values[0]
+        self._size += 1
+        self.daily.add(int(row_date), int(encoded['amount'][0]), int(encoded['category'][0]))
+        self.search_index.extend(*(encoded[name] for name in ('description', 'date', 'id', 'category')))
+        if self.last_id is None or transaction['id'] > self.last_id:
+            self._appended_ids.add(transaction['id'])
+
+    def select(self, start_date=None, end_date=None, category=None, expenses_only=False):
+        """Indexes of rows with start_date <= date < end_date, oldest first"""
+        lo, hi = self._bounds(start_date, end_date)
+        indexes = np.arange(lo, hi)
+        mask = None
+        if category is not None:
+            code = self._category_codes.get(category)
+            if code is None:
+                return indexes[:0]
+            mask = self._columns['category'][lo:hi] == code
+        if expenses_only:
+            expenses = self._columns['amount'][lo:hi] < 0
+            mask = expenses if mask is None else mask & expenses
+        return indexes if mask is None else indexes[mask]
+
+    def totals_by_category(self, start_date=None, end_date=None, expenses_only=True):
+        """{category: (total in cents, count)} over a date range"""
+        indexes = self.select(start_date, end_date, expenses_only=expenses_only)
+        codes = self._columns['category'][indexes]
+        # Float sums of integer cents are exact below 2**53
+        totals = np.bincount(codes, weights=self._columns['amount'][indexes], minlength=len(self.categories))
+        counts = np.bincount(codes, minlength=len(self.categories))
+        return {
+            self.categories[code]: (int(round(totals[code])), int(counts[code]))
+            for code in np.flatnonzero(counts)
+        }
+
+    def range_totals(self, start_date=None, end_date=None):
+        """{category: (expenses, income, expense count)} in cents with
+        start_date <= date < end_date, from the daily index"""
+        return self.daily.totals(
+            None if start_date is None else to_epoch(start_date),
+            None if end_date is None else to_epoch(end_date),
+        )
+
+    def period_totals(self, boundaries):
+        """(expenses, income) in cents between consecutive ISO date boundaries"""
+        return self.daily.period_totals([to_epoch(boundary) for boundary in boundaries])
+
+    def search(self, terms, category=None, start_date=None, end_date=None):
+        """(dates, ids) of rows whose description contains any of the terms,
+        best match first, from the search index"""
+        code = None
+        if category is not None:
+            code = self._category_codes.get(category)
+            if code is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return self.search_index.search(
+            terms, code,
+            None if start_date is None else to_epoch(start_date),
+            None if end_date is None else to_epoch(end_date),
+        )
+
+    def rows_at(self, dates, ids):
+        """Row dicts of the rows with the given (date, id) keys, in the order given"""
+        all_dates, all_ids = self._columns['date'][:self._size], self._columns['id'][:self._size]
+        lo = np.searchsorted(all_dates, dates, side='left')
+        hi = np.searchsorted(all_dates, dates, side='right')
+        # Rows sharing a date are in id order
+        indexes = [int(start) + int(np.searchsorted(all_ids[start:stop], row_id))
+                   for start, stop, row_id in zip(lo, hi, ids)]
+        return self.rows(np.array(indexes, dtype=np.intp))
+
+    def rows(self, indexes):
+        """Row dicts for the given indexes, in the order given"""
+        columns = {name: self._columns[name][indexes] for name in COLUMNS}
+        return _decode(columns, self.categories, self.descriptions)
+
+    def slice(self, start_date=None, end_date=None):
+        """LedgerSlice of the rows with start_date <= date < end_date, oldest first"""
+        lo, hi = self._bounds(start_date, end_date)
+        columns = {name: self._columns[name][lo:hi].copy() for name in COLUMNS}
+        # Only the descriptions the slice uses, renumbered from 0
+        used, columns['description'] = np.unique(columns['description'], return_inverse=True)
+        descriptions = [self.descriptions[code] for code in used.tolist()]
+        return LedgerSlice(columns, list(self.categories), descriptions)
+
+    def between(self, start_date, end_date, expenses_only=False):
+        """Rows with start_date <= date < end_date (ISO strings), oldest first"""
+        return self.rows(self.select(start_date, end_date, expenses_only=expenses_only))
+
+    def _bounds(self, start_date, end_date):
+        dates = self._columns['date'][:self._size]
+        lo = 0 if start_date is None else int(np.searchsorted(dates, to_epoch(start_date), side='left'))
+        hi = self._size if end_date is None else int(np.searchsorted(dates, to_epoch(end_date), side='left'))
+        return lo, max(lo, hi)
+
+    def _encode(self, transactions):
+        """Column arrays for a list of row dicts"""
+        return {
+            'id': np.array([t['id'] for t in transactions], dtype=np.int64),
+            'date': to_epochs([t['date'] for t in transactions]),
+            'amount': to_cents([t['amount'] for t in transactions]),
+            'running_balance': to_cents([t['running_balance'] for t in transactions]),
+            'created_at': to_epochs([t.get('created_at') for t in transactions]),
+            'category': self._intern(
+                [t['category'] for t in transactions], self.categories, self._category_codes, np.uint8),
+            'description': self._intern(
+                [t.get('description') for t in transactions], self.descriptions, self._description_codes, np.uint32),
+        }
+
+    def _intern(self, values, table, codes, dtype):
+        """Codes of values in table, adding values seen for the first time"""
+        found = [codes.get(value) for value in values]
+        if None in found:
+            for position, code in enumerate(found):
+                if code is None:
+                    value = values[position]
+                    code = codes.get(value)
+                    if code is None:
+                        # e.g. categories outside VALID_CATEGORIES from old rows
+                        code = len(table)
+                        if code > np.iinfo(dtype).max:
+                            raise ValueError("Too many distinct values for the ledger cache")
+                        table.append(value)
+                        codes[value] = code
+                    found[position] = code
+        return np.array(found, dtype=dtype)
+
+    def _rebuild_daily(self):
+        self.daily.rebuild(
+            self._columns['date'][:self._size],
+            self._columns['amount'][:self._size],
+            self._columns['category'][:self._size].astype(np.int64),
+        )
+
+    def _reserve(self, size):
+        capacity = len(self._columns['id'])
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def _sort(self):
+        dates = self._columns['date'][:self._size]
+        ids = self._columns['id'][:self._size]
+        in_order = np.all((dates[1:] > dates[:-1]) | ((dates[1:] == dates[:-1]) & (ids[1:] > ids[:-1])))
+        if in_order:
+            return
+        order = np.lexsort((ids, dates))
+        for name, column in self._columns.items():
+            column[:self._size] = column[:self._size][order]
+
+    def _advance(self, page):
+        page_max = max(t['id'] for t in page)
+        if self.last_id is None or page_max > self.last_id:
+            self.last_id = page_max
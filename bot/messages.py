@@ -34,11 +34,11 @@ Use:
 HELP_MESSAGE = """
 Available commands:
 ...
-📤 /import - Import transactions from Excel file
+📤 /import - Import transactions from an Excel (.xlsx) or CSV file
 ...
 """
 IMPORT_TEMPLATE_MESSAGE = """
-📊 Excel Import Template Format:
+📊 Import Template Format (.xlsx or .csv):
 
 Required columns:
 • date: YYYY-MM-DD
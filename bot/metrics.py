@@ -0,0 +1,280 @@
+"""
+Metrics and Instrumentation
+
+This module records what the bot spends its time on and exposes it in the
+Prometheus text format:
+
+- instrument_handler() wraps a Telegram handler and records its latency
+  and errors
+- InstrumentedBackend wraps a storage backend and records per-method
+  latency, errors, rows returned and estimated payload sizes; queries
+  slower than SLOW_QUERY_MS are logged as warnings
+- observe_job() records the duration and errors of scheduled jobs
+  (bot/jobs.py), skip_job() the runs skipped because a run was still going
+- metrics_app is a Starlette app serving GET /metrics, run on METRICS_PORT
+  by MetricsServer
+
+Metrics are recorded from the event loop and from the database executor
+threads, so the registry is guarded by a lock.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import threading
+import time
+from config import METRICS_HOST, METRICS_PORT, SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+BYTE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, labels):
+        counts, count, total = self.series.get(labels, ([0] * len(self.buckets), 0, 0.0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.series[labels] = (counts, count + 1, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, count, total) in sorted(self.series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.handler_latency = Histogram(
+            "bot_handler_latency_seconds", "Handler latency in seconds", LATENCY_BUCKETS)
+        self.handler_errors = Counter(
+            "bot_handler_errors_total", "Handler calls that raised")
+        self.query_latency = Histogram(
+            "bot_db_query_latency_seconds", "Storage backend call latency in seconds", LATENCY_BUCKETS)
+        self.query_errors = Counter(
+            "bot_db_query_errors_total", "Storage backend calls that raised")
+        self.query_rows = Histogram(
+            "bot_db_rows_returned", "Rows returned per storage backend call", ROW_BUCKETS)
+        self.query_payload = Histogram(
+            "bot_db_payload_bytes", "Estimated JSON size of rows sent or returned per call", BYTE_BUCKETS)
+        self.slow_queries = Counter(
+            "bot_db_slow_queries_total", "Storage backend calls slower than SLOW_QUERY_MS")
+        self.job_duration = Histogram(
+            "bot_job_duration_seconds", "Scheduled job run time in seconds", JOB_BUCKETS)
+        self.job_errors = Counter(
+            "bot_job_errors_total", "Scheduled job runs that raised")
+        self.job_skipped = Counter(
+            "bot_job_skipped_total", "Scheduled job runs skipped because the previous run was still going")
+        # name -> (help text, callable returning the current value)
+        self.gauges = {}
+
+    def register_gauge(self, name, help_text, read):
+        self.gauges[name] = (help_text, read)
+
+    def observe_handler(self, handler, seconds, failed):
+        labels = (('handler', handler),)
+        with self._lock:
+            self.handler_latency.observe(seconds, labels)
+            if failed:
+                self.handler_errors.inc(labels)
+
+    def observe_query(self, method, seconds, failed, rows=None, payload_bytes=None):
+        labels = (('method', method),)
+        with self._lock:
+            self.query_latency.observe(seconds, labels)
+            if failed:
+                self.query_errors.inc(labels)
+            if rows is not None:
+                self.query_rows.observe(rows, labels)
+            if payload_bytes is not None:
+                self.query_payload.observe(payload_bytes, labels)
+            if seconds * 1000 >= SLOW_QUERY_MS:
+                self.slow_queries.inc(labels)
+
+    def observe_job(self, job, seconds, failed):
+        labels = (('job', job),)
+        with self._lock:
+            self.job_duration.observe(seconds, labels)
+            if failed:
+                self.job_errors.inc(labels)
+
+    def skip_job(self, job):
+        with self._lock:
+            self.job_skipped.inc((('job', job),))
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.handler_latency, self.handler_errors, self.query_latency,
+                           self.query_errors, self.query_rows, self.query_payload, self.slow_queries,
+                           self.job_duration, self.job_errors, self.job_skipped):
+                lines.extend(metric.render())
+        for name, (help_text, read) in sorted(self.gauges.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+# Create a singleton instance
+metrics = MetricsRegistry()
+
+def instrument_handler(name, handler):
+    """Wrap a Telegram handler callback to record its latency and errors"""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(update, context)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            metrics.observe_handler(name, time.perf_counter() - started, failed)
+    return wrapper
+
+def _row_size(row):
+    try:
+        return len(json.dumps(row, default=str))
+    except (TypeError, ValueError):
+        return None
+
+def _describe(result):
+    """Rows and approximate payload size of a backend result, if it is a list of rows
+
+    Only the first row is serialized; the payload is estimated as that row's
+    size times the number of rows, so large pages cost no more than small ones.
+    """
+    if isinstance(result, list):
+        if not result:
+            return 0, 0
+        size = _row_size(result[0])
+        return len(result), None if size is None else size * len(result)
+    if isinstance(result, dict):
+        return 1, _row_size(result)
+    return None, None
+
+class InstrumentedBackend:
+    """Storage backend proxy that records metrics for every method call"""
+
+    def __init__(self, backend, user_id=None):
+        self.backend = backend
+        self.user_id = user_id
+
+    def for_user(self, user_id):
+        return InstrumentedBackend(self.backend.for_user(user_id), user_id)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.backend, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+        if name.startswith('iter_') or name == 'bulk_insert_transactions':
+            return functools.partial(self._instrument_iterator, name, attribute)
+        return functools.partial(self._instrument_call, name, attribute)
+
+    def _record(self, method, started, failed, rows=None, payload_bytes=None):
+        seconds = time.perf_counter() - started
+        metrics.observe_query(method, seconds, failed, rows, payload_bytes)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            logger.warning("Slow query: %s took %.1f ms (rows=%s, user=%s)",
+                           method, seconds * 1000, rows, self.user_id)
+
+    def _instrument_call(self, method, func, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            rows = len(args[0]) if method == 'record_transactions' and args else None
+            self._record(method, started, True, rows)
+            raise
+        if method == 'record_transactions' and args:
+            rows, payload_bytes = _describe(args[0])
+        else:
+            rows, payload_bytes = _describe(result)
+        self._record(method, started, False, rows, payload_bytes)
+        return result
+
+    def _instrument_iterator(self, method, func, *args, **kwargs):
+        """Time every step of a paging or batching generator as one query"""
+        iterator = func(*args, **kwargs)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except Exception:
+                self._record(method, started, True)
+                raise
+            if method == 'bulk_insert_transactions':
+                start, end, stored, error = item
+                self._record(method, started, error is not None, end - start)
+            else:
+                rows, payload_bytes = _describe(item)
+                self._record(method, started, False, rows, payload_bytes)
+            yield item
+
+async def metrics_endpoint(request):
+    from starlette.responses import PlainTextResponse
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def create_metrics_app():
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+    return Starlette(routes=[Route("/metrics", metrics_endpoint)])
+
+class MetricsServer:
+    """Uvicorn server for /metrics running as a task on the bot's event loop"""
+
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT):
+        import uvicorn
+        config = uvicorn.Config(create_metrics_app(), host=host, port=port,
+                                log_level="warning", lifespan="off")
+        self.server = uvicorn.Server(config)
+        # The bot owns signal handling, uvicorn must not install its own
+        self.server.install_signal_handlers = lambda: None
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.server.serve())
+
+    async def stop(self):
+        if self.task:
+            self.server.should_exit = True
+            await self.task
+            self.task = None
@@ -0,0 +1,143 @@
+"""
+Monthly Report Rendering
+
+This module turns a month of transactions plus its monthly rollup into the
+MarkdownV2 messages sent by /monthly. It runs in the worker pool, so inputs
+and output are plain picklable rows and strings. pandas is imported inside
+the functions that use it, so loading this module stays cheap.
+
+Rendering is a single vectorized pass: amounts, dates and escaping are
+computed column-wise and the lines are grouped by category once. The text
+is split into messages on category boundaries so no message exceeds
+Telegram's 4096 character limit, and large months can be limited to the
+top N expenses per category.
+"""
+
+import re
+from datetime import datetime
+
+MAX_MESSAGE_LENGTH = 4096
+# Characters that must be escaped anywhere in MarkdownV2 text
+MARKDOWN_V2_SPECIAL = r'([_*\[\]()~`>#+\-=|{}.!\\])'
+
+def escape_markdown_v2(text):
+    return re.sub(MARKDOWN_V2_SPECIAL, r'\\\1', str(text))
+
+def _format_amounts(amounts):
+    """Format absolute amounts as MarkdownV2-escaped strings with 2 decimals"""
+    cents = (amounts.abs() * 100).round().astype('int64')
+    return (cents // 100).astype(str) + "\\." + (cents % 100).astype(str).str.zfill(2)
+
+def format_cents(cents):
+    """Format an absolute amount in integer cents as a MarkdownV2-escaped string with 2 decimals"""
+    cents = abs(int(cents))
+    return f"{cents // 100}\\.{cents % 100:02d}"
+
+def split_messages(blocks, limit=MAX_MESSAGE_LENGTH):
+    """Pack text blocks into messages of at most limit characters.
+
+    Blocks are kept whole where possible, an oversized block is split on
+    line boundaries.
+    """
+    messages = []
+    current = ""
+    for block in blocks:
+        pieces = [block] if len(block) <= limit else block.split("\n")
+        for i, piece in enumerate(pieces):
+            # Pieces of a split block are rejoined with the newline they lost
+            separator = "\n" if i > 0 and current else ""
+            candidate = f"{current}{separator}{piece}"
+            if len(candidate) <= limit:
+                current = candidate
+                continue
+            if current:
+                messages.append(current)
+            current = piece[:limit]
+    if current:
+        messages.append(current)
+    return messages
+
+def parse_monthly_args(args):
+    """Parse `/monthly [month] [year] [all|top N]` arguments.
+
+    Returns (month, year, top_n, show_all), raises ValueError on bad input.
+    """
+    args = [arg.lower() for arg in args or []]
+    now = datetime.now()
+    top_n = None
+    show_all = False
+    if args and args[-1] == 'all':
+        show_all = True
+        args.pop()
+    elif len(args) >= 2 and args[-2] == 'top':
+        top_n = int(args.pop())
+        args.pop()
+        if top_n < 1:
+            raise ValueError("top N must be positive")
+    if len(args) > 2:
+        raise ValueError("Too many arguments")
+
+    target_month = int(args[0]) if args else now.month
+    target_year = int(args[1]) if len(args) > 1 else now.year
+    if not 1 <= target_month <= 12:
+        raise ValueError("Month must be between 1 and 12")
+    return target_month, target_year, top_n, show_all
+
+def render_monthly_report(rows, rollup, target_month, target_year, top_n=None):
+    """Render the /monthly report for one month as a list of messages.
+
+    With top_n set only the top_n largest expenses of each category are
+    listed, followed by a count of the hidden ones.
+    """
+    import pandas as pd
+
+    category_totals = pd.Series(
+        {row['category']: abs(float(row['total'])) for row in rollup}
+    ).sort_index()
+    total_expenses = category_totals.sum()
+    percentages = category_totals / total_expenses * 100
+
+    df = pd.DataFrame(rows, columns=['date', 'amount', 'category', 'description'])
+    df = df[df['amount'] < 0]
+    df['date'] = pd.to_datetime(df['date'], format='ISO8601')
+    counts = df.groupby('category').size()
+    if top_n is not None:
+        # Largest expenses are the most negative amounts
+        df = df.sort_values('amount').groupby('category').head(top_n)
+    df = df.sort_values(['category', 'date'], kind='stable')
+    hidden_counts = counts.sub(df.groupby('category').size(), fill_value=0)
+
+    # Build every transaction line in one vectorized pass
+    descriptions = df['description'].fillna('').astype(str).str.replace(MARKDOWN_V2_SPECIAL, r'\\\1', regex=True)
+    lines = (
+        "\n   • " + df['date'].dt.strftime('%d/%m') + ": $"
+        + _format_amounts(df['amount']) + " \\- " + descriptions
+    )
+    lines_by_category = lines.groupby(df['category']).agg("".join)
+
+    month_name = datetime.strptime(str(target_month), "%m").strftime("%B")
+    blocks = [f"""
+📈 Expense Report: {month_name} {target_year}
+
+💹 Category Breakdown:"""]
+
+    amount_strs = _format_amounts(category_totals)
+    percentage_strs = percentages.map("{:.1f}".format).str.replace(".", "\\.", regex=False)
+    for category in category_totals.index:
+        block = (
+            f"\n\n🏷️ {escape_markdown_v2(category)}: ${amount_strs[category]} "
+            f"\\({percentage_strs[category]}%\\)"
+            + lines_by_category.get(category, "")
+        )
+        hidden = int(hidden_counts.get(category, 0))
+        if hidden > 0:
+            block += f"\n   _…and {hidden} more_"
+        blocks.append(block)
+
+    total_str = _format_amounts(pd.Series([total_expenses])).iloc[0]
+    footer = f"\n\n💰 Total Expenses: ||${total_str}||"
+    if (hidden_counts > 0).any():
+        footer += f"\n\nShowing the top {top_n} per category, use /monthly {target_month} {target_year} all to see every expense\\."
+    blocks.append(footer)
+
+    return split_messages(blocks)
@@ -0,0 +1,210 @@
+"""
+Transaction Search
+
+This module implements /search: an inverted index over transaction
+descriptions, the parsing of /search arguments and the rendering of a page
+of results.
+
+The LedgerCache already interns descriptions, so the index works on
+description codes rather than on rows:
+
+- token -> codes of the distinct descriptions containing it
+- description code -> its rows, kept as (date, id, category) columns sorted
+  by description, with an offset per description (17 bytes per row)
+
+A query scores each matching description by the inverse document frequency
+of the terms it contains, so rare words weigh more and descriptions that
+match more terms rank first; ties go to the newest row. Only the rows of
+matching descriptions are read, never the whole ledger, and only the page
+being shown is turned into row dicts.
+
+Rows added after the index was built (/add, imports) are kept in a pending
+list that queries read as well, and are merged into the sorted columns once
+there are PENDING_LIMIT of them.
+"""
+
+import math
+import re
+from datetime import datetime, timedelta
+import numpy as np
+from bot.reports import escape_markdown_v2, format_cents, split_messages
+from bot.utils import VALID_CATEGORIES
+
+TOKEN_PATTERN = re.compile(r"\w+")
+PENDING_LIMIT = 4096
+
+def tokenize(text):
+    """Distinct lowercase words of a description"""
+    return set(TOKEN_PATTERN.findall(text.lower())) if text else set()
+
+def _ranges(starts, lengths):
+    """Concatenation of arange(start, start + length) for each pair"""
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return shifts + np.arange(total)
+
+class SearchIndex:
+    def __init__(self, descriptions):
+        # The ledger's description table, shared so codes match; it may grow
+        self.descriptions = descriptions
+        # token -> codes of descriptions containing it
+        self._tokens = {}
+        # Descriptions tokenized so far
+        self._tokenized = 0
+        # Rows of description code c are _offsets[c]:_offsets[c + 1]
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._dates = np.empty(0, dtype=np.int64)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._categories = np.empty(0, dtype=np.uint8)
+        # Rows added since the columns were built, as lists of arrays
+        self._pending = []
+        self._pending_rows = 0
+
+    def __len__(self):
+        return len(self._ids) + self._pending_rows
+
+    def memory_bytes(self):
+        return sum(array.nbytes for array in (self._offsets, self._dates, self._ids, self._categories))
+
+    def rebuild(self, codes, dates, ids, categories):
+        """Rebuild the index from ledger columns, in (date, id) order"""
+        self._index_descriptions()
+        # A stable sort keeps each description's rows in (date, id) order
+        order = np.argsort(codes, kind='stable')
+        self._dates, self._ids, self._categories = dates[order], ids[order], categories[order]
+        self._offsets = np.zeros(len(self.descriptions) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(self.descriptions)), out=self._offsets[1:])
+        self._pending = []
+        self._pending_rows = 0
+
+    def extend(self, codes, dates, ids, categories):
+        """Add rows stored since the index was built"""
+        self._pending.append((codes, dates, ids, categories))
+        self._pending_rows += len(codes)
+        if self._pending_rows >= PENDING_LIMIT:
+            self._merge()
+
+    def search(self, terms, category=None, start=None, end=None):
+        """(dates, ids) of the rows matching any of the terms, best first.
+
+        category is a category code, start and end epoch microseconds of a
+        half-open range; None does not filter.
+        """
+        self._index_descriptions()
+        postings = [self._tokens[term] for term in set(terms) if term in self._tokens]
+        if not postings:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # Score of each matching description: the summed idf of its terms
+        all_codes = np.concatenate([np.array(codes, dtype=np.int64) for codes in postings])
+        weights = np.concatenate([
+            np.full(len(codes), math.log(1 + len(self.descriptions) / len(codes))) for codes in postings
+        ])
+        matched, inverse = np.unique(all_codes, return_inverse=True)
+        matched_scores = np.bincount(inverse, weights=weights)
+
+        # Rows of matching descriptions in the sorted columns...
+        indexed = matched < len(self._offsets) - 1
+        starts = self._offsets[matched[indexed]]
+        lengths = self._offsets[matched[indexed] + 1] - starts
+        rows = _ranges(starts, lengths)
+        scores = np.repeat(matched_scores[indexed], lengths)
+        dates, ids, categories = self._dates[rows], self._ids[rows], self._categories[rows]
+        # ...and in the pending rows
+        if self._pending:
+            codes, new_dates, new_ids, new_categories = (np.concatenate(column) for column in zip(*self._pending))
+            positions = np.searchsorted(matched, codes)
+            hits = positions < len(matched)
+            hits[hits] = matched[positions[hits]] == codes[hits]
+            scores = np.concatenate([scores, matched_scores[positions[hits]]])
+            dates = np.concatenate([dates, new_dates[hits]])
+            ids = np.concatenate([ids, new_ids[hits]])
+            categories = np.concatenate([categories, new_categories[hits]])
+
+        keep = np.ones(len(ids), dtype=bool)
+        if category is not None:
+            keep &= categories == category
+        if start is not None:
+            keep &= dates >= start
+        if end is not None:
+            keep &= dates < end
+        scores, dates, ids = scores[keep], dates[keep], ids[keep]
+
+        # Best score first, then newest first
+        order = np.lexsort((ids, dates, scores))[::-1]
+        return dates[order], ids[order]
+
+    def _index_descriptions(self):
+        """Tokenize descriptions interned since the last call"""
+        for code in range(self._tokenized, len(self.descriptions)):
+            for token in tokenize(self.descriptions[code]):
+                self._tokens.setdefault(token, []).append(code)
+        self._tokenized = len(self.descriptions)
+
+    def _merge(self):
+        """Merge the pending rows into the sorted columns"""
+        codes = np.repeat(np.arange(len(self._offsets) - 1), np.diff(self._offsets))
+        columns = [codes, self._dates, self._ids, self._categories]
+        pending = [np.concatenate(column) for column in zip(*self._pending)]
+        codes, dates, ids, categories = (
+            np.concatenate([column, new]).astype(column.dtype) for column, new in zip(columns, pending)
+        )
+        order = np.lexsort((ids, dates))
+        self.rebuild(codes[order], dates[order], ids[order], categories[order])
+
+def parse_search_args(args):
+    """Parse `/search <terms> [category] [from] [to] [page N]` arguments.
+
+    Returns (query, terms, category, start_date, end_date, page): query is
+    the arguments without the page, for showing and repeating the search.
+    The dates are ISO date strings of a half-open [start, end) range, `to`
+    being inclusive, and None when not given. Raises ValueError on bad input.
+    """
+    args = list(args or [])
+    page = 1
+    if len(args) >= 2 and args[-2].lower() == 'page':
+        page = int(args.pop())
+        args.pop()
+        if page < 1:
+            raise ValueError("Page must be positive")
+    query = " ".join(args)
+
+    # Trailing dates, then an optional category, the rest are search terms
+    dates = []
+    while args and len(dates) < 2 and re.fullmatch(r"\d{4}-\d{2}-\d{2}", args[-1]):
+        arg = args.pop()
+        try:
+            dates.insert(0, datetime.strptime(arg, "%Y-%m-%d"))
+        except ValueError:
+            raise ValueError(f"Invalid format or date: {arg}")
+    category = None
+    if len(args) > 1 and args[-1].title() in VALID_CATEGORIES:
+        category = args.pop().title()
+
+    terms = sorted(set().union(*map(tokenize, args))) if args else []
+    if not terms:
+        raise ValueError("Please give something to search for")
+    start_date = dates[0].strftime("%Y-%m-%d") if dates else None
+    end_date = (dates[1] + timedelta(days=1)).strftime("%Y-%m-%d") if len(dates) > 1 else None
+    if start_date and end_date and start_date >= end_date:
+        raise ValueError("Start date is after end date")
+    return query, terms, category, start_date, end_date, page
+
+def render_search_results(rows, query, page, pages, total):
+    """Render one page of /search results, rows in ranked order"""
+    query = escape_markdown_v2(query)
+    blocks = [f"\n🔎 {total} transaction{'' if total == 1 else 's'} matching \"{query}\"\n"]
+    for row in rows:
+        sign = "➕" if row['amount'] > 0 else "➖"
+        day = datetime.fromisoformat(row['date']).strftime("%d/%m/%Y")
+        blocks.append(
+            f"\n{sign} {escape_markdown_v2(day)} {escape_markdown_v2(row['category'])}: "
+            f"${format_cents(round(row['amount'] * 100))} \\- {escape_markdown_v2(row['description'] or '')}"
+        )
+    if pages > 1:
+        footer = f"\n\nPage {page} of {pages}"
+        if page < pages:
+            footer += f", send /search {query} page {page + 1} for more"
+        blocks.append(footer)
+    return split_messages(blocks)
@@ -0,0 +1,139 @@
+"""
+Trend and Range Rendering
+
+This module parses the arguments of /trend and /range and renders their
+MarkdownV2 replies. The totals come from the ledger's daily index
+(bot/daily.py) as integer cents, so rendering is cheap enough to run on the
+event loop and never reads transactions.
+
+- /trend [months]: spending and income of the last N calendar months,
+  including the current one, with a bar per month
+- /range <from> <to> [category]: totals between two dates (inclusive),
+  per category or for one category
+"""
+
+from datetime import datetime, timedelta
+from config import TREND_MONTHS
+from bot.ledger import month_bounds
+from bot.reports import split_messages, escape_markdown_v2, format_cents
+from bot.utils import VALID_CATEGORIES
+
+MAX_TREND_MONTHS = 60
+BAR_WIDTH = 10
+
+def _signed_money(cents):
+    return ("\\+" if cents >= 0 else "\\-") + "$" + format_cents(cents)
+
+def parse_trend_args(args):
+    """Parse `/trend [months]` arguments, returns the number of months.
+
+    Raises ValueError on bad input.
+    """
+    args = list(args or [])
+    if len(args) > 1:
+        raise ValueError("Too many arguments")
+    months = int(args[0]) if args else TREND_MONTHS
+    if not 1 <= months <= MAX_TREND_MONTHS:
+        raise ValueError(f"Months must be between 1 and {MAX_TREND_MONTHS}")
+    return months
+
+def trend_months(year, month, count):
+    """The count months ending with (year, month), oldest first, and the
+    ISO date boundaries between them (count + 1 dates)"""
+    months = []
+    for _ in range(count):
+        months.append((year, month))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    months.reverse()
+    boundaries = [month_bounds(year, month)[0] for year, month in months]
+    boundaries.append(month_bounds(*months[-1])[1])
+    return months, boundaries
+
+def parse_range_args(args):
+    """Parse `/range <from> <to> [category]` arguments.
+
+    Returns (start_date, end_date, category) where the dates are ISO date
+    strings of a half-open [start, end) range, `to` being inclusive, and
+    category is None for every category. Raises ValueError on bad input.
+    """
+    args = list(args or [])
+    if len(args) < 2:
+        raise ValueError("Please give a start and an end date")
+    if len(args) > 3:
+        raise ValueError("Too many arguments")
+
+    dates = []
+    for arg in args[:2]:
+        try:
+            dates.append(datetime.strptime(arg, "%Y-%m-%d"))
+        except ValueError:
+            raise ValueError(f"Invalid format or date: {arg}")
+    if dates[0] > dates[1]:
+        raise ValueError("Start date is after end date")
+
+    category = None
+    if len(args) == 3:
+        category = args[2].strip().title()
+        if category not in VALID_CATEGORIES:
+            raise ValueError(f"Unknown category: {args[2]}")
+    return dates[0].strftime("%Y-%m-%d"), (dates[1] + timedelta(days=1)).strftime("%Y-%m-%d"), category
+
+def render_trend(months, periods):
+    """Render /trend from (year, month) pairs and their (expenses, income) in cents"""
+    most_spent = max(expenses for expenses, _ in periods)
+    blocks = [f"\n📈 Trend: last {len(months)} month{'s' if len(months) > 1 else ''}\n"]
+    for (year, month), (expenses, income) in zip(months, periods):
+        filled = round(expenses / most_spent * BAR_WIDTH) if most_spent else 0
+        bar = "█" * filled + "░" * (BAR_WIDTH - filled)
+        label = datetime(year, month, 1).strftime("%b %Y")
+        blocks.append(f"\n{label} {bar} ${format_cents(expenses)} spent, ${format_cents(income)} income")
+
+    total_expenses = sum(expenses for expenses, _ in periods)
+    total_income = sum(income for _, income in periods)
+    blocks.append(
+        f"\n\n💸 Average Spent: ${format_cents(total_expenses // len(periods))} per month"
+        f"\n💰 Total: ${format_cents(total_expenses)} spent, ${format_cents(total_income)} income"
+        f"\n📊 Net: ||{_signed_money(total_income - total_expenses)}||"
+    )
+    return split_messages(blocks)
+
+def render_range(totals, start_date, end_date, category=None):
+    """Render /range from {category: (expenses, income, expense count)} in cents.
+
+    end_date is exclusive, the message shows the inclusive last day.
+    """
+    first_day = datetime.strptime(start_date, "%Y-%m-%d").strftime("%d/%m/%Y")
+    last_day = (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=1)).strftime("%d/%m/%Y")
+    header = escape_markdown_v2(f"{first_day} to {last_day}")
+
+    if category is not None:
+        expenses, income, count = totals.get(category, (0, 0, 0))
+        text = (
+            f"\n📅 {escape_markdown_v2(category)}: {header}\n"
+            f"\n💸 Spent: ${format_cents(expenses)} in {count} expense{'' if count == 1 else 's'}"
+        )
+        if income:
+            text += f"\n💰 Income: ${format_cents(income)}"
+        return [text]
+
+    total_expenses = sum(expenses for expenses, _, _ in totals.values())
+    total_income = sum(income for _, income, _ in totals.values())
+    blocks = [f"\n📅 Totals: {header}\n\n💹 Category Breakdown:"]
+    spending = sorted(
+        ((expenses, count, name) for name, (expenses, _, count) in totals.items() if expenses),
+        key=lambda item: (-item[0], item[2]),
+    )
+    for expenses, count, name in spending:
+        percentage = f"{expenses / total_expenses * 100:.1f}".replace(".", "\\.")
+        blocks.append(
+            f"\n🏷️ {escape_markdown_v2(name)}: ${format_cents(expenses)} \\({percentage}%\\), "
+            f"{count} expense{'' if count == 1 else 's'}"
+        )
+    if not spending:
+        blocks.append("\nNo expenses")
+    blocks.append(
+        f"\n\n💸 Total Expenses: ${format_cents(total_expenses)}"
+        f"\n💰 Income: ${format_cents(total_income)}"
+        f"\n📊 Net: ||{_signed_money(total_income - total_expenses)}||"
+    )
+    return split_messages(blocks)
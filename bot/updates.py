@@ -0,0 +1,56 @@
+"""
+Update Processing
+
+This module controls how the Application runs handlers. Updates from
+different chats are processed concurrently, up to MAX_CONCURRENT_UPDATES
+at a time, while updates from the same chat are processed one at a time in
+arrival order, so two quick /add commands from one user still apply in
+sequence.
+
+An update only takes one of the MAX_CONCURRENT_UPDATES slots once it holds
+its chat's lock, so updates queued behind a busy chat never keep other
+chats waiting.
+"""
+
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import MAX_CONCURRENT_UPDATES
+
+# BaseUpdateProcessor.process_update() holds a slot of its own semaphore
+# while an update waits for its chat, so that limit is set out of reach
+# and the real one is applied after the chat lock
+_UNLIMITED = 2 ** 31 - 1
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates must be a positive integer")
+        super().__init__(_UNLIMITED)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # chat id -> [lock, number of updates holding or waiting for it]
+        self._chat_locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._chat_locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            # Drop the lock once the chat is idle so the map stays small
+            if entry[1] == 0:
+                del self._chat_locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._chat_locks.clear()
@@ -0,0 +1,198 @@
+"""
+Per-User State
+
+Each allowed Telegram user has their own ledger. A UserState holds what the
+handlers need for one user: the balance, the LedgerCache, the monthly
+Budgets and a database view scoped to that user.
+
+- State is loaded lazily, the first time a user sends a command, or ahead
+  of time by preload(), which main.py runs in the background at startup so
+  the bot accepts updates before any ledger is read
+- UserStateCache keeps at most MAX_CACHED_USERS states in memory and evicts
+  the least recently active user beyond that, so memory stays bounded no
+  matter how many users the allow-list holds; an evicted user is simply
+  loaded again on their next command
+- version changes whenever the user's ledger or balance may have changed;
+  month_versions records, per (year, month), the version of the last
+  change to transactions dated in that month. Cached /monthly and /report
+  output (bot/cache.py) is keyed on version_between() of the dates it
+  covers, so an /add today leaves last month's cached output valid
+"""
+
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from config import BALANCE_SNAPSHOT_INTERVAL, MAX_CACHED_USERS, LEGACY_USER_ID
+from database.async_database import async_db
+from database.journal import write_behind
+from bot.ledger import LedgerCache, EPOCH, to_epoch
+from bot.budgets import Budgets
+
+logger = logging.getLogger(__name__)
+
+# Versions are unique across users and reloads, so a version is never
+# reused for different data (e.g. after a user is evicted and reloaded)
+_versions = itertools.count(1)
+
+def _month(epoch):
+    """(year, month) of epoch microseconds"""
+    moment = EPOCH + timedelta(microseconds=epoch)
+    return moment.year, moment.month
+
+class UserState:
+    def __init__(self, user_id, database, write_behind):
+        self.user_id = user_id
+        self.db = database
+        self.write_behind = write_behind
+        self.starting_balance = None
+        self.current_balance = None
+        self.ledger = LedgerCache()
+        self.budgets = Budgets()
+        # Transactions recorded since the last balance snapshot was written
+        self.transactions_since_snapshot = 0
+        self.version = next(_versions)
+        # Version of the last change that may affect every month
+        self.base_version = self.version
+        # (year, month) -> version of the last change to that month's transactions
+        self.month_versions = {}
+
+    def bump_version(self, transactions=None):
+        """Mark the ledger or balance as changed.
+
+        With transactions, only the months they are dated in changed.
+        """
+        self.version = next(_versions)
+        if transactions is None:
+            self.base_version = self.version
+            self.month_versions.clear()
+            return
+        for transaction in transactions:
+            self.month_versions[_month(to_epoch(transaction['date']))] = self.version
+
+    def version_between(self, start_date=None, end_date=None):
+        """Version of the transactions with start_date <= date < end_date"""
+        first = None if start_date is None else _month(to_epoch(start_date))
+        last = None if end_date is None else _month(to_epoch(end_date) - 1)
+        return max([self.base_version] + [
+            version for month, version in self.month_versions.items()
+            if (first is None or month >= first) and (last is None or month <= last)
+        ])
+
+    async def load(self):
+        """Load the ledger, budgets and balance from the database"""
+        await self.ledger.load(self.db)
+        self.budgets.seed(self.ledger, await self.db.get_budgets())
+
+        self.starting_balance = await self.db.get_starting_balance()
+        if self.starting_balance is not None:
+            # The database keeps the current balance, no need to sum history
+            self.current_balance = await self.db.get_latest_balance()
+            if self.current_balance is None:
+                self.current_balance = self.starting_balance
+            # Journaled transactions not flushed yet are newer than any checkpoint
+            pending = [
+                transaction for transaction in self.write_behind.pending_transactions()
+                if transaction.get('user_id', LEGACY_USER_ID) == self.user_id
+            ]
+            if pending:
+                self.current_balance = pending[-1]['running_balance']
+            # Budgets count them now, they reach the ledger once flushed
+            for transaction in pending:
+                self.budgets.record(transaction)
+        else:
+            self.current_balance = None
+
+    async def snapshot_balance(self, transaction_id, count=1, force=False, balance=None):
+        """Write a balance snapshot every BALANCE_SNAPSHOT_INTERVAL transactions"""
+        self.transactions_since_snapshot += count
+        if force or self.transactions_since_snapshot >= BALANCE_SNAPSHOT_INTERVAL:
+            await self.db.add_balance_snapshot(
+                transaction_id, self.current_balance if balance is None else balance
+            )
+            self.transactions_since_snapshot = 0
+
+    async def record_flushed(self, rows):
+        """Add write-behind transactions to the ledger once they are stored"""
+        for transaction in rows:
+            self.ledger.append(transaction)
+        self.bump_version(rows)
+        # Newer /add calls may still be queued, so snapshot the flushed row's balance
+        await self.snapshot_balance(rows[-1]['id'], len(rows), balance=rows[-1]['running_balance'])
+
+    async def sync_ledger(self):
+        """Pull transactions added outside /add (e.g. imports) into the ledger.
+
+        Returns the budget warning thresholds the new rows crossed, as
+        returned by Budgets.record().
+        """
+        # Flush first so stored write-behind rows are not counted twice
+        await self.write_behind.flush()
+        new_rows = await self.ledger.sync(self.db)
+        self.bump_version(new_rows)
+        if self.current_balance is not None and new_rows:
+            # The database advanced the balance while storing the rows
+            self.current_balance = await self.db.get_latest_balance()
+            await self.snapshot_balance(self.ledger.last_id, len(new_rows), force=True)
+        return [crossing for transaction in new_rows for crossing in self.budgets.record(transaction)]
+
+class UserStateCache:
+    def __init__(self, database, write_behind, max_users=MAX_CACHED_USERS):
+        self.database = database
+        self.write_behind = write_behind
+        self.max_users = max_users
+        self._states = OrderedDict()
+        # user_id -> task loading that user's state, shared by concurrent callers
+        self._loading = {}
+
+    def __len__(self):
+        return len(self._states)
+
+    def resident(self):
+        """States currently in memory, least recently active first"""
+        return list(self._states.values())
+
+    def peek(self, user_id):
+        """Resident state of a user, without loading it or marking it used"""
+        return self._states.get(user_id)
+
+    async def get(self, user_id):
+        """State of a user, loaded on first use"""
+        state = self._states.get(user_id)
+        if state is not None:
+            self._states.move_to_end(user_id)
+            return state
+
+        task = self._loading.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, user_id):
+        state = UserState(user_id, self.database.for_user(user_id), self.write_behind)
+        await state.load()
+        self._states[user_id] = state
+        while len(self._states) > self.max_users:
+            self._states.popitem(last=False)
+        return state
+
+    async def preload(self, user_ids):
+        """Load the states of up to max_users users, one at a time.
+
+        A command from a user still being loaded waits for the same load.
+        """
+        for user_id in list(user_ids)[:self.max_users]:
+            try:
+                await self.get(user_id)
+            except Exception:
+                # The user's next command retries the load
+                logger.exception("Preloading state of user %s failed", user_id)
+
+    def evict(self, user_id):
+        self._states.pop(user_id, None)
+
+# Create a singleton instance
+users = UserStateCache(async_db, write_behind)
@@ -1,71 +1,285 @@
-from openpyxl import load_workbook
-import pandas as pd
+import hashlib
 from datetime import datetime
 from decimal import Decimal
+from telegram.error import TelegramError
+from config import IMPORT_CHUNK_SIZE
+from bot.workers import worker_pool
+from database.base import content_hashes
 
 REQUIRED_COLUMNS = ['date', 'amount', 'category', 'description', 'running_balance', 'created_at']
 VALID_CATEGORIES = ['Food', 'Transport', 'Shopping', 'Entertainment', 'Bills', 'Health', 'Income', 'Others']
+IMPORT_EXTENSIONS = ('.xlsx', '.csv')
+# Failure lines shown after an import, so the reply fits in one message
+MAX_LISTED_FAILURES = 20
 
 def validate_import_data(df):
-    errors = []
-    
-    # Check required columns
-    missing_cols = set(REQUIRED_COLUMNS) - set(df.columns)
+    """Validate an import DataFrame, parsing its date columns in place.
+
+    Returns (errors, row_errors): errors describe problems with the whole
+    chunk (missing columns), row_errors maps the index of every invalid row
+    to the reasons it is rejected.
+    """
+    import pandas as pd
+
+    # Check required columns, the checks below need all of them
+    missing_cols = [column for column in REQUIRED_COLUMNS if column not in df.columns]
     if missing_cols:
-        errors.append(f"Missing required columns: {', '.join(missing_cols)}")
-    
-    # Validate dates (both date and created_at)
+        return [f"Missing required columns: {', '.join(missing_cols)}"], {}
+
+    # Dates (both date and created_at) may be any ISO 8601 shape, with or
+    # without fractions and offsets; naive values are UTC
+    dates = pd.to_datetime(df['date'], format='ISO8601', utc=True, errors='coerce')
+    created_at = pd.to_datetime(df['created_at'], format='ISO8601', utc=True, errors='coerce')
+    # An empty created_at is filled in by the database
+    has_created_at = df['created_at'].notna() & (df['created_at'].astype(str).str.strip() != '')
+    checks = [
+        (dates.isna(), "invalid or missing date"),
+        (created_at.isna() & has_created_at, "invalid created_at"),
+        (pd.to_numeric(df['amount'], errors='coerce').isna(), "invalid amount"),
+        (pd.to_numeric(df['running_balance'], errors='coerce').isna(), "invalid running_balance"),
+    ]
+    df['date'], df['created_at'] = dates, created_at
+
+    row_errors = {}
+    for invalid, reason in checks:
+        for index in df.index[invalid]:
+            row_errors.setdefault(index, []).append(reason)
+    for index in df.index[~df['category'].isin(VALID_CATEGORIES)]:
+        row_errors.setdefault(index, []).append(f"invalid category {df.at[index, 'category']}")
+    return [], {index: "; ".join(reasons) for index, reasons in row_errors.items()}
+
+def build_import_payload(df):
+    """Convert a validated import DataFrame into a list of transaction dicts"""
+    import pandas as pd
+
+    # Dates are UTC after validation, written the way the backends return them
+    payload = pd.DataFrame({
+        "date": df['date'].dt.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00'),
+        "amount": pd.to_numeric(df['amount']).astype(float),
+        "category": df['category'],
+        "description": df['description'].astype(object).where(df['description'].notna(), None),
+        "running_balance": pd.to_numeric(df['running_balance']).astype(float),
+        # A missing created_at is filled in by the database
+        "created_at": df['created_at'].dt.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00').astype(object)
+                      .where(df['created_at'].notna(), None)
+    })
+    return payload.to_dict('records')
+
+async def _update_progress(status_message, text):
+    if status_message is None:
+        return
     try:
-        df['date'] = pd.to_datetime(df['date'])
-        df['created_at'] = pd.to_datetime(df['created_at'])
-    except Exception:
-        errors.append("Invalid date format in 'date' or 'created_at' columns")
-    
-    # Validate amounts and running_balance
-    if pd.to_numeric(df['amount'], errors='coerce').isna().any():
-        errors.append("Invalid amount values found")
-    if pd.to_numeric(df['running_balance'], errors='coerce').isna().any():
-        errors.append("Invalid running_balance values found")
-    
-    # Validate categories
-    invalid_categories = set(df['category']) - set(VALID_CATEGORIES)
-    if invalid_categories:
-        errors.append(f"Invalid categories found: {', '.join(invalid_categories)}")
-    
-    return errors
-
-async def process_excel_import(file_path, db):
+        await status_message.edit_text(text)
+    except TelegramError:
+        # Progress updates are best effort (e.g. flood control)
+        pass
+
+def file_sha256(file_path):
+    """SHA-256 of a file's bytes, identifies an import file across retries"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _xlsx_frames(file_path, chunk_size):
+    """Yield (sheet, row_numbers, DataFrame) chunks of every sheet of a workbook.
+
+    The workbook is opened read-only, so openpyxl streams rows from the
+    file instead of building every cell in memory. Each sheet's first row
+    is its header, empty sheets and blank rows are skipped.
+    """
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
     try:
-        # Read Excel file
-        df = pd.read_excel(file_path)
-        
-        # Basic validation
-        errors = validate_import_data(df)
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = [str(value).strip() if value is not None else '' for value in header]
+            chunk, row_numbers = [], []
+            for row_number, row in enumerate(rows, start=2):
+                if all(value is None for value in row):
+                    continue
+                # Read-only rows can be shorter or longer than the header
+                chunk.append((tuple(row) + (None,) * len(columns))[:len(columns)])
+                row_numbers.append(row_number)
+                if len(chunk) == chunk_size:
+                    yield sheet.title, row_numbers, pd.DataFrame(chunk, columns=columns)
+                    chunk, row_numbers = [], []
+            if chunk:
+                yield sheet.title, row_numbers, pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+def _csv_frames(file_path, chunk_size):
+    """Yield (None, row_numbers, DataFrame) chunks of a CSV file"""
+    import pandas as pd
+
+    first_row = 2
+    with pd.read_csv(file_path, chunksize=chunk_size, skipinitialspace=True) as reader:
+        for df in reader:
+            df.columns = [str(column).strip() for column in df.columns]
+            yield None, list(range(first_row, first_row + len(df))), df.reset_index(drop=True)
+            first_row += len(df)
+
+def _group_failures(row_numbers, reasons):
+    """(first row, last row, reason) for each run of consecutive file rows
+    rejected for the same reason"""
+    groups = []
+    for row_number, reason in zip(row_numbers, reasons):
+        if groups and groups[-1][2] == reason and groups[-1][1] == row_number - 1:
+            groups[-1] = (groups[-1][0], row_number, reason)
+        else:
+            groups.append((row_number, row_number, reason))
+    return groups
+
+def read_import_chunks(file_path, chunk_size=IMPORT_CHUNK_SIZE):
+    """Read, validate and hash an import file chunk by chunk, runs in a
+    worker process through worker_pool.stream().
+
+    Yields one dict per chunk of at most chunk_size rows, in file order:
+    sheet (None for CSV), read (rows in the chunk), failures (first row,
+    last row, reason) for the rows that were rejected, transactions (the
+    valid rows with their content_hash) and rows (the file row number of
+    each transaction).
+
+    Transactions are stored in the order they are yielded and each one's
+    running balance follows from the ones before it, so every chunk is
+    sorted by date (stable, so rows with the same date keep their file
+    order). Rows dated before a row of an earlier chunk cannot be stored in
+    order any more and are rejected; a file sorted oldest first, like
+    /report output, never has any.
+
+    Identical rows are numbered among the neighbouring rows with the same
+    date, which keeps memory flat; once sorted that covers every repeat.
+    """
+    frames = _csv_frames if file_path.lower().endswith('.csv') else _xlsx_frames
+    occurrences = {}
+    last_date = None
+    # Latest date yielded so far
+    latest = None
+    for sheet, row_numbers, df in frames(file_path, chunk_size):
+        chunk = {"sheet": sheet, "read": len(df), "failures": [], "transactions": [], "rows": []}
+        errors, row_errors = validate_import_data(df)
         if errors:
-            return False, "\n".join(errors)
-        
-        # Sort by date
-        df = df.sort_values('date')
-        
+            chunk["failures"] = [(row_numbers[0], row_numbers[-1], "; ".join(errors))]
+            yield chunk
+            continue
+        if latest is not None:
+            for index in df.index[df['date'] < latest]:
+                row_errors.setdefault(index, "dated before rows earlier in the file, sort the file oldest first")
+        if row_errors:
+            invalid = sorted(row_errors)
+            chunk["failures"] = _group_failures(
+                [row_numbers[index] for index in invalid], [row_errors[index] for index in invalid]
+            )
+            valid = ~df.index.isin(list(row_errors))
+            row_numbers = [row_number for row_number, keep in zip(row_numbers, valid) if keep]
+            df = df[valid]
+        order = df['date'].argsort(kind='stable')
+        df, row_numbers = df.iloc[order], [row_numbers[position] for position in order]
+        if len(df):
+            # Never earlier than before, older rows were rejected above
+            latest = df['date'].iloc[-1]
+        transactions = build_import_payload(df)
+        for transaction in transactions:
+            if transaction['date'] != last_date:
+                last_date = transaction['date']
+                occurrences.clear()
+            transaction['content_hash'] = content_hashes([transaction], occurrences)[0]
+        chunk["transactions"], chunk["rows"] = transactions, row_numbers
+        yield chunk
+
+def _describe_rows(sheet, first, last):
+    """Location of file rows first to last"""
+    location = f"row {first}" if first == last else f"rows {first}-{last}"
+    return f"sheet '{sheet}' {location}" if sheet else location
+
+async def process_excel_import(file_path, db, status_message=None):
+    """Import an .xlsx (every sheet) or .csv file in chunks.
+
+    Parsing and validation run in a worker process one chunk ahead of the
+    inserts, so memory stays flat however large the file is. Invalid rows
+    are reported by their file row numbers and skipped; rows already
+    recorded are skipped by their content hash. A retried file resumes
+    after the last stored batch.
+    """
+    try:
+        # A retried file resumes after the rows an earlier attempt stored
+        file_hash = await worker_pool.run(file_sha256, file_path)
+        session = await db.get_import_session(file_hash)
+        resume_from = session['committed_rows'] if session else 0
+        # total_rows is 0 until a whole file has been read and stored
+        if session and session['total_rows'] and resume_from >= session['total_rows']:
+            return True, f"This file was already imported ({session['total_rows']} transactions), nothing to add"
+
+        # Data rows read from the file, and valid transactions among them
+        total = 0
+        transaction_count = 0
         successful_imports = 0
-        
-        for _, row in df.iterrows():
-            # Convert row data to match database schema
-            transaction = {
-                "date": row['date'].isoformat(),
-                "amount": float(row['amount']),
-                "category": row['category'],
-                "description": row['description'],
-                "running_balance": float(row['running_balance']),
-                "created_at": row['created_at'].isoformat()
-            }
-            
-            # Add transaction to database
-            result = db.client.table('transactions').insert(transaction).execute()
-            if result.data:
-                successful_imports += 1
-        
-        return True, f"Successfully imported {successful_imports} transactions"
-        
+        duplicates = 0
+        failures = []
+        # Transactions [0, committed) of the file, in import order, are known to be stored
+        committed = resume_from
+
+        async for chunk in worker_pool.stream(read_import_chunks, file_path):
+            total += chunk['read']
+            failures.extend(
+                f"• {_describe_rows(chunk['sheet'], first, last)}: {reason}"
+                for first, last, reason in chunk['failures']
+            )
+
+            transactions, rows = chunk['transactions'], chunk['rows']
+            offset = transaction_count
+            transaction_count += len(transactions)
+            skip = min(len(transactions), max(0, resume_from - offset))
+            async for start, end, stored, error in db.bulk_insert_transactions(transactions[skip:]):
+                start, end = start + skip, end + skip
+                if error is None:
+                    successful_imports += stored
+                    duplicates += end - start - stored
+                    if offset + start == committed:
+                        committed = offset + end
+                        # Saved after the batch commits: if saving fails the
+                        # batch is re-sent on retry and its rows are skipped
+                        await db.save_import_session(file_hash, 0, committed)
+                else:
+                    first_date = transactions[start]['date'][:10]
+                    last_date = transactions[end - 1]['date'][:10]
+                    location = _describe_rows(chunk['sheet'], min(rows[start:end]), max(rows[start:end]))
+                    failures.append(f"• {location} ({first_date} to {last_date}): {error}")
+            await _update_progress(
+                status_message,
+                f"📊 Processing your file... {total} rows"
+            )
+
+        # A file with rejected rows stays open, so sending it again lists them again
+        await db.save_import_session(file_hash, 0 if failures else transaction_count, committed)
+        if total == 0:
+            return False, "The file has no transactions"
+
+        details = ""
+        if duplicates:
+            details += f", skipped {duplicates} already recorded"
+        if resume_from:
+            details += f" (resumed, an earlier attempt stored the first {resume_from})"
+
+        if failures:
+            listed = failures[:MAX_LISTED_FAILURES]
+            if len(failures) > len(listed):
+                listed.append(f"…and {len(failures) - len(listed)} more")
+            return False, (
+                f"Imported {successful_imports} of {total} transactions{details}.\n"
+                "These rows were not imported:\n"
+                + "\n".join(listed)
+                + "\nFix them and send the file again, stored rows are not imported twice."
+            )
+
+        return True, f"Successfully imported {successful_imports} transactions{details}"
+
     except Exception as e:
-        return False, f"Error processing file: {str(e)}" 
\ No newline at end of file
+        return False, f"Error processing file: {str(e)}"
@@ -0,0 +1,75 @@
+"""
+Webhook Server
+
+In webhook mode (BOT_MODE=webhook) Telegram pushes updates to the bot
+instead of the bot polling for them. The updates are received by a
+Starlette app served with uvicorn:
+
+- POST WEBHOOK_PATH: an update from Telegram, checked against
+  WEBHOOK_SECRET and queued for the Application
+- GET /healthz: liveness check
+- GET /metrics: the same Prometheus metrics as METRICS_PORT
+
+run_webhook() takes the place of Application.run_polling(), including the
+post_init and post_shutdown callbacks that only run_polling() calls.
+"""
+
+import logging
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from telegram import Update
+from telegram.ext import Application
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET
+from bot.metrics import metrics_endpoint
+
+logger = logging.getLogger(__name__)
+
+def create_webhook_app(application: Application, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+    async def telegram_update(request: Request) -> Response:
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return Response(status_code=403)
+        update = Update.de_json(await request.json(), application.bot)
+        await application.update_queue.put(update)
+        return Response()
+
+    async def healthz(request: Request) -> Response:
+        return PlainTextResponse("ok")
+
+    return Starlette(routes=[
+        Route(path, telegram_update, methods=["POST"]),
+        Route("/healthz", healthz),
+        Route("/metrics", metrics_endpoint),
+    ])
+
+async def run_webhook(application: Application, url=WEBHOOK_URL, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    import uvicorn
+
+    if not url:
+        raise ValueError("WEBHOOK_URL is required in webhook mode")
+
+    server = uvicorn.Server(uvicorn.Config(
+        create_webhook_app(application), host=host, port=port, log_level="warning", lifespan="off"))
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.bot.set_webhook(
+            url=url.rstrip("/") + WEBHOOK_PATH,
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=WEBHOOK_SECRET or None,
+        )
+        await application.start()
+        logger.info("Receiving updates on %s:%d%s", host, port, WEBHOOK_PATH)
+        # Returns on SIGINT/SIGTERM
+        await server.serve()
+    finally:
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,195 @@
+"""
+Worker Pool
+
+This module runs CPU-heavy work (reading and validating import files,
+building report files, aggregating monthly reports) in a pool of worker
+processes, so it never runs on the bot's event loop thread.
+
+- Functions sent to the pool must be module-level, and their arguments and
+  results must be picklable (plain rows, strings and bytes)
+- Every task has a timeout; a task that overruns or whose caller is
+  cancelled gets its worker processes terminated and the pool recreated,
+  so a bad file cannot tie up a worker forever
+- Other tasks that were running in a pool terminated that way are run
+  again on the new one (a stream only if it has not yielded anything yet);
+  a task whose worker died on its own, or was terminated twice, fails with
+  WorkerCrashedError
+- stream() runs a generator function in a worker and yields its items as
+  they are produced. Items pass through a queue holding at most one item,
+  so the worker stays one item ahead of the caller and memory stays flat
+  however many items there are; the timeout applies to each item
+"""
+
+import asyncio
+import multiprocessing
+import queue
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from config import WORKER_PROCESSES, WORKER_TIMEOUT
+
+# Seconds between checks that a stream's worker is still alive
+POLL_INTERVAL = 1.0
+
+class WorkerError(Exception):
+    """A task sent to the worker pool did not complete"""
+
+class WorkerTimeoutError(WorkerError):
+    pass
+
+class WorkerCrashedError(WorkerError):
+    pass
+
+def _broken(future):
+    """Whether a task failed because its pool lost its worker processes"""
+    return future.done() and not future.cancelled() and isinstance(future.exception(), BrokenProcessPool)
+
+def _send(items, stop, message):
+    """Put message on the queue, unless the consumer stopped listening"""
+    while not stop.is_set():
+        try:
+            items.put(message, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _produce(items, stop, func, *args, **kwargs):
+    """Worker side of WorkerPool.stream(), sends func's items through the queue"""
+    try:
+        for item in func(*args, **kwargs):
+            if not _send(items, stop, ('item', item)):
+                return
+    except Exception as e:
+        _send(items, stop, ('error', e))
+    else:
+        _send(items, stop, ('done', None))
+
+class WorkerPool:
+    def __init__(self, max_workers=WORKER_PROCESSES, timeout=WORKER_TIMEOUT):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = None
+        self._manager = None
+        # Pools killed by _terminate(), whose other tasks are safe to rerun
+        self._terminated = weakref.WeakSet()
+
+    def _get_executor(self):
+        # Created lazily, spawn keeps the workers free of the bot's threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _get_manager(self):
+        # Only streaming tasks need one, its queues can be passed to workers
+        if self._manager is None:
+            self._manager = multiprocessing.get_context("spawn").Manager()
+        return self._manager
+
+    def _submit(self, task):
+        """Submit a task, returns (executor, future)"""
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(task)
+        except BrokenProcessPool:
+            # A worker died since the last task, start a fresh pool
+            self._discard(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(task)
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """Run func(*args, **kwargs) in a worker process and await its result"""
+        timeout = self.timeout if timeout is None else timeout
+        task = partial(func, *args, **kwargs)
+        for _ in range(2):
+            executor, future = self._submit(task)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except asyncio.TimeoutError:
+                self._terminate(executor)
+                raise WorkerTimeoutError(f"Task took longer than {timeout:g}s and was stopped")
+            except asyncio.CancelledError:
+                # A pending task is simply dropped, a running one has to be killed
+                if not future.cancel():
+                    self._terminate(executor)
+                raise
+            except BrokenProcessPool:
+                self._discard(executor)
+                # Rerun tasks that were only collateral of another task's
+                # timeout; if a worker died by itself this task may be why
+                if executor not in self._terminated:
+                    break
+        raise WorkerCrashedError("The worker process stopped unexpectedly")
+
+    async def stream(self, func, *args, timeout=None, **kwargs):
+        """Run the generator function func(*args, **kwargs) in a worker
+        process and yield its items"""
+        timeout = self.timeout if timeout is None else timeout
+        manager = self._get_manager()
+        loop = asyncio.get_running_loop()
+        attempts = 0
+        yielded = False
+        stop = None
+        try:
+            while True:
+                if stop is None:
+                    # A fresh queue per attempt, so nothing from a lost worker is read
+                    attempts += 1
+                    items, stop = manager.Queue(maxsize=1), manager.Event()
+                    executor, future = self._submit(partial(_produce, items, stop, func, *args, **kwargs))
+                    deadline = loop.time() + timeout
+                try:
+                    kind, value = await loop.run_in_executor(
+                        None, partial(items.get, True, min(POLL_INTERVAL, timeout))
+                    )
+                except queue.Empty:
+                    if _broken(future):
+                        self._discard(executor)
+                        if yielded or attempts > 1 or executor not in self._terminated:
+                            raise WorkerCrashedError("The worker process stopped unexpectedly")
+                        # Nothing was yielded yet, so the stream can start over
+                        stop = None
+                    elif loop.time() >= deadline:
+                        self._terminate(executor)
+                        raise WorkerTimeoutError(f"No result for {timeout:g}s, the task was stopped")
+                    continue
+                if kind == 'done':
+                    return
+                if kind == 'error':
+                    raise value
+                yielded = True
+                deadline = loop.time() + timeout
+                yield value
+        finally:
+            # Lets the worker go if the caller stopped early
+            if stop is not None:
+                stop.set()
+
+    def _discard(self, executor):
+        """Stop using a pool, the next task starts a fresh one"""
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False)
+
+    def _terminate(self, executor):
+        """Kill a pool's worker processes, its other tasks fail with
+        BrokenProcessPool and are run again on a fresh pool"""
+        self._terminated.add(executor)
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        self._discard(executor)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+# Create a singleton instance
+worker_pool = WorkerPool()
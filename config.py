@@ -4,8 +4,18 @@ import os
 # Load environment variables
 load_dotenv()
 
-# Bot configuration
-ALLOWED_USER_ID = int(os.getenv("ALLOWED_USER_ID"))
+# Bot configuration: ALLOWED_USER_IDS is a comma separated allow-list,
+# a single ALLOWED_USER_ID is still accepted
+_allowed_user_ids = [
+    int(user_id)
+    for user_id in os.getenv("ALLOWED_USER_IDS", os.getenv("ALLOWED_USER_ID", "")).split(",")
+    if user_id.strip()
+]
+ALLOWED_USER_IDS = frozenset(_allowed_user_ids)
+# Owner of rows stored before ledgers were kept per user
+LEGACY_USER_ID = _allowed_user_ids[0] if _allowed_user_ids else None
+# Users whose ledger stays in memory, the least recently active are evicted
+MAX_CACHED_USERS = int(os.getenv("MAX_CACHED_USERS", "100"))
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_API_TOKEN")
 
 # Database configuration
@@ -13,4 +23,79 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
 # File configuration
-REPORT_FILE_NAME = "budget_tracker.xlsx"
\ No newline at end of file
+REPORT_FILE_NAME = "budget_tracker.xlsx"
+
+# Import configuration
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Rows read and validated at a time, an import never holds more than two chunks
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+
+# Database executor configuration
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+TRANSACTIONS_PAGE_SIZE = int(os.getenv("TRANSACTIONS_PAGE_SIZE", "1000"))
+
+# Balance checkpoint configuration
+BALANCE_SNAPSHOT_INTERVAL = int(os.getenv("BALANCE_SNAPSHOT_INTERVAL", "100"))
+
+# Worker pool configuration (CPU-heavy report and import work)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+WORKER_TIMEOUT = float(os.getenv("WORKER_TIMEOUT", "120"))
+
+# Monthly report configuration: months with more expenses than
+# MONTHLY_DETAIL_LIMIT only list the top MONTHLY_TOP_N per category
+MONTHLY_DETAIL_LIMIT = int(os.getenv("MONTHLY_DETAIL_LIMIT", "100"))
+MONTHLY_TOP_N = int(os.getenv("MONTHLY_TOP_N", "10"))
+
+# Months shown by /trend when no number is given
+TREND_MONTHS = int(os.getenv("TREND_MONTHS", "6"))
+
+# Budget warnings are sent at this percentage of a limit and at 100%
+BUDGET_WARNING_PERCENT = int(os.getenv("BUDGET_WARNING_PERCENT", "80"))
+
+# Results per /search page
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+
+# Response cache for /monthly and /report output, bounded by entries and bytes
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "128"))
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# Scheduled jobs, times are HH:MM in UTC and an empty value disables a job:
+# the previous month's /monthly summary and report are prepared on the 1st,
+# balance snapshots are written nightly
+JOB_MONTHLY_SUMMARY_TIME = os.getenv("JOB_MONTHLY_SUMMARY_TIME", "00:05")
+JOB_MONTHLY_REPORT_TIME = os.getenv("JOB_MONTHLY_REPORT_TIME", "00:15")
+JOB_BALANCE_SNAPSHOT_TIME = os.getenv("JOB_BALANCE_SNAPSHOT_TIME", "03:00")
+# Format of the report files prepared ahead of time
+JOB_REPORT_FORMAT = os.getenv("JOB_REPORT_FORMAT", "xlsx")
+
+# Storage backend: "supabase" or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "budget_tracker.db")
+
+# Write-behind mode: /add replies after a local fsynced journal write and
+# a background task flushes batches to the database
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "false").lower() == "true"
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "transactions.journal")
+# Flushed lines the journal may hold before it is compacted
+JOURNAL_COMPACT_LINES = int(os.getenv("JOURNAL_COMPACT_LINES", "10000"))
+# Transactions the database rejected permanently, kept for manual recovery
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "transactions.dead")
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "1.0"))
+FLUSH_BATCH_SIZE = int(os.getenv("FLUSH_BATCH_SIZE", "100"))
+
+# Observability: Prometheus metrics endpoint (disabled when METRICS_PORT
+# is 0) and slow query log threshold
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+# How updates are received: "polling" (default) or "webhook", served by
+# uvicorn on WEBHOOK_HOST:WEBHOOK_PORT and registered with Telegram at
+# WEBHOOK_URL + WEBHOOK_PATH
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8000"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "16"))
@@ -0,0 +1,11 @@
+from config import STORAGE_BACKEND
+
+def create_database(backend=STORAGE_BACKEND):
+    """Create the storage backend selected by STORAGE_BACKEND in config.py"""
+    if backend == "supabase":
+        from database.supabase import Database
+        return Database()
+    if backend == "sqlite":
+        from database.sqlite import SQLiteDatabase
+        return SQLiteDatabase()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,107 @@
+"""
+Async Database Interface
+
+This module exposes the Database operations to the async bot handlers
+without blocking the asyncio event loop. Every call is dispatched to a
+shared thread pool, so a slow query only occupies one worker thread while
+the Application keeps processing other updates.
+
+The wrapped storage backend is created once: the Supabase backend keeps a
+single client whose HTTP session pools connections, so all worker threads
+reuse the same open connections instead of reconnecting per query, and the
+SQLite backend keeps one connection per worker thread. for_user() views
+share both the executor and the backend's connections.
+"""
+
+import asyncio
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from config import DB_EXECUTOR_WORKERS, IMPORT_BATCH_SIZE, TRANSACTIONS_PAGE_SIZE
+from database import create_database
+
+_EXHAUSTED = object()
+
+class AsyncDatabase:
+    def __init__(self, database, max_workers=DB_EXECUTOR_WORKERS):
+        self.database = database
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    def for_user(self, user_id):
+        """AsyncDatabase over one user's rows, sharing this executor"""
+        scoped = copy.copy(self)
+        scoped.database = self.database.for_user(user_id)
+        return scoped
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def _iterate(self, iterator):
+        """Drive a blocking iterator from the executor, one item at a time"""
+        while True:
+            item = await self._run(next, iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                return
+            yield item
+
+    async def get_starting_balance(self):
+        return await self._run(self.database.get_starting_balance)
+
+    async def update_starting_balance(self, amount):
+        return await self._run(self.database.update_starting_balance, amount)
+
+    async def get_latest_balance(self):
+        return await self._run(self.database.get_latest_balance)
+
+    async def add_balance_snapshot(self, transaction_id, balance):
+        return await self._run(self.database.add_balance_snapshot, transaction_id, balance)
+
+    async def get_balance_snapshots(self):
+        return await self._run(self.database.get_balance_snapshots)
+
+    async def record_transaction(self, amount, category, description):
+        return await self._run(self.database.record_transaction, amount, category, description)
+
+    async def record_transactions(self, transactions):
+        return await self._run(self.database.record_transactions, transactions)
+
+    def bulk_insert_transactions(self, transactions, batch_size=IMPORT_BATCH_SIZE):
+        return self._iterate(self.database.bulk_insert_transactions(transactions, batch_size))
+
+    async def get_budgets(self):
+        return await self._run(self.database.get_budgets)
+
+    async def set_budget(self, category, amount):
+        return await self._run(self.database.set_budget, category, amount)
+
+    async def get_import_session(self, file_hash):
+        return await self._run(self.database.get_import_session, file_hash)
+
+    async def save_import_session(self, file_hash, total_rows, committed_rows):
+        return await self._run(self.database.save_import_session, file_hash, total_rows, committed_rows)
+
+    async def get_transactions_page(self, cursor=None, page_size=TRANSACTIONS_PAGE_SIZE, descending=True,
+                                    start_date=None, end_date=None, expenses_only=False):
+        return await self._run(self.database.get_transactions_page, cursor, page_size, descending,
+                               start_date, end_date, expenses_only)
+
+    def iter_transaction_pages(self, page_size=TRANSACTIONS_PAGE_SIZE, descending=True,
+                               start_date=None, end_date=None, expenses_only=False):
+        return self._iterate(self.database.iter_transaction_pages(page_size, descending,
+                                                                  start_date, end_date, expenses_only))
+
+    def iter_transactions_after(self, last_id=None, page_size=TRANSACTIONS_PAGE_SIZE):
+        return self._iterate(self.database.iter_transactions_after(last_id, page_size))
+
+    async def get_monthly_expenses(self, start_date, end_date):
+        return await self._run(self.database.get_monthly_expenses, start_date, end_date)
+
+    async def get_monthly_rollup(self, year, month):
+        return await self._run(self.database.get_monthly_rollup, year, month)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# Create a singleton instance
+async_db = AsyncDatabase(create_database())
@@ -0,0 +1,200 @@
+"""
+Storage Backend Interface
+
+This module defines the operations every storage backend must provide.
+The bot only talks to storage through this interface (wrapped by
+AsyncDatabase), so backends can be swapped through config.py:
+
+- supabase: remote Postgres through the Supabase API (database/supabase.py)
+- sqlite: local file for self-hosted deployments and network-free
+  testing (database/sqlite.py)
+
+Every method returns plain Python values (floats, dicts and lists of row
+dicts) rather than backend-specific response objects.
+
+Every table is scoped by user_id. A backend is created unscoped and
+for_user() returns a view of one user's ledger that shares the
+underlying client or connections, so all other methods only ever see
+that user's rows.
+
+The balance is owned by the database: a current_balance setting that every
+insert advances in the same database transaction, assigning each row its
+running_balance. Concurrent handlers or several bot processes therefore
+never compute a balance from a stale in-process copy.
+
+Every transaction carries a content_hash of its date, amount, category and
+description, unique per user, and inserts skip rows whose hash is already
+stored. Sending the same rows twice (a re-imported /report file, a retried
+batch, a replayed write-behind journal) therefore stores them once. Rows
+with identical content in one batch or file are told apart by their
+occurrence, so genuine repeats are all kept. Import sessions record how far
+an import file got, so a retried file resumes after the last stored batch.
+
+Monthly budgets are settings too, one budget:<category> key per category.
+"""
+
+import copy
+import hashlib
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from config import IMPORT_BATCH_SIZE, TRANSACTIONS_PAGE_SIZE
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def content_hash(transaction, occurrence=0):
+    """SHA-256 hex digest identifying a transaction by its content.
+
+    The digest covers the date as UTC epoch microseconds, the amount in
+    cents, the category, the description ('' for None) and occurrence, the
+    number of earlier rows with the same content in the same batch or file.
+    Naive dates are taken as UTC.
+    """
+    date = transaction['date']
+    if not isinstance(date, datetime):
+        date = datetime.fromisoformat(str(date))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    micros = (date - EPOCH) // timedelta(microseconds=1)
+    cents = round(float(transaction['amount']) * 100)
+    description = transaction.get('description')
+    key = f"{micros}|{cents}|{transaction['category']}|{'' if description is None else description}|{occurrence}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def content_hashes(transactions, occurrences=None):
+    """content_hash of every transaction, keeping hashes already assigned.
+
+    occurrences maps a row's occurrence-0 hash to how many such rows were
+    seen; pass the same dict to number repeats across several calls.
+    """
+    hashes = []
+    occurrences = {} if occurrences is None else occurrences
+    for transaction in transactions:
+        if transaction.get('content_hash'):
+            hashes.append(transaction['content_hash'])
+            continue
+        base = content_hash(transaction)
+        occurrence = occurrences.get(base, 0)
+        occurrences[base] = occurrence + 1
+        hashes.append(base if occurrence == 0 else content_hash(transaction, occurrence))
+    return hashes
+
+class StorageBackend(ABC):
+    user_id = None
+
+    def for_user(self, user_id):
+        """View of this backend scoped to one user's rows"""
+        scoped = copy.copy(self)
+        scoped.user_id = user_id
+        return scoped
+
+    @abstractmethod
+    def get_starting_balance(self):
+        """Starting balance as a float, or None if it was never set"""
+
+    @abstractmethod
+    def update_starting_balance(self, amount):
+        """Set the starting balance, which also resets the current balance"""
+
+    @abstractmethod
+    def get_latest_balance(self):
+        """Current balance from the database, or None if it was never set"""
+
+    @abstractmethod
+    def add_balance_snapshot(self, transaction_id, balance):
+        pass
+
+    @abstractmethod
+    def get_balance_snapshots(self, page_size=TRANSACTIONS_PAGE_SIZE):
+        """All balance snapshots ordered by transaction_id"""
+
+    @abstractmethod
+    def record_transactions(self, transactions):
+        """Insert transaction dicts and advance the balance atomically.
+
+        Each row's running_balance is assigned by the database from the
+        current balance, any running_balance in the dicts is ignored. Rows
+        are keyed by their content_hash (computed with content_hashes()
+        when missing); rows already stored are skipped and do not move the
+        balance. Returns the newly stored rows in order; the last row's
+        running_balance is the new authoritative balance.
+        """
+
+    def record_transaction(self, amount, category, description):
+        """Insert one transaction dated now, returns the stored row"""
+        now = datetime.now(timezone.utc).isoformat()
+        rows = self.record_transactions([{
+            "date": now,
+            "amount": amount,
+            "category": category,
+            "description": description,
+            "created_at": now
+        }])
+        return rows[0] if rows else None
+
+    @abstractmethod
+    def bulk_insert_transactions(self, transactions, batch_size=IMPORT_BATCH_SIZE):
+        """Record transactions in batches, one round-trip per batch.
+
+        Every batch is recorded like record_transactions(), so a stored
+        batch has also advanced the balance and skipped duplicate rows.
+
+        Yields (start, end, stored, error) for every batch, where start/end
+        is the 0-based half-open range of rows in the batch, stored is the
+        number of new rows inserted and error is None when the batch was
+        stored successfully.
+        """
+
+    @abstractmethod
+    def get_budgets(self):
+        """Monthly spending limits as {category: amount}"""
+
+    @abstractmethod
+    def set_budget(self, category, amount):
+        """Set the monthly spending limit of a category, None removes it"""
+
+    @abstractmethod
+    def get_import_session(self, file_hash):
+        """Progress of the import of a file as a dict with total_rows and
+        committed_rows, or None if the file was never imported"""
+
+    @abstractmethod
+    def save_import_session(self, file_hash, total_rows, committed_rows):
+        """Record that the first committed_rows rows of a file are stored"""
+
+    @abstractmethod
+    def get_transactions_page(self, cursor=None, page_size=TRANSACTIONS_PAGE_SIZE, descending=True,
+                              start_date=None, end_date=None, expenses_only=False):
+        """Fetch one page of transactions ordered by (date, id).
+
+        cursor is the (date, id) of the last row of the previous page, only
+        rows that sort after it are returned.
+        """
+
+    @abstractmethod
+    def iter_transactions_after(self, last_id=None, page_size=TRANSACTIONS_PAGE_SIZE):
+        """Yield pages of transactions with an id greater than last_id, in id order"""
+
+    @abstractmethod
+    def get_monthly_rollup(self, year, month):
+        """Per-category expense totals and counts for one month"""
+
+    def iter_transaction_pages(self, page_size=TRANSACTIONS_PAGE_SIZE, descending=True,
+                               start_date=None, end_date=None, expenses_only=False):
+        """Yield every matching transaction, one page (list of rows) at a time"""
+        cursor = None
+        while True:
+            page = self.get_transactions_page(cursor, page_size, descending,
+                                              start_date, end_date, expenses_only)
+            # Stop on an empty page rather than a short one, a backend (e.g.
+            # PostgREST max-rows) may cap pages below page_size
+            if not page:
+                return
+            yield page
+            cursor = (page[-1]['date'], page[-1]['id'])
+
+    def get_monthly_expenses(self, start_date, end_date):
+        return [
+            transaction
+            for page in self.iter_transaction_pages(start_date=start_date, end_date=end_date, expenses_only=True)
+            for transaction in page
+        ]
@@ -0,0 +1,305 @@
+"""
+Write-Behind Transaction Journal
+
+In write-behind mode (WRITE_BEHIND in config.py) /add does not wait for the
+database insert. Instead:
+
+- The transaction is appended to a local append-only journal (JSON lines)
+  and fsynced, then the handler replies right away
+- A background flusher sends pending transactions to the database in
+  batches of FLUSH_BATCH_SIZE, at least every FLUSH_INTERVAL seconds
+- Flushed entries are marked by appending a {"flushed": [seq, ...]} line,
+  so a flush never rewrites the journal; it is compacted down to the
+  unflushed entries once JOURNAL_COMPACT_LINES lines are obsolete, and on
+  shutdown
+- Anything still unflushed at startup is replayed, so a crash never loses
+  an acknowledged /add
+
+Transactions carry the user_id of their ledger; a flush batch only ever
+holds one user's transactions, in journal order. Entries journaled before
+ledgers were per user belong to LEGACY_USER_ID.
+
+A failed flush never holds up other users:
+
+- Transient errors (connection failures, a locked database) leave the
+  user's transactions queued; they are retried on the next flush while
+  other users' batches go through
+- Permanent errors (PERMANENT_ERRORS, e.g. "Starting balance is not set")
+  would fail on every retry, so the batch is moved to the dead-letter file
+  (DEAD_LETTER_PATH) with the error, logged as an error and counted in
+  stats()
+
+Delivery is at-least-once: a crash between a successful insert and its
+flushed marker replays that batch, and the database skips the replayed
+rows by their content_hash, so each /add is stored once. Queue depth and flush lag are
+available from stats() for monitoring.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from config import (JOURNAL_PATH, JOURNAL_COMPACT_LINES, DEAD_LETTER_PATH, FLUSH_INTERVAL, FLUSH_BATCH_SIZE, WRITE_BEHIND,
+                    LEGACY_USER_ID)
+from database.async_database import async_db
+
+logger = logging.getLogger(__name__)
+
+# Errors a retry cannot fix: the rows themselves or the user's settings are invalid
+PERMANENT_ERRORS = (ValueError, TypeError, KeyError)
+
+class TransactionJournal:
+    def __init__(self, path=JOURNAL_PATH, compact_lines=JOURNAL_COMPACT_LINES):
+        self.path = path
+        self.compact_lines = compact_lines
+        self._file = None
+        self._lock = threading.Lock()
+        # Lines of flushed entries and flushed markers since the last compaction
+        self._obsolete_lines = 0
+        # Highest sequence number in the file, flushed or not, as of the last load
+        self.last_seq = 0
+
+    def load(self):
+        """Read the entries not flushed yet, oldest first"""
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        flushed = set()
+        lines = 0
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                lines += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write was never acknowledged
+                    logger.warning("Skipping unreadable journal line in %s", self.path)
+                    continue
+                if 'flushed' in record:
+                    flushed.update(record['flushed'])
+                else:
+                    entries.append(record)
+                    self.last_seq = max(self.last_seq, record['seq'])
+        entries = [entry for entry in entries if entry['seq'] not in flushed]
+        self._obsolete_lines = lines - len(entries)
+        return entries
+
+    def _write(self, record):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            # End a torn final line so the next record does not run into it
+            if self._file.tell() and not self._ends_with_newline():
+                self._file.write("\n")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+    def append(self, entry):
+        """Durably append one entry, returns once it has been fsynced"""
+        with self._lock:
+            self._write(entry)
+
+    def mark_flushed(self, seqs):
+        """Mark the entries with the given sequence numbers as flushed"""
+        seqs = sorted(seqs)
+        with self._lock:
+            self._write({"flushed": seqs})
+            self._obsolete_lines += len(seqs) + 1
+            if self._obsolete_lines >= self.compact_lines:
+                self._compact()
+
+    def compact(self):
+        """Atomically rewrite the journal with only the unflushed entries"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        remaining = self.load()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for entry in remaining:
+                file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self._obsolete_lines = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def append_dead_letters(path, entries, error):
+    """Durably append entries that can never be stored, with the reason"""
+    failed_at = time.time()
+    with open(path, 'a', encoding='utf-8') as file:
+        for entry in entries:
+            file.write(json.dumps({**entry, "failed_at": failed_at, "error": error}) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+class WriteBehindQueue:
+    def __init__(self, database, journal, enabled=WRITE_BEHIND, interval=FLUSH_INTERVAL,
+                 batch_size=FLUSH_BATCH_SIZE, dead_letter_path=DEAD_LETTER_PATH):
+        self.database = database
+        self.journal = journal
+        self.enabled = enabled
+        self.interval = interval
+        self.batch_size = batch_size
+        self.dead_letter_path = dead_letter_path
+        # Awaited with the stored rows after every successful flush
+        self.on_flushed = None
+        # Awaited with the user_id and transactions of every dead-lettered batch
+        self.on_dead_lettered = None
+        self._pending = []
+        self._next_seq = 1
+        self._append_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.flushed_total = 0
+        self.flush_errors = 0
+        self.dead_lettered = 0
+        self.last_flush_at = None
+
+    async def start(self):
+        """Replay the journal left by a previous run and start the flusher"""
+        loop = asyncio.get_running_loop()
+        self._pending = await loop.run_in_executor(None, self.journal.load)
+        # Flushed markers may still name sequence numbers above every pending entry
+        self._next_seq = self.journal.last_seq + 1
+        if self._pending:
+            logger.info("Replaying %d journaled transactions", len(self._pending))
+            await self.flush()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.journal.compact)
+        self.journal.close()
+
+    async def submit(self, transaction):
+        """Journal a transaction and queue it for the next flush"""
+        loop = asyncio.get_running_loop()
+        # The lock keeps journal order identical to submission order
+        async with self._append_lock:
+            entry = {"seq": self._next_seq, "queued_at": time.time(), "transaction": transaction}
+            self._next_seq += 1
+            await loop.run_in_executor(None, self.journal.append, entry)
+            self._pending.append(entry)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending_transactions(self):
+        return [entry['transaction'] for entry in self._pending]
+
+    def _next_batch(self, skipped):
+        """Oldest pending entries of the first user not in skipped, up to batch_size"""
+        user_id = None
+        batch = []
+        for entry in self._pending:
+            entry_user_id = entry['transaction'].get('user_id', LEGACY_USER_ID)
+            if entry_user_id in skipped:
+                continue
+            if user_id is None:
+                user_id = entry_user_id
+            if entry_user_id == user_id:
+                batch.append(entry)
+                if len(batch) == self.batch_size:
+                    break
+        return user_id, batch
+
+    def _dequeue(self, batch):
+        seqs = {entry['seq'] for entry in batch}
+        self._pending[:] = [entry for entry in self._pending if entry['seq'] not in seqs]
+        return seqs
+
+    async def _dead_letter(self, user_id, batch, error):
+        """Move a batch that can never be stored out of the queue"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, append_dead_letters, self.dead_letter_path, batch, str(error))
+        await loop.run_in_executor(None, self.journal.mark_flushed, self._dequeue(batch))
+        self.dead_lettered += len(batch)
+        logger.error("Write-behind flush of %d transactions of user %s failed permanently (%s), "
+                     "moved them to %s", len(batch), user_id, error, self.dead_letter_path)
+        if self.on_dead_lettered is not None:
+            await self.on_dead_lettered(user_id, [entry['transaction'] for entry in batch])
+
+    async def flush(self):
+        """Send pending transactions to the database in batches.
+
+        A user whose batch fails with a transient error is skipped for the
+        rest of this flush, so other users' batches still go through.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._flush_lock:
+            skipped = set()
+            while True:
+                user_id, batch = self._next_batch(skipped)
+                if not batch:
+                    return
+                try:
+                    rows = await self.database.for_user(user_id).record_transactions(
+                        [entry['transaction'] for entry in batch]
+                    )
+                except PERMANENT_ERRORS as error:
+                    self.flush_errors += 1
+                    await self._dead_letter(user_id, batch, error)
+                    continue
+                except Exception:
+                    self.flush_errors += 1
+                    skipped.add(user_id)
+                    logger.exception("Write-behind flush of user %s failed, %d transactions still queued",
+                                     user_id, len(self._pending))
+                    continue
+                await loop.run_in_executor(None, self.journal.mark_flushed, self._dequeue(batch))
+                self.flushed_total += len(rows)
+                self.last_flush_at = time.time()
+                if self.on_flushed is not None:
+                    await self.on_flushed(rows)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self):
+        """Queue depth and flush lag (age of the oldest queued transaction)"""
+        oldest = self._pending[0]['queued_at'] if self._pending else None
+        return {
+            "queue_depth": len(self._pending),
+            "flush_lag_seconds": time.time() - oldest if oldest is not None else 0.0,
+            "flushed_total": self.flushed_total,
+            "flush_errors": self.flush_errors,
+            "dead_lettered": self.dead_lettered,
+            "last_flush_at": self.last_flush_at,
+        }
+
+# Create a singleton instance
+write_behind = WriteBehindQueue(async_db, TransactionJournal())
@@ -0,0 +1,375 @@
+"""
+SQLite Database Interface
+
+This module implements the StorageBackend interface on a local SQLite file,
+for self-hosted deployments and network-free testing. It mirrors the
+Supabase schema:
+
+- settings, transactions, balance_snapshots and monthly_rollups tables,
+  every one scoped by user_id
+- monthly_rollups is maintained by an insert trigger on transactions
+- The current_balance setting is advanced in the same transaction as every
+  insert; BEGIN IMMEDIATE takes the write lock before the balance is read,
+  so concurrent writers (threads or processes) apply one after another
+- Indexes on (user_id, date, id) for keyset paging, (user_id, id) for
+  incremental syncs and on category
+- A unique index on (user_id, content_hash); inserts use ON CONFLICT DO
+  NOTHING so rows already stored are skipped without moving the balance
+- import_sessions tracks how many rows of each import file are stored
+
+The database runs in WAL mode so readers never block the writer. Each
+thread (the AsyncDatabase executor uses several) gets its own connection,
+shared by every per-user view. Dates are stored as ISO 8601 strings in
+UTC, the same shape Supabase returns, so string comparison orders them
+correctly.
+
+Older databases are migrated on open, tracked by PRAGMA user_version:
+rows from before ledgers were per user are assigned to LEGACY_USER_ID, and
+rows from before content hashes get theirs computed.
+"""
+
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import itemgetter
+from config import SQLITE_PATH, IMPORT_BATCH_SIZE, TRANSACTIONS_PAGE_SIZE, LEGACY_USER_ID
+from database.base import StorageBackend, content_hashes
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, key)
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    amount REAL NOT NULL,
+    category TEXT NOT NULL,
+    description TEXT,
+    running_balance REAL NOT NULL,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_user_date_id_idx ON transactions (user_id, date, id);
+CREATE INDEX IF NOT EXISTS transactions_user_id_idx ON transactions (user_id, id);
+CREATE INDEX IF NOT EXISTS transactions_category_idx ON transactions (category);
+
+CREATE TABLE IF NOT EXISTS balance_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    transaction_id INTEGER NOT NULL REFERENCES transactions (id),
+    balance REAL NOT NULL,
+    taken_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+CREATE INDEX IF NOT EXISTS balance_snapshots_user_transaction_idx ON balance_snapshots (user_id, transaction_id);
+
+CREATE TABLE IF NOT EXISTS monthly_rollups (
+    user_id INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    total REAL NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, year, month, category)
+);
+
+CREATE TABLE IF NOT EXISTS import_sessions (
+    user_id INTEGER NOT NULL,
+    file_hash TEXT NOT NULL,
+    total_rows INTEGER NOT NULL,
+    committed_rows INTEGER NOT NULL DEFAULT 0,
+    started_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    PRIMARY KEY (user_id, file_hash)
+);
+
+CREATE TRIGGER IF NOT EXISTS transactions_monthly_rollups
+AFTER INSERT ON transactions
+WHEN NEW.amount < 0
+BEGIN
+    INSERT INTO monthly_rollups (user_id, year, month, category, total, count)
+    VALUES (NEW.user_id, CAST(substr(NEW.date, 1, 4) AS INTEGER), CAST(substr(NEW.date, 6, 2) AS INTEGER),
+            NEW.category, NEW.amount, 1)
+    ON CONFLICT (user_id, year, month, category) DO UPDATE
+    SET total = total + excluded.total,
+        count = count + excluded.count;
+END;
+"""
+
+# Created after migrations, older transactions tables lack content_hash
+CONTENT_HASH_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS transactions_user_content_hash_idx ON transactions (user_id, content_hash);
+"""
+
+# Moves a single-user database aside so SCHEMA can create the per-user
+# tables, {user_id} owns the existing rows
+MIGRATE_TO_USERS = """
+ALTER TABLE transactions ADD COLUMN user_id INTEGER NOT NULL DEFAULT {user_id};
+ALTER TABLE balance_snapshots ADD COLUMN user_id INTEGER NOT NULL DEFAULT {user_id};
+ALTER TABLE settings RENAME TO settings_single_user;
+ALTER TABLE monthly_rollups RENAME TO monthly_rollups_single_user;
+DROP TRIGGER IF EXISTS transactions_monthly_rollups;
+DROP INDEX IF EXISTS transactions_date_id_idx;
+DROP INDEX IF EXISTS balance_snapshots_transaction_id_idx;
+"""
+
+COPY_SINGLE_USER_ROWS = """
+INSERT INTO settings (user_id, key, value, updated_at)
+SELECT {user_id}, key, value, updated_at FROM settings_single_user WHERE value IS NOT NULL;
+INSERT INTO monthly_rollups (user_id, year, month, category, total, count)
+SELECT {user_id}, year, month, category, total, count FROM monthly_rollups_single_user;
+DROP TABLE settings_single_user;
+DROP TABLE monthly_rollups_single_user;
+"""
+
+TRANSACTION_COLUMNS = ('date', 'amount', 'category', 'description', 'running_balance', 'created_at',
+                       'content_hash')
+
+INSERT_TRANSACTION = (
+    f"INSERT INTO transactions (user_id, {', '.join(TRANSACTION_COLUMNS)}) "
+    f"VALUES (?, {', '.join('?' for _ in TRANSACTION_COLUMNS)}) "
+    "ON CONFLICT (user_id, content_hash) DO NOTHING RETURNING *"
+)
+
+def _row_to_dict(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+class SQLiteDatabase(StorageBackend):
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()['user_version']
+            existing = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions'"
+            ).fetchone()
+            if existing and version < 1:
+                self._migrate_to_users(conn)
+            conn.executescript(SCHEMA)
+            if existing and version < 2:
+                self._add_content_hashes(conn)
+            conn.executescript(CONTENT_HASH_INDEX)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _migrate_to_users(self, conn):
+        if LEGACY_USER_ID is None:
+            raise ValueError("Set ALLOWED_USER_IDS to migrate a single-user database")
+        # Databases created before current_balance existed start from the
+        # latest checkpoint
+        current_balance = self._checkpoint_balance(conn)
+        has_current_balance = conn.execute(
+            "SELECT 1 FROM settings WHERE key = 'current_balance'"
+        ).fetchone()
+        conn.executescript(MIGRATE_TO_USERS.format(user_id=LEGACY_USER_ID))
+        conn.executescript(SCHEMA)
+        conn.executescript(COPY_SINGLE_USER_ROWS.format(user_id=LEGACY_USER_ID))
+        if not has_current_balance and current_balance is not None:
+            conn.execute(
+                "INSERT INTO settings (user_id, key, value) VALUES (?, 'current_balance', ?)",
+                (LEGACY_USER_ID, current_balance)
+            )
+
+    def _add_content_hashes(self, conn):
+        conn.execute("ALTER TABLE transactions ADD COLUMN content_hash TEXT")
+        rows = conn.execute(
+            "SELECT id, user_id, date, amount, category, description FROM transactions ORDER BY user_id, id"
+        ).fetchall()
+        updates = []
+        # Occurrences are counted per user, like the unique index
+        for _, user_rows in groupby(rows, key=itemgetter('user_id')):
+            user_rows = list(user_rows)
+            updates.extend(zip(content_hashes(user_rows), (row['id'] for row in user_rows)))
+        conn.executemany("UPDATE transactions SET content_hash = ? WHERE id = ?", updates)
+
+    def _checkpoint_balance(self, conn):
+        """Single-user balance from the newest transaction or snapshot, whichever is later"""
+        latest = conn.execute(
+            "SELECT id, running_balance FROM transactions ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        snapshot = conn.execute(
+            "SELECT transaction_id, balance FROM balance_snapshots ORDER BY transaction_id DESC LIMIT 1"
+        ).fetchone()
+        if snapshot and (not latest or snapshot['transaction_id'] >= latest['id']):
+            return str(float(snapshot['balance']))
+        if latest:
+            return str(float(latest['running_balance']))
+        row = conn.execute("SELECT value FROM settings WHERE key = 'starting_balance'").fetchone()
+        return row['value'] if row else None
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = _row_to_dict
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get_setting(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM settings WHERE user_id = ? AND key = ?", (self.user_id, key)
+        ).fetchone()
+        if row and row['value'] is not None:
+            return float(row['value'])
+        return None
+
+    def get_starting_balance(self):
+        return self._get_setting('starting_balance')
+
+    def update_starting_balance(self, amount):
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO settings (user_id, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP",
+                [(self.user_id, key, str(amount)) for key in ('starting_balance', 'current_balance')]
+            )
+
+    def get_latest_balance(self):
+        return self._get_setting('current_balance')
+
+    def add_balance_snapshot(self, transaction_id, balance):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO balance_snapshots (user_id, transaction_id, balance) VALUES (?, ?, ?)",
+                (self.user_id, transaction_id, balance)
+            )
+
+    def get_balance_snapshots(self, page_size=TRANSACTIONS_PAGE_SIZE):
+        return self._connection().execute(
+            "SELECT transaction_id, balance, taken_at FROM balance_snapshots "
+            "WHERE user_id = ? ORDER BY transaction_id",
+            (self.user_id,)
+        ).fetchall()
+
+    def record_transactions(self, transactions):
+        conn = self._connection()
+        with conn:
+            # Take the write lock before reading the balance
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT value FROM settings WHERE user_id = ? AND key = 'current_balance'", (self.user_id,)
+            ).fetchone()
+            if row is None or row['value'] is None:
+                raise ValueError("Starting balance is not set")
+            balance = float(row['value'])
+            now = datetime.now(timezone.utc).isoformat()
+            stored = []
+            for transaction, content_hash in zip(transactions, content_hashes(transactions)):
+                # Round to cents so repeated float additions cannot drift
+                running_balance = round(balance + float(transaction['amount']), 2)
+                values = {**transaction, 'running_balance': running_balance,
+                          'created_at': transaction.get('created_at') or now,
+                          'content_hash': content_hash}
+                row = conn.execute(
+                    INSERT_TRANSACTION,
+                    (self.user_id, *(values.get(column) for column in TRANSACTION_COLUMNS))
+                ).fetchone()
+                # No row means the transaction was already stored
+                if row is not None:
+                    balance = running_balance
+                    stored.append(row)
+            conn.execute(
+                "UPDATE settings SET value = ?, updated_at = CURRENT_TIMESTAMP "
+                "WHERE user_id = ? AND key = 'current_balance'",
+                (str(balance), self.user_id)
+            )
+        return stored
+
+    def bulk_insert_transactions(self, transactions, batch_size=IMPORT_BATCH_SIZE):
+        for start in range(0, len(transactions), batch_size):
+            batch = transactions[start:start + batch_size]
+            try:
+                # One transaction per batch, a failed batch is rolled back
+                # whole, balance included. The connection is looked up per
+                # batch since each step may run on a different executor thread.
+                stored = self.record_transactions(batch)
+                yield start, start + len(batch), len(stored), None
+            except Exception as e:
+                yield start, start + len(batch), 0, e
+
+    def get_budgets(self):
+        rows = self._connection().execute(
+            "SELECT key, value FROM settings WHERE user_id = ? AND key LIKE 'budget:%' AND value IS NOT NULL",
+            (self.user_id,)
+        ).fetchall()
+        return {row['key'][len('budget:'):]: float(row['value']) for row in rows}
+
+    def set_budget(self, category, amount):
+        with self._connection() as conn:
+            if amount is None:
+                conn.execute(
+                    "DELETE FROM settings WHERE user_id = ? AND key = ?", (self.user_id, f"budget:{category}")
+                )
+                return
+            conn.execute(
+                "INSERT INTO settings (user_id, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP",
+                (self.user_id, f"budget:{category}", str(amount))
+            )
+
+    def get_import_session(self, file_hash):
+        return self._connection().execute(
+            "SELECT file_hash, total_rows, committed_rows, started_at, updated_at FROM import_sessions "
+            "WHERE user_id = ? AND file_hash = ?",
+            (self.user_id, file_hash)
+        ).fetchone()
+
+    def save_import_session(self, file_hash, total_rows, committed_rows):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO import_sessions (user_id, file_hash, total_rows, committed_rows) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, file_hash) DO UPDATE SET total_rows = excluded.total_rows, "
+                "committed_rows = excluded.committed_rows, "
+                "updated_at = strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')",
+                (self.user_id, file_hash, total_rows, committed_rows)
+            )
+
+    def get_transactions_page(self, cursor=None, page_size=TRANSACTIONS_PAGE_SIZE, descending=True,
+                              start_date=None, end_date=None, expenses_only=False):
+        conditions = ["user_id = ?"]
+        params = [self.user_id]
+        if start_date is not None:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append("date < ?")
+            params.append(end_date)
+        if expenses_only:
+            conditions.append("amount < 0")
+        if cursor is not None:
+            op = '<' if descending else '>'
+            conditions.append(f"(date {op} ? OR (date = ? AND id {op} ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        direction = "DESC" if descending else "ASC"
+        return self._connection().execute(
+            f"SELECT * FROM transactions WHERE {' AND '.join(conditions)} "
+            f"ORDER BY date {direction}, id {direction} LIMIT ?",
+            (*params, page_size)
+        ).fetchall()
+
+    def iter_transactions_after(self, last_id=None, page_size=TRANSACTIONS_PAGE_SIZE):
+        last_id = 0 if last_id is None else last_id
+        while True:
+            page = self._connection().execute(
+                "SELECT * FROM transactions WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (self.user_id, last_id, page_size)
+            ).fetchall()
+            if not page:
+                return
+            yield page
+            last_id = page[-1]['id']
+
+    def get_monthly_rollup(self, year, month):
+        return self._connection().execute(
+            "SELECT category, total, count FROM monthly_rollups WHERE user_id = ? AND year = ? AND month = ?",
+            (self.user_id, year, month)
+        ).fetchall()
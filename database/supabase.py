@@ -5,55 +5,196 @@ This module handles all database operations for the Budget Tracker Bot using Sup
 The Database class provides methods for:
 
 - Managing starting balance (get/update)
-- Adding new transactions
-- Retrieving transaction history
-- Generating monthly expense reports
+- Managing monthly budgets, stored as budget:<category> settings
+- Reading the current balance and writing balance snapshots
+- Recording new transactions (single or in bulk batches) through the
+  record_transactions stored procedure, which inserts the rows and
+  advances the current_balance setting in one database transaction,
+  skipping rows whose content_hash is already stored
+- Tracking import sessions (how many rows of an import file are stored)
+- Retrieving transaction history in keyset-paginated pages
+- Generating monthly expense reports from the monthly_rollups table
 
-Tables used:
-- settings: Stores bot configuration (e.g., starting_balance)
+Tables used (every one has a user_id column, filtered on by every query
+of a per-user view from for_user()):
+- settings: Stores per-user settings (e.g., starting_balance)
 - transactions: Stores all financial transactions with date, amount, category
+- balance_snapshots: Periodic balance checkpoints keyed by transaction id
+- monthly_rollups: Per-month, per-category expense totals, maintained by an
+  insert trigger on transactions
+- import_sessions: Stored row count per imported file
 
 All database interactions are encapsulated in this class to maintain
-clean separation of concerns and consistent database operations.
+clean separation of concerns and consistent database operations. It
+implements the StorageBackend interface from database/base.py and is
+created by database.create_database() when STORAGE_BACKEND is "supabase".
 """
 
-from supabase import create_client
-from datetime import datetime
-from config import SUPABASE_URL, SUPABASE_KEY
+import threading
+from datetime import datetime, timezone
+from config import SUPABASE_URL, SUPABASE_KEY, IMPORT_BATCH_SIZE, TRANSACTIONS_PAGE_SIZE
+from database.base import StorageBackend, content_hashes
 
-class Database:
+class Database(StorageBackend):
     def __init__(self):
-        self.client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        # The client is created on first use, so importing and constructing
+        # the backend does no network or TLS setup. The holder dict is
+        # shared with for_user() views, so they all use one client.
+        self._client = {'client': None, 'lock': threading.Lock()}
+
+    @property
+    def client(self):
+        holder = self._client
+        if holder['client'] is None:
+            with holder['lock']:
+                if holder['client'] is None:
+                    from supabase import create_client
+                    holder['client'] = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return holder['client']
         
     def get_starting_balance(self):
-        result = self.client.table('settings').select('value').eq('key', 'starting_balance').execute()
+        return self._get_setting('starting_balance')
+
+    def _get_setting(self, key):
+        result = self.client.table('settings')\
+            .select('value')\
+            .eq('user_id', self.user_id)\
+            .eq('key', key)\
+            .execute()
         if result.data and result.data[0]['value'] is not None:
             return float(result.data[0]['value'])
         return None
         
     def update_starting_balance(self, amount):
-        return self.client.table('settings').update({'value': str(amount)}).eq('key', 'starting_balance').execute()
-        
-    def add_transaction(self, amount, category, description, running_balance):
-        transaction = {
-            "date": datetime.now().isoformat(),
-            "amount": amount,
-            "category": category,
-            "description": description,
-            "running_balance": running_balance
-        }
-        return self.client.table('transactions').insert(transaction).execute()
+        return self.client.table('settings').upsert([
+            {'user_id': self.user_id, 'key': key, 'value': str(amount)}
+            for key in ('starting_balance', 'current_balance')
+        ]).execute()
         
-    def get_transactions(self):
-        return self.client.table('transactions').select('*').order('date.desc').execute()
+    def get_latest_balance(self):
+        """Current balance, a single-row read of the current_balance setting"""
+        return self._get_setting('current_balance')
+
+    def add_balance_snapshot(self, transaction_id, balance):
+        return self.client.table('balance_snapshots').insert({
+            "user_id": self.user_id,
+            "transaction_id": transaction_id,
+            "balance": balance
+        }).execute()
+
+    def get_balance_snapshots(self, page_size=TRANSACTIONS_PAGE_SIZE):
+        snapshots = []
+        while True:
+            query = self.client.table('balance_snapshots')\
+                .select('transaction_id, balance, taken_at')\
+                .eq('user_id', self.user_id)
+            if snapshots:
+                query = query.gt('transaction_id', snapshots[-1]['transaction_id'])
+            page = query.order('transaction_id').limit(page_size).execute().data
+            if not page:
+                return snapshots
+            snapshots.extend(page)
         
-    def get_monthly_expenses(self, start_date, end_date):
-        return self.client.table('transactions')\
-            .select('*')\
-            .lt('date', end_date)\
-            .gte('date', start_date)\
-            .lt('amount', 0)\
+    def record_transactions(self, transactions):
+        rows = [
+            {**transaction, 'content_hash': content_hash}
+            for transaction, content_hash in zip(transactions, content_hashes(transactions))
+        ]
+        return self.client.rpc('record_transactions', {
+            'p_user_id': self.user_id,
+            'p_rows': rows
+        }).execute().data
+
+    def bulk_insert_transactions(self, transactions, batch_size=IMPORT_BATCH_SIZE):
+        for start in range(0, len(transactions), batch_size):
+            batch = transactions[start:start + batch_size]
+            try:
+                stored = self.record_transactions(batch)
+                yield start, start + len(batch), len(stored), None
+            except Exception as e:
+                yield start, start + len(batch), 0, e
+
+    def get_budgets(self):
+        result = self.client.table('settings')\
+            .select('key, value')\
+            .eq('user_id', self.user_id)\
+            .like('key', 'budget:%')\
             .execute()
+        return {
+            row['key'][len('budget:'):]: float(row['value'])
+            for row in result.data if row['value'] is not None
+        }
+
+    def set_budget(self, category, amount):
+        if amount is None:
+            return self.client.table('settings')\
+                .delete()\
+                .eq('user_id', self.user_id)\
+                .eq('key', f"budget:{category}")\
+                .execute()
+        return self.client.table('settings').upsert({
+            'user_id': self.user_id, 'key': f"budget:{category}", 'value': str(amount)
+        }).execute()
+
+    def get_import_session(self, file_hash):
+        result = self.client.table('import_sessions')\
+            .select('file_hash, total_rows, committed_rows, started_at, updated_at')\
+            .eq('user_id', self.user_id)\
+            .eq('file_hash', file_hash)\
+            .execute()
+        return result.data[0] if result.data else None
 
-# Create a singleton instance
-db = Database()
\ No newline at end of file
+    def save_import_session(self, file_hash, total_rows, committed_rows):
+        return self.client.table('import_sessions').upsert({
+            'user_id': self.user_id,
+            'file_hash': file_hash,
+            'total_rows': total_rows,
+            'committed_rows': committed_rows,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }).execute()
+        
+    def get_transactions_page(self, cursor=None, page_size=TRANSACTIONS_PAGE_SIZE, descending=True,
+                              start_date=None, end_date=None, expenses_only=False):
+        """Fetch one page of transactions ordered by (date, id).
+
+        cursor is the (date, id) of the last row of the previous page, only
+        rows that sort after it are returned. Keyset paging keeps every page
+        an indexed range read, unlike offsets which rescan skipped rows.
+        """
+        query = self.client.table('transactions').select('*').eq('user_id', self.user_id)
+        if start_date is not None:
+            query = query.gte('date', start_date)
+        if end_date is not None:
+            query = query.lt('date', end_date)
+        if expenses_only:
+            query = query.lt('amount', 0)
+        if cursor is not None:
+            date, row_id = cursor
+            op = 'lt' if descending else 'gt'
+            query = query.or_(f'date.{op}."{date}",and(date.eq."{date}",id.{op}.{row_id})')
+        return query\
+            .order('date', desc=descending)\
+            .order('id', desc=descending)\
+            .limit(page_size)\
+            .execute()\
+            .data
+
+    def iter_transactions_after(self, last_id=None, page_size=TRANSACTIONS_PAGE_SIZE):
+        while True:
+            query = self.client.table('transactions').select('*').eq('user_id', self.user_id)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            page = query.order('id').limit(page_size).execute().data
+            if not page:
+                return
+            yield page
+            last_id = page[-1]['id']
+        
+    def get_monthly_rollup(self, year, month):
+        return self.client.table('monthly_rollups')\
+            .select('category, total, count')\
+            .eq('user_id', self.user_id)\
+            .eq('year', year)\
+            .eq('month', month)\
+            .execute()\
+            .data
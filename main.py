@@ -2,7 +2,10 @@
 Budget Tracker Bot - Main Entry Point
 
 This is the main entry point for the Telegram Budget Tracker Bot.
-It initializes the bot, sets up command handlers, and starts the bot polling.
+It initializes the bot, sets up command handlers, and starts receiving
+updates by polling or, with BOT_MODE=webhook, through bot/webhook.py.
+Updates from different chats are handled concurrently; updates from the
+same chat are handled in order (see bot/updates.py).
 
 Features:
 - Initializes bot with Telegram token
@@ -14,46 +17,185 @@ Features:
   • /balance - Check balance
   • /report - Excel report
   • /monthly - Monthly analysis
+  • /trend - Multi-month trend
+  • /range - Date range totals
+  • /search - Transaction search
+  • /setbudget, /budget - Monthly budgets
   • /help - Command list
 
+Every handler and every storage backend call is instrumented (see
+bot/metrics.py); set METRICS_PORT to serve the metrics for Prometheus.
+
+Scheduled jobs (bot/jobs.py) prepare last month's /monthly summary and
+report on the 1st and write nightly balance snapshots.
+
+Run with --verify to reconcile every allowed user's stored balance against
+their full transaction history instead of starting the bot.
+
 The bot uses python-telegram-bot for Telegram interactions
 and Supabase for database operations.
 """
 
+import argparse
+import asyncio
+import logging
+import sys
 from telegram.ext import Application, CommandHandler, MessageHandler
 from telegram import Update
 from telegram.ext.filters import Document
-from config import TELEGRAM_BOT_TOKEN
+from config import TELEGRAM_BOT_TOKEN, METRICS_PORT, BOT_MODE, ALLOWED_USER_IDS
 from bot.handlers import *
-from database.supabase import db
+from database.async_database import async_db
+from bot.balance import reconcile_balance
+from bot.workers import worker_pool
+from database.journal import write_behind
+from bot.metrics import metrics, instrument_handler, InstrumentedBackend, MetricsServer
+from bot.updates import ChatOrderedUpdateProcessor
+from bot.users import users
+from bot.cache import responses
+from bot.jobs import schedule_jobs
+
+logger = logging.getLogger(__name__)
+
+COMMANDS = [
+    ("start", start),
+    ("setbalance", set_balance),
+    ("add", add),
+    ("balance", balance),
+    ("report", report),
+    ("monthly", monthly_expenses),
+    ("trend", trend),
+    ("range", range_totals),
+    ("search", search),
+    ("setbudget", set_budget),
+    ("budget", budget),
+    ("help", help_command),
+    ("import", import_excel),
+]
+
+def register_write_behind_gauges():
+    metrics.register_gauge("bot_write_behind_queue_depth", "Transactions waiting to be flushed",
+                           lambda: write_behind.stats()['queue_depth'])
+    metrics.register_gauge("bot_write_behind_flush_lag_seconds", "Age of the oldest unflushed transaction",
+                           lambda: write_behind.stats()['flush_lag_seconds'])
+    metrics.register_gauge("bot_write_behind_dead_lettered", "Transactions moved to the dead-letter file",
+                           lambda: write_behind.stats()['dead_lettered'])
+
+def register_response_cache_gauges():
+    for name, help_text in (("entries", "Cached /monthly and /report responses"),
+                            ("bytes", "Size of the cached responses"),
+                            ("pinned", "Responses prepared by scheduled jobs, kept outside the limits"),
+                            ("hits", "Requests answered from the response cache"),
+                            ("misses", "Requests the response cache could not answer")):
+        metrics.register_gauge(f"bot_response_cache_{name}", help_text,
+                               lambda name=name: responses.stats()[name])
+
+async def post_init(application: Application) -> None:
+    # Replay journaled transactions from a previous run before any state loads
+    if write_behind.enabled:
+        write_behind.on_flushed = record_flushed_transactions
+        write_behind.on_dead_lettered = discard_dead_lettered_transactions
+        await write_behind.start()
+        register_write_behind_gauges()
+    register_response_cache_gauges()
+
+    if METRICS_PORT:
+        metrics_server = MetricsServer()
+        metrics_server.start()
+        application.bot_data['metrics_server'] = metrics_server
+        logger.info("Serving metrics on port %d", METRICS_PORT)
+
+    # Load user state in the background so updates are accepted right away;
+    # a command arriving first waits only for its own user's load
+    application.bot_data['preload_task'] = asyncio.create_task(users.preload(sorted(ALLOWED_USER_IDS)))
+
+async def post_shutdown(application: Application) -> None:
+    preload_task = application.bot_data.get('preload_task')
+    if preload_task:
+        preload_task.cancel()
+    metrics_server = application.bot_data.get('metrics_server')
+    if metrics_server:
+        await metrics_server.stop()
+    if write_behind.enabled:
+        await write_behind.stop()
+    async_db.close()
+    worker_pool.close()
+
+async def verify_balance() -> bool:
+    ok = True
+    for user_id in sorted(ALLOWED_USER_IDS):
+        expected, checkpoint, mismatches = await reconcile_balance(async_db.for_user(user_id))
+        if expected is None:
+            print(f"User {user_id}: no starting balance set, nothing to verify.")
+            continue
+
+        print(f"User {user_id}: balance from full history: {expected}")
+        print(f"User {user_id}: latest balance checkpoint: {checkpoint}")
+        for transaction_id, stored, recomputed in mismatches:
+            print(f"User {user_id}: snapshot at transaction {transaction_id} drifted: "
+                  f"stored {stored}, expected {recomputed}")
+        ok = ok and expected == checkpoint and not mismatches
+    return ok
 
 def main():
+    parser = argparse.ArgumentParser(description="Telegram Budget Tracker Bot")
+    parser.add_argument("--verify", action="store_true",
+                        help="reconcile balance checkpoints against all transactions and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s", level=logging.INFO)
+    # httpx logs every Telegram poll at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # Record latency, errors and payload sizes of every storage call, only
+    # when the metrics are served somewhere
+    if METRICS_PORT or BOT_MODE == "webhook":
+        async_db.database = InstrumentedBackend(async_db.database)
+
+    if args.verify:
+        ok = asyncio.run(verify_balance())
+        async_db.close()
+        sys.exit(0 if ok else 1)
+
     # Initialize bot
     if not TELEGRAM_BOT_TOKEN:
         raise ValueError("No token provided")
-
-    # Initialize state from database
-    initialize_from_db()
+    if not ALLOWED_USER_IDS:
+        raise ValueError("No allowed users, set ALLOWED_USER_IDS")
+    if BOT_MODE not in ("polling", "webhook"):
+        raise ValueError(f"Unknown BOT_MODE: {BOT_MODE}")
 
     # Create application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-
-    # Add handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("setbalance", set_balance))
-    application.add_handler(CommandHandler("add", add))
-    application.add_handler(CommandHandler("balance", balance))
-    application.add_handler(CommandHandler("report", report))
-    application.add_handler(CommandHandler("monthly", monthly_expenses))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("import", import_excel))
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(ChatOrderedUpdateProcessor())
+    )
+    if BOT_MODE == "webhook":
+        # Updates arrive through bot/webhook.py instead of the Updater
+        builder = builder.updater(None)
+    application = builder.build()
+
+    # Add handlers, each wrapped to record its latency and errors
+    for command, callback in COMMANDS:
+        application.add_handler(CommandHandler(command, instrument_handler(command, callback)))
     
-    # Add document handler for Excel imports
-    application.add_handler(MessageHandler(Document.ALL & Document.FileExtension("xlsx"), import_excel))
+    # Add document handler for Excel and CSV imports
+    application.add_handler(MessageHandler(Document.FileExtension("xlsx") | Document.FileExtension("csv"),
+                                           instrument_handler("import_document", import_excel)))
+
+    # Precomputed summaries, reports and snapshots run on the job queue
+    schedule_jobs(application.job_queue)
 
     # Start the bot
-    print("Starting bot...")
-    application.run_polling()
+    logger.info("Starting bot in %s mode...", BOT_MODE)
+    if BOT_MODE == "webhook":
+        from bot.webhook import run_webhook
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
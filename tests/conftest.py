@@ -0,0 +1,36 @@
+import os
+
+# Importing the handlers builds a storage backend; tests swap in their own
+os.environ.setdefault("ALLOWED_USER_IDS", "1,2")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+
+import pytest
+from bot.cache import responses
+from bot.users import users
+from bot.workers import worker_pool
+from database.sqlite import SQLiteDatabase
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Point the bot's user states at a storage backend, fresh for each test"""
+    def use(database):
+        monkeypatch.setattr(users.database, "database", database)
+        return database
+
+    for state in users.resident():
+        users.evict(state.user_id)
+    responses.clear()
+    yield use
+    for state in users.resident():
+        users.evict(state.user_id)
+    responses.clear()
+
+@pytest.fixture
+def sqlite_backend(backend, tmp_path):
+    return backend(SQLiteDatabase(str(tmp_path / "budget_tracker.db")))
+
+@pytest.fixture(scope="session", autouse=True)
+def close_worker_pool():
+    yield
+    worker_pool.close()
@@ -0,0 +1,65 @@
+"""A slow query must not hold up other users' commands"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from benchmarks.fakes import FakeDatabase, generate_transactions, make_context, make_update
+import bot.handlers as handlers
+
+FAST_USER, SLOW_USER = 1, 2
+
+class SlowFakeDatabase(FakeDatabase):
+    """FakeDatabase whose transaction pages wait until released"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.querying = threading.Event()
+        self.release = threading.Event()
+
+    def get_transactions_page(self, *args, **kwargs):
+        self.querying.set()
+        self.release.wait(timeout=10)
+        return super().get_transactions_page(*args, **kwargs)
+
+class PerUserFakes:
+    """Backend handing each user their own fake database"""
+
+    def __init__(self, databases):
+        self.databases = databases
+
+    def for_user(self, user_id):
+        return self.databases[user_id]
+
+async def commands_while_report_waits(fast, slow):
+    # The slow user's first command loads their ledger, page by page
+    started = time.perf_counter()
+    report_update = make_update(SLOW_USER)
+    report = asyncio.create_task(handlers.report(report_update, make_context("csv")))
+    await asyncio.to_thread(slow.querying.wait, 5)
+
+    balance_update, add_update = make_update(FAST_USER), make_update(FAST_USER)
+    await handlers.balance(balance_update, make_context())
+    await handlers.add(add_update, make_context("-5", "Food", "Lunch"))
+    replied_after = time.perf_counter() - started
+    report_waiting = not report.done()
+
+    slow.release.set()
+    await asyncio.wait_for(report, timeout=30)
+    return (balance_update.message.replies, add_update.message.replies, replied_after, report_waiting,
+            report_update.message.replies)
+
+def test_slow_query_does_not_delay_other_handlers(backend):
+    fast = FakeDatabase(starting_balance=100.0)
+    slow = SlowFakeDatabase(generate_transactions(50, start=datetime(2024, 1, 1, tzinfo=timezone.utc)))
+    backend(PerUserFakes({FAST_USER: fast, SLOW_USER: slow}))
+
+    balance_replies, add_replies, replied_after, report_waiting, report_replies = asyncio.run(
+        commands_while_report_waits(fast, slow)
+    )
+    assert replied_after < 2
+    assert report_waiting
+    assert "100\\.00" in balance_replies[-1]
+    assert len(fast.rows) == 1 and add_replies
+    # The report was still sent once the query finished
+    assert isinstance(report_replies[-1], bytes)
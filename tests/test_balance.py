@@ -0,0 +1,40 @@
+import asyncio
+
+import main
+from benchmarks.fakes import make_context, make_update
+from bot import handlers
+from bot import users as users_module
+from bot.balance import reconcile_balance
+from bot.users import users
+
+USER_ID = 1
+
+async def add_transactions():
+    await handlers.set_balance(make_update(USER_ID), make_context("100"))
+    for amount, category in (("-5.10", "Food"), ("-7.30", "Transport"), ("250", "Income"), ("-0.20", "Food"),
+                             ("-12.99", "Shopping")):
+        await handlers.add(make_update(USER_ID), make_context(amount, category, "item"))
+    return (await users.get(USER_ID)).db
+
+async def reload_balance():
+    users.evict(USER_ID)
+    return (await users.get(USER_ID)).current_balance
+
+def test_checkpoints_and_reload_match_a_full_replay(sqlite_backend, monkeypatch):
+    monkeypatch.setattr(users_module, "BALANCE_SNAPSHOT_INTERVAL", 2)
+    database = asyncio.run(add_transactions())
+
+    expected, checkpoint, mismatches = asyncio.run(reconcile_balance(database))
+    assert str(expected) == str(checkpoint) == "324.41"
+    assert mismatches == []
+    assert len(asyncio.run(database.get_balance_snapshots())) == 2
+    assert asyncio.run(reload_balance()) == 324.41
+    assert asyncio.run(main.verify_balance())
+
+def test_verify_reports_a_drifted_snapshot(sqlite_backend, capsys):
+    database = asyncio.run(add_transactions())
+    newest = asyncio.run(database.get_transactions_page(page_size=1))[0]
+    asyncio.run(database.add_balance_snapshot(newest['id'], 300))
+
+    assert not asyncio.run(main.verify_balance())
+    assert f"snapshot at transaction {newest['id']} drifted: stored 300.00, expected 324.41" in capsys.readouterr().out
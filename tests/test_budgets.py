@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fakes import FakeDatabase, generate_transactions
+from bot.budgets import Budgets, WARNING_THRESHOLDS, _month_of
+from bot.ledger import LedgerCache
+from database.async_database import AsyncDatabase
+
+LIMITS = {"Food": 1000, "Transport": 800, "Shopping": 1200}
+
+async def load(transactions):
+    ledger = LedgerCache()
+    await ledger.load(AsyncDatabase(FakeDatabase(transactions)).for_user(1))
+    return ledger
+
+def seeded(transactions):
+    budgets = Budgets()
+    budgets.seed(asyncio.run(load(transactions)), LIMITS)
+    return budgets
+
+def test_recorded_totals_and_crossings_match_a_seed():
+    transactions = generate_transactions(600, seed=17, start=datetime.now(timezone.utc) - timedelta(days=120))
+    # Just after midnight at +02:00 is still the previous month in UTC
+    transactions.append({**transactions[-1], "date": "2026-03-01T01:30:00+02:00", "amount": -50.0,
+                         "category": "Food"})
+    budgets = seeded(transactions[:300])
+
+    spent = {}
+    for transaction in transactions[:300]:
+        if transaction['amount'] < 0:
+            key = (*_month_of(transaction['date']), transaction['category'])
+            spent[key] = spent.get(key, 0) + round(-transaction['amount'] * 100)
+    crossings, expected_crossings = [], []
+    for transaction in transactions[300:]:
+        crossings += budgets.record(transaction)
+        if transaction['amount'] < 0:
+            key = (*_month_of(transaction['date']), transaction['category'])
+            before = spent.get(key, 0)
+            spent[key] = before + round(-transaction['amount'] * 100)
+            limit = LIMITS.get(transaction['category'])
+            expected_crossings += [(*key, threshold) for threshold in WARNING_THRESHOLDS
+                                   if limit and before < limit * threshold <= spent[key]]
+
+    full = seeded(transactions)
+    assert budgets._spent == full._spent == spent
+    assert (2026, 2, "Food") in spent
+    assert crossings == expected_crossings
+    assert {threshold for *_, threshold in crossings} == set(WARNING_THRESHOLDS)
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timezone
+
+from benchmarks.fakes import make_context, make_update
+from bot import handlers
+from bot.cache import ResponseCache
+from bot.users import users
+
+USER_ID = 1
+
+def test_least_recently_used_entries_are_evicted_by_count_and_size():
+    cache = ResponseCache(max_entries=3, max_bytes=10)
+    for key in "abc":
+        cache.put(key, b"xx")
+    assert cache.get("a") == b"xx"
+    cache.put("d", b"xx")
+    # b was used least recently
+    assert cache.get("b") is None
+    cache.put("e", b"x" * 7)
+    # One entry too many evicts c, then one byte too many evicts a
+    assert [key for key in "acde" if cache.get(key) is not None] == ["d", "e"]
+    assert cache.bytes == 9
+
+    # Larger than the whole cache, never stored
+    cache.put("f", [b"x" * 6, b"x" * 6])
+    assert cache.get("f") is None
+    assert cache.stats()['entries'] == 2
+
+def test_pinned_responses_are_outside_the_limits_until_repinned():
+    cache = ResponseCache(max_entries=1, max_bytes=10)
+    cache.pin("job", {"a": b"x" * 20})
+    cache.put("b", b"x")
+    cache.put("c", b"x")
+    assert cache.get("a") == b"x" * 20
+    cache.pin("job", {"d": b"x"})
+    assert cache.get("a") is None and cache.get("d") == b"x"
+
+async def monthly_twice_around_an_add(monkeypatch):
+    await handlers.set_balance(make_update(USER_ID), make_context("100"))
+    await handlers.add(make_update(USER_ID), make_context("-5", "Food", "Lunch"))
+    state = await users.get(USER_ID)
+    now = datetime.now(timezone.utc)
+    month, year = now.month, now.year
+
+    renders = []
+    render = handlers.worker_pool.run
+    async def counting_run(func, *args):
+        renders.append(func.__name__)
+        return await render(func, *args)
+    monkeypatch.setattr(handlers.worker_pool, "run", counting_run)
+
+    first = await handlers.build_monthly(state, month, year)
+    assert await handlers.build_monthly(state, month, year) is first
+    await handlers.add(make_update(USER_ID), make_context("-3", "Transport", "Taxi"))
+    refreshed = await handlers.build_monthly(state, month, year)
+    return renders, first, refreshed
+
+def test_monthly_is_served_from_the_cache_until_the_month_changes(sqlite_backend, monkeypatch):
+    renders, first, refreshed = asyncio.run(monthly_twice_around_an_add(monkeypatch))
+    assert renders == ["render_monthly_report", "render_monthly_report"]
+    assert "Taxi" not in "".join(first) and "Taxi" in "".join(refreshed)
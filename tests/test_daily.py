@@ -0,0 +1,52 @@
+import random
+
+import numpy as np
+
+from bot.daily import DailyTotals, MICROSECONDS_PER_DAY
+
+def random_rows(rng, count, categories):
+    # Several rows per day, spread over about two years
+    return [(rng.randrange(0, 700 * MICROSECONDS_PER_DAY), rng.choice([-1, -1, -1, 1]) * rng.randrange(1, 100_000),
+             rng.randrange(categories)) for _ in range(count)]
+
+def rebuilt(categories, rows):
+    index = DailyTotals(categories)
+    dates, amounts, codes = (np.array(column, dtype=np.int64) for column in zip(*rows))
+    index.rebuild(dates, amounts, codes)
+    return index
+
+def test_adds_match_a_rebuild():
+    rng = random.Random(13)
+    categories = ["Food", "Transport", "Income"]
+    initial = random_rows(rng, 300, len(categories))
+    index = rebuilt(categories, initial)
+
+    # Backdated and new days, and a category added after the index was built
+    categories.append("Gifts")
+    added = random_rows(rng, 400, len(categories))
+    for row in added:
+        index.add(*row)
+    expected = rebuilt(categories, initial + added)
+
+    assert len(index) == len(expected)
+    assert (index._days[:len(index)] == expected._days[:len(expected)]).all()
+    assert (index._sums[:len(index) + 1] == expected._sums[:len(expected) + 1]).all()
+    boundaries = sorted(rng.randrange(-10, 720) * MICROSECONDS_PER_DAY for _ in range(12))
+    assert index.period_totals(boundaries) == expected.period_totals(boundaries)
+    for start, end in zip(boundaries, boundaries[1:]):
+        assert index.totals(start, end) == expected.totals(start, end)
+    assert index.totals() == expected.totals()
+
+def test_totals_match_a_scan():
+    rng = random.Random(14)
+    rows = random_rows(rng, 500, 3)
+    index = DailyTotals(["Food", "Transport", "Income"])
+    for row in rows:
+        index.add(*row)
+    start, end = 100 * MICROSECONDS_PER_DAY, 400 * MICROSECONDS_PER_DAY
+    in_range = [(amount, code) for date, amount, code in rows if start <= date < end]
+    assert index.totals(start, end)["Food"] == (
+        sum(-amount for amount, code in in_range if code == 0 and amount < 0),
+        sum(amount for amount, code in in_range if code == 0 and amount >= 0),
+        sum(1 for amount, code in in_range if code == 0 and amount < 0),
+    )
@@ -0,0 +1,68 @@
+"""Imports skip only the rows that are invalid and name them by file row"""
+
+import asyncio
+from bot.utils import process_excel_import, read_import_chunks
+from database.async_database import AsyncDatabase
+
+HEADER = "date,amount,category,description,running_balance,created_at\n"
+
+def write_csv(path, lines):
+    path.write_text(HEADER + "".join(line + "\n" for line in lines))
+    return str(path)
+
+def stored(database):
+    return [(row['description'], row['running_balance'])
+            for page in database.iter_transaction_pages(descending=False) for row in page]
+
+def run_import(path, database):
+    async def main():
+        db = AsyncDatabase(database)
+        await db.update_starting_balance(100)
+        return await process_excel_import(path, db), await process_excel_import(path, db)
+
+    return asyncio.run(main())
+
+def test_invalid_rows_are_skipped_alone(sqlite_backend, tmp_path):
+    path = write_csv(tmp_path / "import.csv", [
+        "2024-01-01T10:00:00,-5,Food,Lunch,95,",
+        "2024-01-02T10:00:00,-7,Bogus,Gift,88,",
+        "2024-01-03T10:00:00,-3,Transport,Taxi,85,",
+        "not a date,abc,Food,Snack,80,",
+        "2024-01-04T10:00:00,-1,Food,Coffee,84,2024-13-01",
+    ])
+    (success, message), (retry_success, retry_message) = run_import(path, sqlite_backend.for_user(1))
+
+    assert not success
+    assert "Imported 2 of 5 transactions" in message
+    assert message.index("row 3: invalid category Bogus") < message.index("row 5: invalid or missing date")
+    assert "row 6: invalid created_at" in message
+    assert stored(sqlite_backend.for_user(1)) == [("Lunch", 95.0), ("Taxi", 92.0)]
+
+    # Sending the file again lists the same rows and stores nothing twice
+    assert not retry_success
+    assert "an earlier attempt stored the first 2" in retry_message
+    assert "row 3: invalid category Bogus" in retry_message
+    assert len(stored(sqlite_backend.for_user(1))) == 2
+
+def test_chunks_are_stored_in_date_order(sqlite_backend, tmp_path):
+    # Newest first, like a /report file from before reports were sorted oldest first
+    path = write_csv(tmp_path / "import.csv", [
+        "2024-01-03T10:00:00,-3,Transport,Taxi,85,",
+        "2024-01-02T10:00:00,-2,Food,Snack,88,",
+        "2024-01-01T10:00:00,-5,Food,Lunch,90,",
+    ])
+    (success, _), _ = run_import(path, sqlite_backend.for_user(1))
+    assert success
+    assert stored(sqlite_backend.for_user(1)) == [("Lunch", 95.0), ("Snack", 93.0), ("Taxi", 90.0)]
+
+def test_rows_before_an_earlier_chunk_are_rejected(tmp_path):
+    path = write_csv(tmp_path / "import.csv", [
+        "2024-01-02T10:00:00,-2,Food,Snack,88,",
+        "2024-01-01T10:00:00,-5,Food,Lunch,90,",
+        "2024-01-03T10:00:00,-3,Transport,Taxi,85,",
+        "2024-01-01T12:00:00,-1,Food,Coffee,84,",
+    ])
+    chunks = list(read_import_chunks(path, chunk_size=2))
+    assert [[t['description'] for t in chunk['transactions']] for chunk in chunks] == [["Lunch", "Snack"], ["Taxi"]]
+    assert [chunk['rows'] for chunk in chunks] == [[3, 2], [4]]
+    assert chunks[1]['failures'] == [(5, 5, "dated before rows earlier in the file, sort the file oldest first")]
@@ -0,0 +1,46 @@
+import asyncio
+
+from config import JOB_REPORT_FORMAT
+from benchmarks.fakes import make_context, make_update
+from bot import handlers
+from bot.cache import responses
+from bot.jobs import precompute_monthly_summaries, prebuild_monthly_reports, previous_month
+from bot.ledger import month_bounds
+from bot.users import users
+
+USER_ID = 1
+
+async def prebuild_then_add():
+    await handlers.set_balance(make_update(USER_ID), make_context("100"))
+    state = await users.get(USER_ID)
+    year, month = previous_month()
+    start_date, end_date = month_bounds(year, month)
+    await state.db.record_transactions([
+        {"date": f"{start_date}T10:00:00+00:00", "amount": -5.0, "category": "Food", "description": "Lunch"},
+    ])
+    await state.sync_ledger()
+
+    await precompute_monthly_summaries()
+    await prebuild_monthly_reports()
+    summary = await handlers.build_monthly(state, month, year)
+    report = await handlers.build_report(state, JOB_REPORT_FORMAT, start_date, end_date)
+
+    # A transaction this month, then enough other responses to flush the LRU
+    await handlers.add(make_update(USER_ID), make_context("-3", "Transport", "Taxi"))
+    for index in range(responses.max_entries + 1):
+        responses.put(("filler", index), b"x")
+
+    hits = responses.hits
+    assert await handlers.build_monthly(state, month, year) is summary
+    assert await handlers.build_report(state, JOB_REPORT_FORMAT, start_date, end_date) is report
+    assert responses.hits == hits + 2
+
+    # A backdated change to that month is rebuilt
+    await state.db.record_transactions([
+        {"date": f"{start_date}T12:00:00+00:00", "amount": -2.0, "category": "Food", "description": "Snack"},
+    ])
+    await state.sync_ledger()
+    assert await handlers.build_monthly(state, month, year) != summary
+
+def test_prebuilt_outputs_survive_newer_adds_and_lru_eviction(sqlite_backend):
+    asyncio.run(prebuild_then_add())
@@ -0,0 +1,140 @@
+import asyncio
+import json
+
+from benchmarks.fakes import FakeDatabase, generate_transactions
+from database.async_database import AsyncDatabase
+from database.journal import TransactionJournal, WriteBehindQueue
+
+class FlakyDatabase:
+    """Stores each user's transactions, or raises the error set for the user"""
+
+    def __init__(self):
+        self.stored = {}
+        self.errors = {}
+
+    def for_user(self, user_id):
+        database = self
+
+        class UserDatabase:
+            async def record_transactions(self, transactions):
+                if user_id in database.errors:
+                    raise database.errors[user_id]
+                database.stored.setdefault(user_id, []).extend(transactions)
+                return transactions
+        return UserDatabase()
+
+def transaction(user_id, description):
+    return {"user_id": user_id, "description": description}
+
+def make_queue(tmp_path, database, batch_size=100):
+    journal = TransactionJournal(str(tmp_path / "transactions.journal"))
+    return WriteBehindQueue(database, journal, enabled=True, batch_size=batch_size,
+                            dead_letter_path=str(tmp_path / "transactions.dead"))
+
+def descriptions(transactions):
+    return [t['description'] for t in transactions]
+
+async def submit_and_flush(queue, transactions):
+    for t in transactions:
+        await queue.submit(t)
+    await queue.flush()
+
+def test_transient_error_holds_back_only_that_user(tmp_path):
+    database = FlakyDatabase()
+    database.errors[1] = ConnectionError("database unreachable")
+    queue = make_queue(tmp_path, database, batch_size=2)
+    asyncio.run(submit_and_flush(queue, [transaction(1, "a"), transaction(2, "b"),
+                                         transaction(1, "c"), transaction(2, "d"), transaction(2, "e")]))
+
+    assert descriptions(database.stored[2]) == ["b", "d", "e"]
+    assert descriptions(queue.pending_transactions()) == ["a", "c"]
+    assert descriptions(entry['transaction'] for entry in queue.journal.load()) == ["a", "c"]
+
+    del database.errors[1]
+    asyncio.run(queue.flush())
+    assert descriptions(database.stored[1]) == ["a", "c"]
+    assert queue.stats()['queue_depth'] == 0 and queue.stats()['dead_lettered'] == 0
+
+def test_permanent_error_moves_the_batch_to_the_dead_letter_file(tmp_path):
+    database = FlakyDatabase()
+    database.errors[1] = ValueError("Starting balance is not set")
+    queue = make_queue(tmp_path, database)
+    dead = []
+
+    async def on_dead_lettered(user_id, transactions):
+        dead.append((user_id, descriptions(transactions)))
+    queue.on_dead_lettered = on_dead_lettered
+    asyncio.run(submit_and_flush(queue, [transaction(1, "a"), transaction(2, "b"), transaction(1, "c")]))
+
+    assert descriptions(database.stored[2]) == ["b"]
+    assert dead == [(1, ["a", "c"])]
+    assert queue.stats()['queue_depth'] == 0 and queue.stats()['dead_lettered'] == 2
+    assert queue.journal.load() == []
+    with open(tmp_path / "transactions.dead", encoding='utf-8') as file:
+        letters = [json.loads(line) for line in file]
+    assert [letter['transaction']['description'] for letter in letters] == ["a", "c"]
+    assert {letter['error'] for letter in letters} == {"Starting balance is not set"}
+
+def count_lines(path):
+    with open(path, encoding='utf-8') as file:
+        return sum(1 for _ in file)
+
+def test_flushes_append_markers_until_the_journal_is_compacted(tmp_path):
+    database = FlakyDatabase()
+    queue = make_queue(tmp_path, database, batch_size=1)
+    queue.journal.compact_lines = 6
+    path = queue.journal.path
+
+    asyncio.run(submit_and_flush(queue, [transaction(1, "a"), transaction(1, "b")]))
+    # Two entries and a flushed marker after each
+    assert count_lines(path) == 4
+    assert queue.journal.load() == []
+
+    asyncio.run(submit_and_flush(queue, [transaction(1, "c")]))
+    # The sixth obsolete line triggered a compaction
+    assert count_lines(path) == 0
+    assert descriptions(database.stored[1]) == ["a", "b", "c"]
+
+def test_sequence_numbers_continue_after_flushed_entries(tmp_path):
+    database = FlakyDatabase()
+    queue = make_queue(tmp_path, database)
+    asyncio.run(submit_and_flush(queue, [transaction(1, "a"), transaction(1, "b")]))
+    queue.journal.close()
+
+    # The flushed markers are still in the journal, a new entry must not match them
+    restarted = make_queue(tmp_path, database)
+    async def restart_and_submit():
+        await restarted.start()
+        await restarted.submit(transaction(1, "c"))
+    asyncio.run(restart_and_submit())
+    restarted.journal.close()
+
+    assert descriptions(entry['transaction'] for entry in make_queue(tmp_path, database).journal.load()) == ["c"]
+
+def test_replay_after_a_crash_stores_every_transaction_once(tmp_path):
+    fake = FakeDatabase(starting_balance=100)
+    database = AsyncDatabase(fake)
+    transactions = [{**t, "user_id": 1} for t in generate_transactions(8, seed=12)]
+    queue = make_queue(tmp_path, database)
+    asyncio.run(submit_and_flush(queue, transactions[:5]))
+
+    async def submit(batch):
+        for t in batch:
+            await queue.submit(t)
+    asyncio.run(submit(transactions[5:]))
+    # The last batch reached the database but the process died before its
+    # flushed marker, halfway through writing another entry
+    fake.record_transactions(transactions[5:])
+    queue.journal.close()
+    with open(queue.journal.path, 'a', encoding='utf-8') as file:
+        file.write('{"seq": 9, "queued_at": 1, "transa')
+
+    restarted = make_queue(tmp_path, database)
+    async def replay():
+        await restarted.start()
+        await restarted.stop()
+    asyncio.run(replay())
+
+    assert descriptions(fake.rows) == descriptions(transactions)
+    assert fake.balance == round(100 + sum(t['amount'] for t in transactions), 2)
+    assert restarted.journal.load() == []
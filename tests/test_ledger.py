@@ -0,0 +1,43 @@
+import asyncio
+import random
+
+from benchmarks.fakes import FakeDatabase, generate_transactions
+from bot.ledger import LedgerCache
+from database.async_database import AsyncDatabase
+
+def without_hash(rows):
+    return [{key: value for key, value in row.items() if key != 'content_hash'} for row in rows]
+
+async def load(database):
+    ledger = LedgerCache()
+    await ledger.load(database)
+    return ledger
+
+async def grow_incrementally():
+    history = generate_transactions(400, seed=3)
+    fake = FakeDatabase(history[:200], starting_balance=100)
+    database = AsyncDatabase(fake).for_user(1)
+    ledger = await load(database)
+
+    # /add rows are appended right after they are stored
+    for transaction in history[200:250]:
+        for row in await database.record_transactions([transaction]):
+            ledger.append(row)
+    # An import stores rows, some backdated, and the ledger syncs them in
+    imported = history[250:] + generate_transactions(100, seed=4)
+    random.Random(5).shuffle(imported)
+    stored = await database.record_transactions(imported)
+    new_rows = await ledger.sync(database)
+    # Nothing new since, nothing pulled twice
+    assert await ledger.sync(database) == []
+
+    return ledger, await load(database), stored, new_rows
+
+def test_append_and_sync_match_a_full_load():
+    ledger, reloaded, stored, new_rows = asyncio.run(grow_incrementally())
+    assert sorted(row['id'] for row in new_rows) == sorted(row['id'] for row in stored)
+    assert len(ledger) == len(reloaded) == 500
+    assert ledger.last_id == reloaded.last_id
+    for name in ('id', 'date', 'amount', 'running_balance', 'created_at', 'category'):
+        assert (ledger.column(name) == reloaded.column(name)).all(), name
+    assert without_hash(ledger.between(None, None)) == without_hash(reloaded.between(None, None))
@@ -0,0 +1,21 @@
+import logging
+
+from benchmarks.fakes import FakeDatabase, generate_transactions
+from bot import metrics as metrics_module
+from bot.metrics import InstrumentedBackend, _describe
+
+def test_slow_query_log_names_method_rows_and_user(monkeypatch, caplog):
+    monkeypatch.setattr(metrics_module, "SLOW_QUERY_MS", 0)
+    backend = InstrumentedBackend(FakeDatabase([], 100)).for_user(7)
+    batch = generate_transactions(50, seed=1)
+    with caplog.at_level(logging.WARNING, logger="bot.metrics"):
+        backend.record_transactions(batch)
+    message = caplog.records[-1].getMessage()
+    assert message.startswith("Slow query: record_transactions took ")
+    assert message.endswith("(rows=50, user=7)")
+    assert batch[0]['description'] not in message
+
+def test_payload_is_estimated_from_the_first_row():
+    rows = [{'description': "x" * 10}] * 1000
+    assert _describe(rows) == (1000, 1000 * len('{"description": "xxxxxxxxxx"}'))
+    assert _describe([]) == (0, 0)
@@ -0,0 +1,69 @@
+"""Re-importing a /report file must not store its transactions again"""
+
+import asyncio
+from types import SimpleNamespace
+from benchmarks.fakes import make_context, make_update
+import bot.handlers as handlers
+from bot.users import users
+
+USER_ID = 1
+OTHER_USER_ID = 2
+
+def document_bot(content):
+    """Bot whose get_file() serves content, like a document sent to the bot"""
+    async def download_to_drive(path):
+        with open(path, "wb") as file:
+            file.write(content)
+
+    async def get_file(file_id):
+        return SimpleNamespace(download_to_drive=download_to_drive)
+
+    return SimpleNamespace(get_file=get_file)
+
+async def export_and_reimport(fmt):
+    await handlers.set_balance(make_update(USER_ID), make_context("100"))
+    for amount, category, description in (("-5", "Food", "Lunch"), ("-7.5", "Transport", "Taxi"),
+                                          ("250", "Income", "Refund")):
+        await handlers.add(make_update(USER_ID), make_context(amount, category, description))
+    state = await users.get(USER_ID)
+    balance, rows = state.current_balance, len(state.ledger)
+
+    update = make_update(USER_ID)
+    await handlers.report(update, make_context(fmt))
+    content = update.message.replies[-1]
+
+    document = SimpleNamespace(file_id="report", file_name=f"budget_tracker.{fmt}")
+    update = make_update(USER_ID, document=document)
+    await handlers.import_excel(update, make_context(bot=document_bot(content)))
+    return update.message.replies, (balance, rows), (state.current_balance, len(state.ledger))
+
+def test_reimported_csv_report_is_not_stored_again(sqlite_backend):
+    replies, before, after = asyncio.run(export_and_reimport("csv"))
+    assert after == before == (337.5, 3)
+    assert replies[-1].endswith("skipped 3 already recorded"), replies
+
+def test_reimported_xlsx_report_is_not_stored_again(sqlite_backend):
+    _, before, after = asyncio.run(export_and_reimport("xlsx"))
+    assert after == before == (337.5, 3)
+
+async def export_into_new_account():
+    await handlers.set_balance(make_update(USER_ID), make_context("100"))
+    for amount, description in (("-5", "Lunch"), ("-7.5", "Taxi"), ("250", "Refund")):
+        category = "Income" if amount[0] != "-" else "Food"
+        await handlers.add(make_update(USER_ID), make_context(amount, category, description))
+    update = make_update(USER_ID)
+    await handlers.report(update, make_context("csv"))
+
+    await handlers.set_balance(make_update(OTHER_USER_ID), make_context("100"))
+    document = SimpleNamespace(file_id="report", file_name="budget_tracker.csv")
+    await handlers.import_excel(make_update(OTHER_USER_ID, document=document),
+                                make_context(bot=document_bot(update.message.replies[-1])))
+    rows = []
+    for user_id in (USER_ID, OTHER_USER_ID):
+        ledger = (await users.get(user_id)).ledger
+        rows.append([(row['description'], row['running_balance']) for row in ledger.between(None, None)])
+    return rows
+
+def test_report_imported_into_new_account_keeps_running_balances(sqlite_backend):
+    original, imported = asyncio.run(export_into_new_account())
+    assert imported == original == [("Lunch", 95.0), ("Taxi", 87.5), ("Refund", 337.5)]
@@ -0,0 +1,43 @@
+from collections import defaultdict
+
+from benchmarks.fakes import generate_transactions
+
+def rollups(database, months):
+    return {
+        (year, month, row['category']): (round(row['total'], 2), row['count'])
+        for year, month in months for row in map(dict, database.get_monthly_rollup(year, month))
+    }
+
+def summed_from_rows(database):
+    totals = defaultdict(lambda: [0.0, 0])
+    for page in database.iter_transactions_after():
+        for row in page:
+            if row['amount'] < 0:
+                key = (int(row['date'][:4]), int(row['date'][5:7]), row['category'])
+                totals[key][0] += row['amount']
+                totals[key][1] += 1
+    return {key: (round(total, 2), count) for key, (total, count) in totals.items()}
+
+def test_rollups_match_the_stored_rows(sqlite_backend):
+    database, other = sqlite_backend.for_user(1), sqlite_backend.for_user(2)
+    for user in (database, other):
+        user.update_starting_balance(1000)
+    transactions = generate_transactions(600, seed=6)
+
+    for transaction in transactions[:100]:
+        database.record_transactions([transaction])
+    # Replayed rows are skipped and must not be counted again
+    database.record_transactions(transactions[:50])
+    # The second batch fails on its last row and is rolled back whole
+    failing = transactions[200:299] + [{**transactions[299], "amount": "not a number"}]
+    results = list(database.bulk_insert_transactions(transactions[100:200] + failing, batch_size=100))
+    assert [error is None for *_, error in results] == [True, False]
+    list(database.bulk_insert_transactions(transactions[300:], batch_size=100))
+    other.record_transactions(transactions[:10])
+
+    expected = summed_from_rows(database)
+    months = {(year, month) for year, month, _ in expected}
+    assert rollups(database, months) == expected
+    assert sum(count for _, count in expected.values()) == sum(
+        1 for t in transactions[:200] + transactions[300:] if t['amount'] < 0)
+    assert rollups(other, months) == summed_from_rows(other)
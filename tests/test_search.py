@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+
+from bot.search import SearchIndex, tokenize
+
+WORDS = ["coffee", "lunch", "taxi", "rent", "gift", "book", "bus", "pizza"]
+
+def random_rows(rng, descriptions, count, first_id):
+    rows = []
+    for offset in range(count):
+        # New descriptions keep appearing, as they do after /add and imports
+        if rng.random() < 0.2 or not descriptions:
+            descriptions.append(" ".join(rng.sample(WORDS, rng.randint(1, 3))) + f" {len(descriptions)}")
+        rows.append((rng.randrange(len(descriptions)), rng.randrange(10**12), first_id + offset, rng.randrange(4)))
+    return rows
+
+def columns(rows):
+    codes, dates, ids, categories = zip(*rows)
+    return (np.array(codes, dtype=np.int64), np.array(dates, dtype=np.int64), np.array(ids, dtype=np.int64),
+            np.array(categories, dtype=np.uint8))
+
+def rebuilt(descriptions, rows):
+    index = SearchIndex(descriptions)
+    index.rebuild(*columns(sorted(rows, key=lambda row: (row[1], row[2]))))
+    return index
+
+def results(index, terms, **kwargs):
+    dates, ids = index.search(terms, **kwargs)
+    return list(zip(dates.tolist(), ids.tolist()))
+
+def test_pending_and_merged_rows_match_a_rebuild():
+    rng = random.Random(15)
+    descriptions = []
+    rows = random_rows(rng, descriptions, 300, 1)
+    index = rebuilt(descriptions, rows)
+    for _ in range(4):
+        batch = random_rows(rng, descriptions, 50, len(rows) + 1)
+        index.extend(*columns(batch))
+        rows += batch
+    expected = rebuilt(descriptions, rows)
+
+    queries = [(["coffee"], {}), (["taxi", "bus"], {}), (["lunch", "pizza"], {"category": 2}),
+               (["gift"], {"start": 10**11, "end": 6 * 10**11})]
+    for terms, kwargs in queries:
+        assert results(index, terms, **kwargs) == results(expected, terms, **kwargs)
+
+    index._merge()
+    for name in ("_offsets", "_dates", "_ids", "_categories"):
+        assert (getattr(index, name) == getattr(expected, name)).all(), name
+    for terms, kwargs in queries:
+        assert results(index, terms, **kwargs) == results(expected, terms, **kwargs)
+
+def test_search_finds_every_row_containing_a_term():
+    rng = random.Random(16)
+    descriptions = []
+    rows = random_rows(rng, descriptions, 200, 1)
+    index = rebuilt(descriptions, rows[:120])
+    index.extend(*columns(rows[120:]))
+
+    found = {row_id for _, row_id in results(index, ["rent", "book"])}
+    assert found == {row_id for code, _, row_id, _ in rows if tokenize(descriptions[code]) & {"rent", "book"}}
@@ -0,0 +1,106 @@
+import random
+import sqlite3
+import threading
+
+from benchmarks.fakes import generate_transactions
+from database.sqlite import SQLiteDatabase
+
+SINGLE_USER_SCHEMA = """
+CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT, updated_at TEXT DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, amount REAL NOT NULL, category TEXT NOT NULL,
+    description TEXT, running_balance REAL NOT NULL, created_at TEXT
+);
+CREATE TABLE balance_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id INTEGER NOT NULL, balance REAL NOT NULL, taken_at TEXT
+);
+CREATE TABLE monthly_rollups (
+    year INTEGER NOT NULL, month INTEGER NOT NULL, category TEXT NOT NULL,
+    total REAL NOT NULL DEFAULT 0, count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (year, month, category)
+);
+"""
+
+def paged(database, **kwargs):
+    return [row['id'] for page in database.iter_transaction_pages(page_size=40, **kwargs) for row in page]
+
+def test_keyset_pages_match_a_full_sort(sqlite_backend):
+    database = sqlite_backend.for_user(1)
+    database.update_starting_balance(0)
+    transactions = generate_transactions(250, seed=7)
+    # Shared dates make the id tiebreak matter
+    transactions += [{**t, 'description': "again"} for t in transactions[::10]]
+    random.Random(8).shuffle(transactions)
+    database.record_transactions(transactions)
+    rows = [row for page in database.iter_transactions_after() for row in page]
+    ordered = sorted(rows, key=lambda row: (row['date'], row['id']))
+
+    start_date, end_date = ordered[60]['date'][:10], ordered[200]['date'][:10]
+    in_range = [row for row in ordered if start_date <= row['date'] < end_date]
+    assert paged(database, descending=False) == [row['id'] for row in ordered]
+    assert paged(database) == [row['id'] for row in reversed(ordered)]
+    assert paged(database, start_date=start_date, end_date=end_date) == [row['id'] for row in reversed(in_range)]
+    assert paged(database, descending=False, expenses_only=True) == [
+        row['id'] for row in ordered if row['amount'] < 0]
+
+def test_balances_advance_once_per_stored_row(sqlite_backend):
+    database, other = sqlite_backend.for_user(1), sqlite_backend.for_user(2)
+    database.update_starting_balance(100)
+    other.update_starting_balance(5)
+    transactions = generate_transactions(30, seed=9)
+
+    stored = database.record_transactions(transactions)
+    balance = 100
+    for row in stored:
+        balance = round(balance + row['amount'], 2)
+        assert row['running_balance'] == balance
+    assert database.get_latest_balance() == balance
+
+    # A replayed batch is skipped whole and leaves the balance alone
+    assert database.record_transactions(transactions) == []
+    assert database.get_latest_balance() == balance
+    # Per-user hashes: the same rows are new to another user
+    assert len(other.record_transactions(transactions)) == 30
+    assert database.get_latest_balance() == balance
+
+def test_concurrent_writers_apply_one_after_another(sqlite_backend):
+    database = sqlite_backend.for_user(1)
+    database.update_starting_balance(0)
+    transactions = generate_transactions(200, seed=10)
+
+    def write(part):
+        for transaction in part:
+            database.record_transactions([transaction])
+    threads = [threading.Thread(target=write, args=(transactions[i::4],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rows = sorted((row for page in database.iter_transactions_after() for row in page), key=lambda row: row['id'])
+    assert len(rows) == 200
+    balance = 0
+    for row in rows:
+        balance = round(balance + row['amount'], 2)
+        assert row['running_balance'] == balance
+    assert database.get_latest_balance() == balance
+
+def test_single_user_database_is_migrated(tmp_path):
+    path = str(tmp_path / "budget_tracker.db")
+    transactions = generate_transactions(20, seed=11)
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SINGLE_USER_SCHEMA)
+        conn.execute("INSERT INTO settings (key, value) VALUES ('starting_balance', '50')")
+        conn.executemany(
+            "INSERT INTO transactions (date, amount, category, description, running_balance, created_at) "
+            "VALUES (:date, :amount, :category, :description, :running_balance, :created_at)",
+            transactions
+        )
+    conn.close()
+
+    database = SQLiteDatabase(path).for_user(1)
+    assert database.get_starting_balance() == 50
+    assert database.get_latest_balance() == transactions[-1]['running_balance']
+    assert [row['description'] for page in database.iter_transactions_after() for row in page] == [
+        t['description'] for t in transactions]
+    # Migrated rows got content hashes, importing them again stores nothing
+    assert database.record_transactions(transactions) == []
@@ -0,0 +1,38 @@
+"""Per-chat ordering must not cost other chats their concurrency slots"""
+
+import asyncio
+import time
+from datetime import datetime
+from telegram import Chat, Message, Update
+from bot.updates import ChatOrderedUpdateProcessor
+
+def chat_update(update_id, chat_id):
+    return Update(update_id, message=Message(update_id, datetime.now(), Chat(chat_id, Chat.PRIVATE)))
+
+async def finish_times(updates, limit):
+    """Seconds until each (update, duration) finished, processed with a limit"""
+    processor = ChatOrderedUpdateProcessor(limit)
+    started = time.perf_counter()
+    finished = {}
+
+    async def handle(update_id, duration):
+        await asyncio.sleep(duration)
+        finished[update_id] = time.perf_counter() - started
+
+    await asyncio.gather(*(
+        processor.process_update(update, handle(update.update_id, duration)) for update, duration in updates
+    ))
+    return finished
+
+def test_busy_chat_does_not_delay_other_chats():
+    updates = [(chat_update(update_id, 1), 0.5) for update_id in range(3)] + [(chat_update(9, 2), 0)]
+    finished = asyncio.run(finish_times(updates, limit=2))
+    assert finished[9] < 0.2
+    # Chat 1 still runs one update at a time, in order
+    assert finished[0] < finished[1] < finished[2]
+    assert finished[2] >= 1.5
+
+def test_concurrency_limit_applies_across_chats():
+    updates = [(chat_update(chat_id, chat_id), 0.5) for chat_id in range(1, 4)]
+    finished = asyncio.run(finish_times(updates, limit=2))
+    assert sorted(finished.values())[-1] >= 1.0
@@ -0,0 +1,38 @@
+"""A task killed for overrunning must not take other tasks down with it"""
+
+import asyncio
+import time
+import pytest
+from bot.workers import WorkerPool, WorkerTimeoutError
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+def count_after(delay, n):
+    time.sleep(delay)
+    yield from range(n)
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(max_workers=3, timeout=10)
+    yield pool
+    pool.close()
+
+async def overrun_next_to(pool, other):
+    # Start the workers first so both tasks run at the same time
+    await pool.run(sleep_for, 0)
+    return await asyncio.gather(pool.run(sleep_for, 5, timeout=1), other, return_exceptions=True)
+
+def test_timeout_does_not_fail_concurrent_task(pool):
+    timed_out, result = asyncio.run(overrun_next_to(pool, pool.run(sleep_for, 2)))
+    assert isinstance(timed_out, WorkerTimeoutError)
+    assert result == 2
+
+def test_timeout_does_not_fail_concurrent_stream(pool):
+    async def collect():
+        return [item async for item in pool.stream(count_after, 2, 3)]
+
+    timed_out, result = asyncio.run(overrun_next_to(pool, collect()))
+    assert isinstance(timed_out, WorkerTimeoutError)
+    assert result == [0, 1, 2]